@@ -1,8 +1,40 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.utils.functional import cached_property
 
+from .caching import bump_catalog_version
+from .changes import set_shop_state
+from .events import change_order_state
 from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ExportJob, ProductInfoChange, ProductOffers, Webhook, ShopCategory, STATE_CHOICES
+from .tasks import send_bulk_email
+
+# сколько получателей уведомлений передается в одну задачу Celery
+NOTIFICATION_BATCH_SIZE = 100
+
+# начиная с этого количества строк точный COUNT(*) заменяется оценкой планировщика PostgreSQL
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: для нефильтрованного списка берет оценку числа строк из pg_class
+    вместо COUNT(*), который на миллионах строк выполняет полный проход по таблице.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                               [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
 
 
 @admin.register(User)
@@ -25,12 +57,61 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления магазинами. Статус меняется через set_shop_state, чтобы предложения магазина
+    сразу появлялись в каталоге или исчезали из него.
+    """
+    list_display = ('id', 'name', 'user', 'state')
+    list_select_related = ('user',)
+    list_filter = ('state',)
+    search_fields = ('name',)
+    raw_id_fields = ('user',)
+    actions = ('make_enabled', 'make_disabled')
+
+    def change_state(self, request, queryset, state):
+        with transaction.atomic():
+            changed = set_shop_state(queryset.values('id'), state)
+        if changed:
+            bump_catalog_version()
+        self.message_user(request, f'Обновлено магазинов: {len(changed)}')
+
+    @admin.action(description='Включить прием заказов')
+    def make_enabled(self, request, queryset):
+        self.change_state(request, queryset, True)
+
+    @admin.action(description='Отключить прием заказов')
+    def make_disabled(self, request, queryset):
+        self.change_state(request, queryset, False)
+
+    def save_model(self, request, obj, form, change):
+        if not change or 'state' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            obj.save(update_fields=[name for name in form.changed_data if name != 'state'])
+            set_shop_state([obj.id], obj.state)
+        bump_catalog_version()
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления деревом категорий
+    """
+    list_display = ('id', 'name', 'parent', 'product_count', 'offer_count')
+    list_select_related = ('parent',)
+    search_fields = ('name',)
+    autocomplete_fields = ('parent',)
+    ordering = ('path',)
+
+
+@admin.register(ShopCategory)
+class ShopCategoryAdmin(admin.ModelAdmin):
+    """
+    Панель управления соответствием категорий прайсов магазинов категориям каталога
+    """
+    list_display = ('id', 'shop', 'external_id', 'category')
+    list_select_related = ('shop', 'category')
+    autocomplete_fields = ('shop', 'category')
 
 
 @admin.register(Product)
@@ -40,27 +121,101 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления предложениями магазинов
+    """
+    list_display = ('id', 'product', 'shop', 'model', 'external_id', 'price', 'quantity')
+    list_select_related = ('product', 'shop')
+    list_filter = ('shop',)
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('shop',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('id', 'name', 'key', 'value_type')
+    list_filter = ('value_type',)
+    search_fields = ('name', 'key')
 
 
 @admin.register(ProductParameter)
 class ProductParameterAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления значениями характеристик товаров
+    """
+    list_display = ('id', 'product_info', 'parameter', 'value')
+    list_select_related = ('product_info', 'parameter')
+    list_filter = ('parameter',)
+    raw_id_fields = ('product_info',)
+    autocomplete_fields = ('parameter',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления заказами с массовой сменой статуса и уведомлением покупателей
+    """
+    list_display = ('id', 'user', 'dt', 'state', 'contact')
+    list_select_related = ('user', 'contact')
+    list_filter = ('state',)
+    raw_id_fields = ('user', 'contact')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('make_confirmed', 'make_assembled', 'make_sent', 'make_delivered')
+
+    def change_state(self, request, queryset, state):
+        """
+        Переводит выбранные заказы в статус state тем же способом, что и API (change_order_state),
+        и ставит уведомления покупателям в очередь пачками. Заказы, для которых переход недопустим
+        (корзины, отмененные, уже доставленные), не меняются и перечисляются в сообщении.
+        """
+        with transaction.atomic():
+            changed, rejected = change_order_state(queryset.values('id'), state)
+            orders = Order.objects.filter(id__in=changed).order_by()
+            emails = list(orders.values_list('user__email', flat=True).distinct())
+
+        message = f'Статус заказа изменен: {dict(STATE_CHOICES)[state]}'
+        for start in range(0, len(emails), NOTIFICATION_BATCH_SIZE):
+            send_bulk_email.delay('Обновление статуса заказа', message,
+                                  emails[start:start + NOTIFICATION_BATCH_SIZE])
+
+        self.message_user(request, f'Обновлено заказов: {len(changed)}')
+        if rejected:
+            self.message_user(request, f'Статус не изменен у заказов: {", ".join(map(str, sorted(rejected)))}',
+                              messages.WARNING)
+
+    @admin.action(description='Подтвердить выбранные заказы')
+    def make_confirmed(self, request, queryset):
+        self.change_state(request, queryset, 'confirmed')
+
+    @admin.action(description='Отметить выбранные заказы как собранные')
+    def make_assembled(self, request, queryset):
+        self.change_state(request, queryset, 'assembled')
+
+    @admin.action(description='Отметить выбранные заказы как отправленные')
+    def make_sent(self, request, queryset):
+        self.change_state(request, queryset, 'sent')
+
+    @admin.action(description='Отметить выбранные заказы как доставленные')
+    def make_delivered(self, request, queryset):
+        self.change_state(request, queryset, 'delivered')
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    pass
+    """
+    Панель управления позициями заказов
+    """
+    list_display = ('id', 'order', 'product_info', 'quantity')
+    list_select_related = ('order', 'product_info')
+    list_filter = ('order__state',)
+    raw_id_fields = ('order', 'product_info')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Contact)
@@ -71,3 +226,44 @@ class ContactAdmin(admin.ModelAdmin):
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'key', 'created_at',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'file_format', 'compression', 'status', 'rows', 'total_rows', 'created_at',)
+    list_select_related = ('user',)
+    list_filter = ('status', 'kind',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(ProductInfoChange)
+class ProductInfoChangeAdmin(admin.ModelAdmin):
+    """
+    Просмотр журнала изменений предложений
+    """
+    list_display = ('seq', 'product_info_id', 'shop', 'action', 'dt',)
+    list_select_related = ('shop',)
+    list_filter = ('action',)
+    raw_id_fields = ('shop',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(ProductOffers)
+class ProductOffersAdmin(admin.ModelAdmin):
+    """
+    Просмотр сводок предложений продуктов
+    """
+    list_display = ('product', 'min_price', 'best_offer', 'shop_count', 'quantity', 'updated_at',)
+    list_select_related = ('product',)
+    raw_id_fields = ('product', 'best_offer')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Webhook)
+class WebhookAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'url', 'is_active', 'last_seq', 'failures', 'last_status', 'last_latency_ms',)
+    list_select_related = ('user',)
+    list_filter = ('is_active',)
+    raw_id_fields = ('user',)
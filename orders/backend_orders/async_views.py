@@ -0,0 +1,215 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.authtoken.models import Token
+
+from .caching import acatalog_version, catalog_key, catalog_timeout
+from .compression import choose_encoding, compress, min_size
+from .events import MAX_WAIT_TIMEOUT, alatest_seq, await_events
+from .filters import CatalogQuery
+from .metrics import acache_get
+from .models import Category, ProductInfo, Order
+from .projections import aload_products, aload_product_page, aload_orders
+from .renderers import JsonResponse, dumps
+
+# сколько товаров отдается и кэшируется одной страницей асинхронного списка
+PRODUCTS_PAGE_SIZE = 1000
+
+
+async def get_token_user(key):
+    """
+    Возвращает активного пользователя по ключу токена или None.
+    """
+    token = await Token.objects.select_related('user').filter(key=key).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+async def get_user(request):
+    """
+    Возвращает пользователя запроса: по заголовку Authorization: Token <ключ> или по сессии.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Token '):
+        return await get_token_user(header[6:].strip())
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+def json_response(content, status=200, encoding=None, next_url=None):
+    """
+    Возвращает ответ с уже сериализованным JSON.
+
+    :param encoding: кодировка, которой содержимое уже сжато; такой ответ CompressionMiddleware не трогает
+    :param next_url: адрес следующей страницы для заголовка Link
+    """
+    response = HttpResponse(content, content_type='application/json', status=status)
+    if encoding:
+        response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+    if next_url:
+        response['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+
+class AsyncProductList(View):
+    """
+    Асинхронный список товаров для развертывания через ASGI. Ответ совпадает с /product, но отдается
+    страницами по PRODUCTS_PAGE_SIZE товаров (offset и limit, адрес следующей страницы - в заголовке Link).
+    Каждая страница кэшируется до следующего изменения каталога вместе со сжатыми вариантами,
+    чтобы не сжимать одни и те же байты на каждый запрос; размер записи кэша ограничен размером страницы.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Получить список товаров магазинов, принимающих заказы
+
+        Args:
+            request: Запрос с необязательными параметрами shop_id, category_id, sort, фильтрами
+                по характеристикам parameter_<id>, offset и limit (не больше PRODUCTS_PAGE_SIZE)
+
+        Returns:
+            HttpResponse: JSON со страницей списка товаров
+        """
+        shop_id = request.GET.get('shop_id', '')
+        category_id = request.GET.get('category_id', '')
+        offset = request.GET.get('offset', '0')
+        limit = request.GET.get('limit', str(PRODUCTS_PAGE_SIZE))
+        try:
+            if not shop_id.isdigit() and shop_id or not category_id.isdigit() and category_id:
+                raise ValueError(shop_id or category_id)
+            if not offset.isdigit() or not limit.isdigit() or not int(limit):
+                raise ValueError(offset, limit)
+            offset, limit = int(offset), min(int(limit), PRODUCTS_PAGE_SIZE)
+            catalog = CatalogQuery(request.GET)
+            await catalog.aload_types()
+            condition, ordering = catalog.condition(), catalog.ordering()
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+
+        key = catalog_key(await acatalog_version(), 'products', shop_id, category_id, catalog.cache_key(),
+                          offset, limit)
+        params = request.GET.copy()
+        params['offset'] = offset + limit
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+        # в кэше вместе с содержимым хранится признак следующей страницы
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding:
+            cached = await acache_get(f'{key}:{encoding}')
+            if cached is not None:
+                compressed, has_more = cached
+                return json_response(compressed, encoding=encoding, next_url=next_url if has_more else None)
+
+        cached = await acache_get(key)
+        if cached is not None:
+            content, has_more = cached
+        else:
+            query = Q(is_visible=True) & condition
+            if shop_id:
+                query &= Q(shop_id=shop_id)
+            if category_id:
+                # товары категории и всех вложенных в нее
+                path = await Category.objects.filter(id=category_id).values_list('path', flat=True).afirst()
+                query &= Category.subtree_query(path, 'product__category__path') if path else Q(pk__in=[])
+            products, has_more = await aload_product_page(ProductInfo.objects.filter(query), ordering, offset, limit)
+            content = dumps(products)
+            await cache.aset(key, (content, has_more), catalog_timeout())
+
+        next_url = next_url if has_more else None
+        if encoding and len(content) >= min_size():
+            compressed = compress(content.encode(), encoding)
+            await cache.aset(f'{key}:{encoding}', (compressed, has_more), catalog_timeout())
+            return json_response(compressed, encoding=encoding, next_url=next_url)
+        return json_response(content, next_url=next_url)
+
+
+class AsyncProductDetail(View):
+    """
+    Асинхронная карточка товара.
+    """
+
+    async def get(self, request, pk, *args, **kwargs):
+        products = await aload_products(ProductInfo.objects.filter(id=pk, is_visible=True))
+        if not products:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return json_response(dumps(products[0]))
+
+
+class AsyncBasketView(View):
+    """
+    Асинхронное получение корзины пользователя.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user = await get_user(request)
+        if user is None:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        orders = Order.objects.filter(user_id=user.id, state='basket')
+        return json_response(dumps(await aload_orders(orders)))
+
+
+class AsyncOrderView(View):
+    """
+    Асинхронное получение заказов пользователя.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user = await get_user(request)
+        if user is None:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        orders = Order.objects.filter(user_id=user.id).exclude(state='basket')
+        return json_response(dumps(await aload_orders(orders)))
+
+
+class AsyncPartnerOrders(View):
+    """
+    Асинхронное получение заказов с товарами поставщика.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user = await get_user(request)
+        if user is None:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+        orders = Order.objects.filter(
+            ordered_items__product_info__shop__user_id=user.id).exclude(state='basket').distinct()
+        own_items = Q(product_info__shop__user_id=user.id)
+        return json_response(dumps(await aload_orders(orders, own_items)))
+
+
+class AsyncOrderEvents(View):
+    """
+    Long-poll смены статусов заказов: запрос ждет новых событий пользователя вместо периодического
+    опроса /order и /partner/orders. Покупатель получает события своих заказов, поставщик - заказов
+    со своими товарами.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Дождаться событий после курсора
+
+        Args:
+            request: Запрос с параметрами since (курсор из предыдущего ответа) и timeout (секунды ожидания,
+                по умолчанию 25). Без since сразу возвращается текущий курсор.
+
+        Returns:
+            HttpResponse: JSON с новым курсором и событиями {seq, order, state}
+        """
+        user = await get_user(request)
+        if user is None:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        since = request.GET.get('since')
+        timeout = request.GET.get('timeout', '25')
+        if since is not None and not since.isdigit() or not timeout.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+        if since is None:
+            return JsonResponse({'cursor': await alatest_seq(user.id), 'events': []})
+
+        since = int(since)
+        events = await await_events(user.id, since, min(int(timeout), MAX_WAIT_TIMEOUT))
+        return JsonResponse({'cursor': events[-1]['seq'] if events else since, 'events': events})
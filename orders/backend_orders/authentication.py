@@ -0,0 +1,20 @@
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def resolve_user(request):
+    """
+    Возвращает пользователя запроса для кода вне представлений DRF (middleware, обычные представления
+    Django): пользователя сессии, а без него - владельца токена из заголовка Authorization: Token <ключ>,
+    которым пользуется API. Обращается к базе, поэтому из асинхронного кода вызывается через sync_to_async.
+
+    :return: пользователь или None, если запрос анонимный или токен неверный
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
@@ -0,0 +1,417 @@
+import gc
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, transaction, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, get_resolver
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .categories import recount_categories
+from .exports import write_export
+from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
+    Contact, ConfirmEmailToken, ExportJob, ProductInfoChange, OrderEvent
+from .offers import refresh_offers
+from .parameters import NUMBER, parameter_key
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'bench_baseline.json'
+
+# размер набора данных, на котором снят эталон
+DEFAULT_SCALE = {
+    'shops': 3,
+    'offers': 20,
+    'parameters': 4,
+    'orders': 5,
+}
+
+# допустимые отклонения от эталона
+DEFAULT_THRESHOLDS = {
+    # на сколько запросов может вырасти число SQL-запросов
+    'queries': 0,
+    # во сколько раз может вырасти p95 задержки
+    'p95_ratio': 3.0,
+    # абсолютный запас по задержке в миллисекундах, чтобы не реагировать на шум на быстрых запросах
+    'p95_slack_ms': 5.0,
+    # во сколько раз может вырасти пиковая память
+    'memory_ratio': 2.0,
+}
+
+PRICE_LIST_TEMPLATE = """shop: {shop}
+categories:
+  - id: {category}
+    name: Смартфоны
+goods:
+  - id: 1
+    category: {category}
+    model: apple/iphone/xr
+    name: Смартфон Apple iPhone XR 256GB
+    price: 65000
+    price_rrc: 69990
+    quantity: 9
+    parameters:
+      "Цвет": красный
+"""
+
+
+def seed_dataset(shops, offers, parameters, orders):
+    """
+    Создает синтетический набор данных: магазины с предложениями и характеристиками, покупателя
+    с контактом, корзиной и историей заказов.
+
+    :param shops: количество магазинов
+    :param offers: количество предложений в каждом магазине
+    :param parameters: количество характеристик у каждого предложения
+    :param orders: количество оформленных заказов покупателя
+    :return: словарь с объектами, которые используются в сценариях замеров
+    """
+    partners = User.objects.bulk_create(
+        User(email=f'partner{i}@example.com', username=f'partner{i}', type='shop', is_active=True)
+        for i in range(shops))
+    shop_objects = Shop.objects.bulk_create(Shop(name=f'Магазин {i}', user=partner)
+                                            for i, partner in enumerate(partners))
+    category = Category.objects.create(name='Смартфоны')
+    category.shops.add(*shop_objects)
+    parameter_names = [f'Параметр {i}' for i in range(parameters)]
+    parameter_objects = Parameter.objects.bulk_create(Parameter(name=name, key=parameter_key(name), value_type=NUMBER)
+                                                      for name in parameter_names)
+
+    products = Product.objects.bulk_create(Product(name=f'Товар {i}', category=category)
+                                           for i in range(shops * offers))
+    product_infos = ProductInfo.objects.bulk_create(
+        ProductInfo(product=product, shop=shop_objects[i % shops], external_id=i, model=f'model/{i}',
+                    quantity=100, price=1000 + i, price_rrc=1200 + i)
+        for i, product in enumerate(products))
+    ProductParameter.objects.bulk_create(
+        ProductParameter(product_info=product_info, parameter=parameter, value=str(i), value_number=i)
+        for product_info in product_infos for i, parameter in enumerate(parameter_objects))
+    ProductInfoChange.objects.bulk_create(
+        ProductInfoChange(product_info_id=product_info.id, shop_id=product_info.shop_id, action='insert')
+        for product_info in product_infos)
+    refresh_offers(product.id for product in products)
+    recount_categories()
+
+    buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+    buyer.set_password('pass3450!Q')
+    buyer.save()
+    contact = Contact.objects.create(user=buyer, city='Самара', street='Ленина', house='1', phone='+79990000000')
+    history = Order.objects.bulk_create(Order(user=buyer, state='new', contact=contact) for _ in range(orders))
+    OrderEvent.objects.bulk_create(OrderEvent(user=buyer, order=order, state='new') for order in history)
+    basket = Order.objects.create(user=buyer, state='basket')
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product_info=product_infos[(i * 3 + j) % len(product_infos)], quantity=1)
+        for i, order in enumerate(history + [basket]) for j in range(min(3, len(product_infos))))
+
+    staff = User.objects.create(email='staff@example.com', username='staff', is_staff=True, is_active=True)
+    ConfirmEmailToken.objects.create(user=User.objects.create(email='new@example.com', username='new'))
+    export_job = ExportJob.objects.create(user=buyer, kind='orders')
+    write_export(export_job)
+
+    return {
+        'buyer': buyer,
+        'staff': staff,
+        'partner': partners[0],
+        'shop': shop_objects[0],
+        'category': category,
+        'parameter': parameter_objects[-1],
+        'contact': contact,
+        'basket': basket,
+        'basket_item': basket.ordered_items.first(),
+        'product_info': product_infos[0],
+        'free_product_info': product_infos[-1],
+        'export_job': export_job,
+        'confirm_token': ConfirmEmailToken.objects.select_related('user').first(),
+    }
+
+
+def benchmark_cases(context):
+    """
+    Возвращает сценарии запросов ко всем URL приложения.
+
+    :param context: словарь, который вернул seed_dataset
+    :return: список словарей с ключами url_name, method, args, user, data и необязательным variant
+    """
+    buyer, partner = context['buyer'], context['partner']
+    return [
+        {'url_name': 'partner-update', 'method': 'post', 'user': partner,
+         'data': {'url': 'http://example.com/shop.yaml'}},
+        {'url_name': 'partner-export', 'method': 'get', 'user': partner, 'data': {'type': 'jsonl'}},
+        {'url_name': 'partner-state', 'method': 'get', 'user': partner},
+        {'url_name': 'partner-state', 'method': 'post', 'user': partner, 'data': {'state': 'on'}},
+        {'url_name': 'partner-orders', 'method': 'get', 'user': partner},
+        {'url_name': 'partner-webhooks', 'method': 'get', 'user': partner},
+        {'url_name': 'partner-webhooks', 'method': 'post', 'user': partner,
+         'data': {'url': 'http://127.0.0.1:9/webhook'}},
+        {'url_name': 'partner-webhooks', 'method': 'delete', 'user': partner, 'data': {'items': '1,2'}},
+        {'url_name': 'user-register', 'method': 'post',
+         'data': {'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'ivan@example.com',
+                  'password': 'pass3450!Q', 'company': 'Company', 'position': 'manager'}},
+        {'url_name': 'user-register-confirm', 'method': 'post',
+         'data': {'email': context['confirm_token'].user.email, 'token': context['confirm_token'].key}},
+        {'url_name': 'user-details', 'method': 'get', 'user': buyer},
+        {'url_name': 'user-details', 'method': 'post', 'user': buyer, 'data': {'company': 'Company'}},
+        {'url_name': 'user-contact', 'method': 'get', 'user': buyer},
+        {'url_name': 'user-contact', 'method': 'post', 'user': buyer,
+         'data': {'city': 'Самара', 'street': 'Ленина', 'phone': '+79990000001'}},
+        {'url_name': 'user-contact', 'method': 'put', 'user': buyer,
+         'data': {'id': str(context['contact'].id), 'city': 'Тольятти'}},
+        {'url_name': 'user-contact', 'method': 'delete', 'user': buyer,
+         'data': {'items': str(context['contact'].id)}},
+        {'url_name': 'user-login', 'method': 'post', 'data': {'email': buyer.email, 'password': 'pass3450!Q'}},
+        {'url_name': 'password-reset', 'method': 'post', 'data': {'email': buyer.email}},
+        {'url_name': 'password-reset-confirm', 'method': 'post',
+         'data': {'token': 'unknown', 'password': 'pass3450!Q'}},
+        {'url_name': 'export', 'method': 'get', 'user': buyer},
+        {'url_name': 'export', 'method': 'post', 'user': buyer, 'data': {'kind': 'orders'}},
+        {'url_name': 'export-download', 'method': 'get', 'user': buyer, 'args': (context['export_job'].id,)},
+        {'url_name': 'profiling-stats', 'method': 'get', 'user': context['staff']},
+        {'url_name': 'basket', 'method': 'get', 'user': buyer},
+        {'url_name': 'basket', 'method': 'post', 'user': buyer,
+         'data': {'items': json.dumps([{'product_info': context['free_product_info'].id, 'quantity': 1}])}},
+        {'url_name': 'basket', 'method': 'put', 'user': buyer,
+         'data': {'items': json.dumps([{'id': context['basket_item'].id, 'quantity': 2}])}},
+        {'url_name': 'basket', 'method': 'delete', 'user': buyer, 'data': {'items': str(context['basket_item'].id)}},
+        {'url_name': 'order', 'method': 'get', 'user': buyer},
+        {'url_name': 'order', 'method': 'post', 'user': buyer,
+         'data': {'id': str(context['basket'].id), 'contact': str(context['contact'].id)}},
+        {'url_name': 'api-root', 'method': 'get', 'user': buyer},
+        {'url_name': 'category-list', 'method': 'get', 'user': buyer},
+        {'url_name': 'category-list', 'method': 'get', 'user': buyer, 'variant': 'shop',
+         'data': {'shop_id': context['shop'].id}},
+        {'url_name': 'category-detail', 'method': 'get', 'user': buyer, 'args': (context['category'].id,)},
+        {'url_name': 'shop-list', 'method': 'get', 'user': buyer},
+        {'url_name': 'shop-detail', 'method': 'get', 'user': buyer, 'args': (context['shop'].id,)},
+        {'url_name': 'parameter-list', 'method': 'get', 'user': buyer},
+        {'url_name': 'parameter-detail', 'method': 'get', 'user': buyer, 'args': (context['parameter'].id,)},
+        {'url_name': 'products-list', 'method': 'get', 'user': buyer},
+        {'url_name': 'products-list', 'method': 'get', 'user': buyer, 'variant': 'parameters',
+         'data': {f'parameter_{context["parameter"].id}': '1..', 'sort': f'-parameter_{context["parameter"].id}'}},
+        {'url_name': 'products-detail', 'method': 'get', 'user': buyer, 'args': (context['product_info'].id,)},
+        {'url_name': 'products-changes', 'method': 'get', 'user': buyer, 'data': {'since': 0}},
+        {'url_name': 'products-offers', 'method': 'get', 'user': buyer, 'args': (context['product_info'].id,)},
+        # асинхронные представления не используют аутентификацию DRF, поэтому токен передается заголовком
+        {'url_name': 'async-products', 'method': 'get'},
+        {'url_name': 'async-product-detail', 'method': 'get', 'args': (context['product_info'].id,)},
+        {'url_name': 'async-basket', 'method': 'get', 'headers': _token_header(buyer)},
+        {'url_name': 'async-order', 'method': 'get', 'headers': _token_header(buyer)},
+        {'url_name': 'async-order-events', 'method': 'get', 'headers': _token_header(buyer),
+         'data': {'since': 0, 'timeout': 0}},
+        {'url_name': 'async-partner-orders', 'method': 'get', 'headers': _token_header(partner)},
+    ]
+
+
+def _token_header(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+
+def case_key(case):
+    """
+    Возвращает ключ сценария в эталоне, например 'GET basket' или 'GET products-list parameters'
+    для варианта запроса к тому же URL.
+    """
+    key = f"{case['method'].upper()} {case['url_name']}"
+    return f"{key} {case['variant']}" if 'variant' in case else key
+
+
+def app_url_names():
+    """
+    Возвращает имена всех URL приложения backend_orders.
+    """
+    resolver = get_resolver()
+    namespace = resolver.namespace_dict['backend_orders'][1]
+    return {name for name in namespace.reverse_dict if isinstance(name, str)}
+
+
+def _price_list_response(context):
+    response = mock.Mock()
+    response.content = PRICE_LIST_TEMPLATE.format(shop=context['shop'].name,
+                                                  category=context['category'].id).encode()
+    return response
+
+
+def _request(client, case):
+    """
+    Выполняет один запрос сценария и дочитывает потоковый ответ.
+    """
+    # пользователь загружается заново, как при аутентификации по токену, чтобы кэш связей
+    # от предыдущих сценариев не влиял на количество запросов
+    if case.get('user'):
+        client.force_authenticate(User.objects.get(pk=case['user'].pk))
+    else:
+        # force_authenticate(None) выходит из сессии и добавляет в замер запросы к django_session,
+        # поэтому анонимные запросы выполняются новым клиентом
+        client = APIClient()
+    url = reverse(f"backend_orders:{case['url_name']}", args=case.get('args', ()))
+    response = getattr(client, case['method'])(url, case.get('data'), **case.get('headers', {}))
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _run_isolated(client, case):
+    """
+    Выполняет запрос в транзакции с откатом, чтобы каждый повтор видел одни и те же данные.
+
+    :return: кортеж (ответ, количество SQL-запросов)
+    """
+    with transaction.atomic():
+        # журнал запросов очищается сигналом request_started, поэтому он очищается и до начала подсчета,
+        # а результат считается сразу; подсчет идет внутри транзакции, чтобы не учитывать точки сохранения
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = _request(client, case)
+        query_count = len(queries.captured_queries)
+        transaction.set_rollback(True)
+    return response, query_count
+
+
+def percentile(values, fraction):
+    """
+    Возвращает перцентиль отсортированного списка значений методом ближайшего ранга.
+    """
+    ordered = sorted(values)
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def run_benchmarks(context, repeat=20, measure_memory=True):
+    """
+    Прогоняет все сценарии через тестовый клиент и собирает метрики.
+
+    Фоновые задачи Celery не ставятся в очередь, а загрузка прайса по URL подменяется
+    локальным файлом, поэтому замеры не зависят от брокера и сети. Кэш очищается перед прогоном.
+
+    :param context: словарь, который вернул seed_dataset
+    :param repeat: сколько раз повторять каждый запрос для оценки задержки
+    :param measure_memory: замерять ли пиковую память (отдельным прогоном через tracemalloc)
+    :return: словарь {ключ сценария: {'status', 'queries', 'p50_ms', 'p95_ms', 'peak_kb'}}
+    """
+    client = APIClient()
+    results = {}
+    # первый запрос каждого сценария должен идти мимо кэша, чтобы подсчет SQL-запросов не зависел
+    # от предыдущих прогонов; повторы для замера задержки уже читают из кэша
+    cache.clear()
+    with mock.patch('celery.app.task.Task.apply_async'), \
+            mock.patch('backend_orders.views.get', return_value=_price_list_response(context)):
+        for case in benchmark_cases(context):
+            response, query_count = _run_isolated(client, case)
+
+            # как и timeit, сборщик мусора отключается на время замеров, чтобы сборка мусора,
+            # накопленного предыдущими сценариями, не попадала в задержку текущего
+            timings = []
+            gc.collect()
+            gc.disable()
+            try:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    _run_isolated(client, case)
+                    timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                gc.enable()
+
+            result = {
+                'status': response.status_code,
+                'queries': query_count,
+                'p50_ms': round(percentile(timings, 0.5), 3) if timings else None,
+                'p95_ms': round(percentile(timings, 0.95), 3) if timings else None,
+            }
+
+            if measure_memory:
+                tracemalloc.start()
+                _run_isolated(client, case)
+                result['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                tracemalloc.stop()
+
+            results[case_key(case)] = result
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    Загружает эталон из JSON-файла.
+    """
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def baseline_endpoints(baseline, vendor=None):
+    """
+    Возвращает эталон сценариев для базы данных vendor (по умолчанию - текущей) или None, если его нет.
+    Количество запросов зависит от базы: в PostgreSQL блокировки журнала и импорта - отдельные запросы.
+    """
+    return baseline['endpoints'].get(vendor or connection.vendor)
+
+
+def save_baseline(results, scale, path=BASELINE_PATH, thresholds=None, vendor=None, timings=False):
+    """
+    Сохраняет результаты замеров как эталон для базы данных vendor (по умолчанию - текущей).
+    Эталоны других баз, снятые на том же объеме данных, остаются в файле.
+
+    Задержка и память зависят от машины, поэтому сохраняются только с timings=True - для
+    локального эталона, который не попадает в репозиторий.
+    """
+    try:
+        baseline = load_baseline(path)
+    except FileNotFoundError:
+        baseline = None
+    endpoints = baseline['endpoints'] if baseline and baseline['scale'] == scale else {}
+    endpoints[vendor or connection.vendor] = {
+        key: result if timings else {name: result[name] for name in ('status', 'queries')}
+        for key, result in results.items()}
+    baseline = {
+        'scale': scale,
+        'thresholds': thresholds or DEFAULT_THRESHOLDS,
+        'endpoints': endpoints,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(baseline, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def compare_with_baseline(results, baseline, check_timing=True, vendor=None):
+    """
+    Сравнивает результаты замеров с эталоном.
+
+    :param results: результаты run_benchmarks
+    :param baseline: эталон, загруженный load_baseline
+    :param check_timing: сравнивать ли задержку и память, если они есть в эталоне
+    :param vendor: база данных, для которой снят результат (по умолчанию - текущая)
+    :return: список строк с описанием регрессий
+    """
+    vendor = vendor or connection.vendor
+    endpoints = baseline_endpoints(baseline, vendor)
+    if endpoints is None:
+        return [f'нет эталона для базы {vendor}: снимите его командой benchmark --update-baseline']
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get('thresholds', {})}
+    regressions = []
+    for key, result in results.items():
+        expected = endpoints.get(key)
+        if expected is None:
+            regressions.append(f'{key}: нет в эталоне')
+            continue
+
+        if result['status'] != expected['status']:
+            regressions.append(f"{key}: статус {result['status']}, в эталоне {expected['status']}")
+
+        if result['queries'] > expected['queries'] + thresholds['queries']:
+            regressions.append(f"{key}: {result['queries']} SQL-запросов, в эталоне {expected['queries']}")
+
+        if not check_timing:
+            continue
+
+        if result.get('p95_ms') is not None and expected.get('p95_ms') is not None:
+            limit = expected['p95_ms'] * thresholds['p95_ratio'] + thresholds['p95_slack_ms']
+            if result['p95_ms'] > limit:
+                regressions.append(f"{key}: p95 {result['p95_ms']} мс, допустимо {limit:.3f} мс")
+
+        if result.get('peak_kb') is not None and expected.get('peak_kb') is not None:
+            limit = expected['peak_kb'] * thresholds['memory_ratio']
+            if result['peak_kb'] > limit:
+                regressions.append(f"{key}: пиковая память {result['peak_kb']} КБ, допустимо {limit:.1f} КБ")
+    return regressions
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# ключ с версией каталога: при изменении прайса версия увеличивается, и старые записи кэша
+# каталога просто перестают читаться, а затем вытесняются по времени жизни
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_timeout():
+    """
+    Возвращает время жизни записей кэша каталога в секундах.
+    """
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60)
+
+
+def catalog_key(version, *parts):
+    """
+    Возвращает ключ кэша каталога для версии и параметров запроса.
+    """
+    return ':'.join(['catalog', str(version), *(str(part) for part in parts)])
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+async def acatalog_version():
+    return await cache.aget_or_set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def bump_catalog_version():
+    """
+    Делает недействительными все закэшированные страницы каталога.
+    Вызывается после импорта прайса и изменения статуса магазина.
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 2, timeout=None)
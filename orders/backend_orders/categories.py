@@ -0,0 +1,115 @@
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Category, CategoryShop, Product, ProductInfo
+
+# Дерево категорий. У каждой категории хранится материализованный путь (Category.path) из id предков,
+# поэтому "все товары раздела Электроника" - один запрос по диапазону путей по индексу category_path_idx.
+# Количество продуктов и предложений поддерева хранится в самой категории и меняется на разницу:
+# импорт прайса прибавляет добавленные и вычитает удаленные предложения категориям и всем их предкам,
+# включение и отключение магазина прибавляет или вычитает его предложения. Полный пересчет
+# (recount_categories, manage.py recount_categories) нужен только после изменений в обход импорта.
+# Связи магазина с категориями его прайса (CategoryShop) импорт переписывает разностью множеств:
+# одна вставка недостающих связей и одно удаление лишних.
+
+
+def apply_category_deltas(deltas):
+    """
+    Прибавляет изменения количества продуктов и предложений к категориям и всем их предкам.
+    Вызывается внутри транзакции, которая меняет продукты или предложения.
+
+    :param deltas: словарь {id категории: (изменение количества продуктов, изменение количества предложений)}
+    """
+    deltas = {category_id: delta for category_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    totals = {}
+    for category_id, path in Category.objects.filter(id__in=deltas).values_list('id', 'path'):
+        products, offers = deltas[category_id]
+        for ancestor_id in Category.path_ids(path):
+            total_products, total_offers = totals.get(ancestor_id, (0, 0))
+            totals[ancestor_id] = (total_products + products, total_offers + offers)
+
+    # категории с одинаковым изменением обновляются одним запросом
+    groups = {}
+    for category_id, delta in totals.items():
+        groups.setdefault(delta, []).append(category_id)
+    # товары, созданные в обход импорта, в счетчиках не учтены; до пересчета (manage.py recount_categories)
+    # счетчик не уходит ниже нуля
+    for (products, offers), category_ids in sorted(groups.items()):
+        Category.objects.filter(id__in=category_ids).update(product_count=Greatest(F('product_count') + products, 0),
+                                                            offer_count=Greatest(F('offer_count') + offers, 0))
+
+
+def shift_shop_offers(shop_ids, sign):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) предложения магазинов из счетчиков категорий
+    при включении или отключении приема заказов.
+    """
+    counts = ProductInfo.objects.filter(shop_id__in=shop_ids).values('product__category_id').annotate(
+        count=Count('id')).order_by().values_list('product__category_id', 'count')
+    apply_category_deltas({category_id: (0, sign * count) for category_id, count in counts})
+
+
+def recount_categories():
+    """
+    Пересчитывает количество продуктов и предложений всех категорий с нуля.
+    """
+    products = dict(Product.objects.values('category_id').annotate(count=Count('id')).order_by().values_list(
+        'category_id', 'count'))
+    offers = dict(ProductInfo.objects.filter(is_visible=True).values('product__category_id').annotate(
+        count=Count('id')).order_by().values_list('product__category_id', 'count'))
+    categories = list(Category.objects.only('id', 'path', 'product_count', 'offer_count'))
+    totals = {category.id: [0, 0] for category in categories}
+    for category in categories:
+        for ancestor_id in Category.path_ids(category.path) or [category.id]:
+            if ancestor_id in totals:
+                totals[ancestor_id][0] += products.get(category.id, 0)
+                totals[ancestor_id][1] += offers.get(category.id, 0)
+    changed = []
+    for category in categories:
+        if [category.product_count, category.offer_count] != totals[category.id]:
+            category.product_count, category.offer_count = totals[category.id]
+            changed.append(category)
+    Category.objects.bulk_update(changed, ['product_count', 'offer_count'], batch_size=500)
+
+
+def link_shop_categories(shop_id, category_ids):
+    """
+    Оставляет у магазина связи ровно с категориями category_ids: недостающие связи вставляются
+    одним запросом, лишние удаляются одним запросом, существующие не трогаются.
+    """
+    linked = set(CategoryShop.objects.filter(shop_id=shop_id).values_list('category_id', flat=True))
+    category_ids = set(category_ids)
+    CategoryShop.objects.bulk_create([CategoryShop(shop_id=shop_id, category_id=category_id)
+                                      for category_id in sorted(category_ids - linked)])
+    if linked - category_ids:
+        CategoryShop.objects.filter(shop_id=shop_id, category_id__in=linked - category_ids).delete()
+
+
+def load_shop_categories(shop_id):
+    """
+    Возвращает категории из прайса магазина в порядке путей со счетчиками по всему каталогу.
+    """
+    return [{'id': category_id, 'name': name, 'parent': parent_id, 'product_count': product_count,
+             'offer_count': offer_count}
+            for category_id, name, parent_id, product_count, offer_count in CategoryShop.objects.filter(
+                shop_id=shop_id).order_by('category__path', 'category_id').values_list(
+                'category_id', 'category__name', 'category__parent_id', 'category__product_count',
+                'category__offer_count')]
+
+
+def load_category_tree():
+    """
+    Возвращает дерево категорий со счетчиками одним запросом. Категории читаются в порядке путей,
+    поэтому родитель всегда встречается раньше вложенных в него категорий.
+    """
+    nodes = {}
+    roots = []
+    for category_id, name, parent_id, product_count, offer_count in Category.objects.order_by(
+            'path', 'id').values_list('id', 'name', 'parent_id', 'product_count', 'offer_count'):
+        node = nodes[category_id] = {'id': category_id, 'name': name, 'product_count': product_count,
+                                     'offer_count': offer_count, 'children': []}
+        parent = nodes.get(parent_id)
+        (parent['children'] if parent is not None else roots).append(node)
+    return roots
@@ -0,0 +1,134 @@
+from django.db import connection
+from django.db.models import F
+
+from .categories import shift_shop_offers
+from .models import Shop, ProductInfo, ProductInfoChange, OrderItem
+from .offers import refresh_offers, refresh_shop_offers
+from .projections import load_products
+
+# Журнал изменений предложений для ленты /product/changes. Номер изменения - автоинкремент, но
+# транзакции могут фиксироваться не в порядке выдачи номеров, и клиент, прочитавший курсор 10,
+# навсегда пропустил бы изменение 9 из еще не зафиксированной транзакции. Поэтому все записи
+# в журнал идут под одной транзакционной блокировкой: номера становятся видны строго по порядку.
+
+# ключ advisory-блокировки PostgreSQL для записи в журнал
+CHANGE_LOG_LOCK = 41041
+
+# сколько изменений отдается за один запрос ленты
+CHANGES_PAGE_SIZE = 1000
+
+
+def lock_change_log():
+    """
+    Берет блокировку журнала до конца текущей транзакции. Берется до блокировок строк предложений.
+    Той же блокировкой пользуется журнал событий заказов (events.py).
+    В SQLite запись и так выполняется одной транзакцией за раз.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_LOG_LOCK])
+
+
+def record_changes(changes):
+    """
+    Записывает изменения предложений в журнал. Вызывается внутри транзакции после lock_change_log().
+
+    :param changes: список кортежей (id предложения, id магазина, изменение)
+    """
+    ProductInfoChange.objects.bulk_create([
+        ProductInfoChange(product_info_id=product_info_id, shop_id=shop_id, action=action)
+        for product_info_id, shop_id, action in changes
+    ])
+
+
+def record_shop_changes(shop_ids):
+    """
+    Отмечает все предложения магазинов измененными, например при включении или отключении приема заказов.
+    """
+    lock_change_log()
+    record_changes([(product_info_id, shop_id, 'update') for product_info_id, shop_id in
+                    ProductInfo.objects.filter(shop_id__in=shop_ids).values_list('id', 'shop_id')])
+
+
+def set_shop_state(shop_ids, state):
+    """
+    Включает или отключает прием заказов магазинами. Вызывается внутри транзакции.
+
+    Статус копируется в предложения (ProductInfo.is_visible) одним UPDATE, поэтому каталог сразу
+    перестает показывать предложения отключенного магазина, не соединяя предложения с магазинами.
+    Предложения попадают в ленту изменений, сводки и счетчики категорий пересчитываются.
+    Магазины, у которых статус уже такой, не трогаются.
+
+    :return: список id магазинов, у которых статус изменился
+    """
+    lock_change_log()
+    shop_ids = list(Shop.objects.select_for_update().filter(id__in=shop_ids).exclude(state=state).order_by(
+        'id').values_list('id', flat=True))
+    if not shop_ids:
+        return shop_ids
+    Shop.objects.filter(id__in=shop_ids).update(state=state)
+    ProductInfo.objects.filter(shop_id__in=shop_ids).update(is_visible=state)
+    record_shop_changes(shop_ids)
+    refresh_shop_offers(shop_ids)
+    shift_shop_offers(shop_ids, 1 if state else -1)
+    return shop_ids
+
+
+def reserve_stock(order_id):
+    """
+    Списывает со склада товары заказа при оформлении. Вызывается внутри транзакции.
+
+    :return: список id предложений, которых не хватает; если он не пустой, остатки не меняются
+    """
+    # журнал блокируется первым, как и при импорте, чтобы порядок блокировок везде совпадал
+    lock_change_log()
+    needed = {}
+    for product_info_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list(
+            'product_info_id', 'quantity'):
+        needed[product_info_id] = needed.get(product_info_id, 0) + quantity
+
+    # блокируем строки в порядке id, чтобы параллельные оформления не взаимоблокировались
+    offers = ProductInfo.objects.select_for_update().filter(id__in=needed).order_by('id').values_list(
+        'id', 'shop_id', 'product_id', 'quantity')
+    available = {product_info_id: (shop_id, product_id, quantity)
+                 for product_info_id, shop_id, product_id, quantity in offers}
+    shortage = [product_info_id for product_info_id, quantity in needed.items()
+                if product_info_id not in available or available[product_info_id][2] < quantity]
+    if shortage:
+        return sorted(shortage)
+
+    for product_info_id, quantity in needed.items():
+        ProductInfo.objects.filter(id=product_info_id).update(quantity=F('quantity') - quantity)
+    record_changes([(product_info_id, available[product_info_id][0], 'update') for product_info_id in needed])
+    refresh_offers(available[product_info_id][1] for product_info_id in needed)
+    return []
+
+
+def latest_cursor():
+    """
+    Возвращает номер последнего изменения, с которого клиент начинает читать ленту после полной загрузки каталога.
+    """
+    return ProductInfoChange.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+
+def load_changes(since, limit=CHANGES_PAGE_SIZE):
+    """
+    Возвращает изменения каталога после курсора since.
+
+    Несколько изменений одного предложения сворачиваются: клиент получает его текущее состояние,
+    если предложение существует и его магазин принимает заказы, иначе - только id в removed.
+
+    :return: словарь с новым курсором, признаком следующей страницы, измененными и удаленными предложениями
+    """
+    rows = list(ProductInfoChange.objects.filter(seq__gt=since).order_by('seq').values_list(
+        'seq', 'product_info_id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    ids = {product_info_id for _, product_info_id in rows}
+    upserted = load_products(ProductInfo.objects.filter(id__in=ids, is_visible=True)) if ids else []
+    return {
+        'cursor': rows[-1][0] if rows else since,
+        'has_more': has_more,
+        'upserted': upserted,
+        'removed': sorted(ids - {product['id'] for product in upserted}),
+    }
@@ -0,0 +1,180 @@
+import gzip
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # сжатие br доступно только при установленном пакете brotli
+    brotli = None
+
+# ответы меньше этого размера не сжимаются: заголовки и затраты CPU съедают выигрыш
+DEFAULT_MIN_SIZE = 1024
+
+# уже сжатые форматы (выгрузки .gz/.zst, архивы, изображения) повторно не сжимаются
+INCOMPRESSIBLE_TYPES = ('application/gzip', 'application/zstd', 'application/zip', 'image/', 'video/', 'audio/')
+
+_token = re.compile(r'^\s*([a-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$', re.IGNORECASE)
+
+
+def available_encodings():
+    """
+    Возвращает поддерживаемые кодировки ответа в порядке предпочтения.
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Выбирает кодировку по заголовку Accept-Encoding: при равном весе предпочитается br.
+
+    :return: 'br', 'gzip' или None, если клиент не принимает ни одну из них
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        match = _token.match(part)
+        if not match:
+            continue
+        try:
+            weights[match[1].lower()] = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(content, encoding):
+    """
+    Сжимает байты целиком. Уровни подобраны для динамических ответов: быстрее максимальных
+    и почти так же компактны на повторяющемся JSON.
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+def stream_compressor(encoding):
+    """
+    Возвращает функции потокового сжатия: (сжать фрагмент, завершить поток).
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+        return compressor.process, compressor.finish
+    # wbits=31 - формат gzip с заголовком и контрольной суммой
+    compressor = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    """
+    Сжимает поток фрагментов, выдавая сжатые данные по мере поступления исходных.
+    """
+    process, finish = stream_compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(chunks, encoding):
+    """
+    Асинхронный вариант compress_stream для ответов с асинхронным итератором.
+    """
+    process, finish = stream_compressor(encoding)
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def min_size():
+    return getattr(settings, 'COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+
+def is_compressible(response):
+    """
+    Проверяет, можно ли сжимать ответ: не сжатый заранее, не бинарный и без поддержки докачки
+    (смещения Range считаются по несжатому файлу).
+    """
+    if response.has_header('Content-Encoding') or response.has_header('Accept-Ranges') or \
+            response.status_code == 206:
+        return False
+    content_type = response.get('Content-Type', '').lower()
+    return not content_type.startswith(INCOMPRESSIBLE_TYPES)
+
+
+def patch_response(request, response):
+    """
+    Сжимает ответ на месте, если клиент это поддерживает и ответ подходит по типу и размеру.
+    """
+    if not is_compressible(response):
+        return
+    if not response.streaming and len(response.content) < min_size():
+        return
+
+    # ответ зависит от Accept-Encoding даже если этот клиент сжатие не поддерживает
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return
+
+    if response.streaming:
+        # асинхронный итератор (is_async) нельзя обходить синхронно, он сжимается своим генератором
+        stream = acompress_stream if getattr(response, 'is_async', False) else compress_stream
+        response.streaming_content = stream(response.streaming_content, encoding)
+        del response['Content-Length']
+    else:
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+
+    # сжатое тело отличается от исходного побайтно, поэтому строгий ETag становится слабым
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    response['Content-Encoding'] = encoding
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы через br или gzip в зависимости от Accept-Encoding.
+
+    Обычные ответы сжимаются, если они больше COMPRESSION_MIN_SIZE, потоковые (выгрузки,
+    список товаров) - всегда и по мере отдачи фрагментов. Ответы, которые уже содержат
+    Content-Encoding (например, заранее сжатые страницы каталога из кэша), не трогаются.
+
+    Работает и в синхронной, и в асинхронной цепочке: потоковое тело только оборачивается
+    генератором сжатия и читается там же, где его читает сервер.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        patch_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        patch_response(request, response)
+        return response
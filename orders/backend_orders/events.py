@@ -0,0 +1,105 @@
+import asyncio
+
+from django.conf import settings
+from django.db import transaction
+
+from .changes import lock_change_log, reserve_stock
+from .models import Order, OrderItem, OrderEvent, Webhook, ORDER_TRANSITIONS
+from .tasks import dispatch_webhooks
+
+# События смены статуса заказов. Вместо периодических запросов к тяжелым спискам заказов
+# клиент ждет новых событий после своего курсора: long-poll (async/order/events) или SSE (sse.py).
+# Событие пишется отдельной строкой для каждого получателя, поэтому чтение - это диапазон
+# по индексу (user, seq) без соединений с позициями заказов.
+
+# сколько событий отдается за один ответ
+EVENTS_PAGE_SIZE = 500
+
+# предельное время ожидания long-poll в секундах
+MAX_WAIT_TIMEOUT = 60
+
+
+def poll_interval():
+    """
+    Возвращает период проверки новых событий в секундах.
+    """
+    return getattr(settings, 'ORDER_EVENTS_POLL_INTERVAL', 1.0)
+
+
+def record_order_events(order_ids, state):
+    """
+    Записывает событие смены статуса заказов для покупателя и поставщиков товаров каждого заказа.
+    Вызывается внутри транзакции, которая меняет статус; журнал блокируется так же, как журнал
+    изменений предложений, чтобы номера событий становились видны по порядку.
+    """
+    lock_change_log()
+    recipients = set(Order.objects.filter(id__in=order_ids).values_list('id', 'user_id'))
+    recipients.update(OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        'order_id', 'product_info__shop__user_id'))
+    OrderEvent.objects.bulk_create(OrderEvent(order_id=order_id, user_id=user_id, state=state)
+                                   for order_id, user_id in sorted(recipients) if user_id is not None)
+
+    # поставщикам с вебхуками события отправляются после фиксации транзакции
+    if Webhook.objects.filter(user_id__in={user_id for _, user_id in recipients}, is_active=True).exists():
+        transaction.on_commit(dispatch_webhooks.delay)
+
+
+def change_order_state(order_ids, state, **fields):
+    """
+    Переводит заказы в статус state, если переход допустим (ORDER_TRANSITIONS), и записывает события.
+    При оформлении корзины товары списываются со склада; если товара не хватает, заказ не меняется.
+    Вызывается внутри транзакции; строки заказов блокируются в порядке id.
+
+    :param fields: другие поля, которые меняются вместе со статусом у переведенных заказов
+    :return: кортеж (список id переведенных заказов, словарь {id заказа: описание ошибки} для остальных)
+    """
+    lock_change_log()
+    changed, rejected = [], {}
+    for order_id, current in Order.objects.select_for_update().filter(id__in=order_ids).order_by('id').values_list(
+            'id', 'state'):
+        if state not in ORDER_TRANSITIONS[current]:
+            rejected[order_id] = {'Errors': f'Недопустимая смена статуса заказа: {current} -> {state}'}
+            continue
+        if current == 'basket':
+            shortage = reserve_stock(order_id)
+            if shortage:
+                rejected[order_id] = {'Errors': 'Недостаточно товара на складе', 'product_info': shortage}
+                continue
+        changed.append(order_id)
+    if changed:
+        Order.objects.filter(id__in=changed).update(state=state, **fields)
+        record_order_events(changed, state)
+    return changed, rejected
+
+
+async def alatest_seq(user_id):
+    """
+    Возвращает номер последнего события пользователя, 0 - если событий нет.
+    """
+    return await OrderEvent.objects.filter(user_id=user_id).order_by('-seq').values_list(
+        'seq', flat=True).afirst() or 0
+
+
+async def afetch_events(user_id, since, limit=EVENTS_PAGE_SIZE):
+    """
+    Возвращает события пользователя после курсора since: номер, id заказа и новый статус.
+    """
+    rows = OrderEvent.objects.filter(user_id=user_id, seq__gt=since).order_by('seq').values_list(
+        'seq', 'order_id', 'state')[:limit]
+    return [{'seq': seq, 'order': order_id, 'state': state} async for seq, order_id, state in rows]
+
+
+async def await_events(user_id, since, timeout):
+    """
+    Ждет события пользователя после курсора since не дольше timeout секунд.
+
+    :return: список событий, пустой - если за время ожидания ничего не произошло
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        events = await afetch_events(user_id, since)
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            return events
+        await asyncio.sleep(min(poll_interval(), remaining))
@@ -0,0 +1,336 @@
+import csv
+import gzip
+import io
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from ujson import dumps as dump_json
+from yaml import dump as dump_yaml
+
+from .models import ProductInfo, ProductParameter, OrderItem, ExportJob, ShopCategory
+
+try:
+    import zstandard
+except ImportError:  # сжатие zstd доступно только при установленном пакете zstandard
+    zstandard = None
+
+# сколько строк читается из базы за один проход курсора
+EXPORT_CHUNK_SIZE = 2000
+
+# сколько товаров склеивается в один фрагмент при записи выгрузки
+EXPORT_BATCH_SIZE = 200
+
+# выгрузка до этого размера в байтах собирается в памяти, больше - во временном файле
+EXPORT_SPOOL_SIZE = 4 * 1024 * 1024
+
+# сколько товаров магазина выгружается запросом под ASGI; прайс больше выгружается фоновым заданием
+EXPORT_ASGI_LIMIT = 20000
+
+EXPORT_CONTENT_TYPES = {
+    'yaml': 'application/x-yaml; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def external_category_ids(shop_id):
+    """
+    Возвращает словарь {id категории каталога: id категории в прайсе магазина} (ShopCategory).
+    Категории без записи в ShopCategory выгружаются под своим id.
+    """
+    external = {}
+    for category_id, external_id in ShopCategory.objects.filter(shop_id=shop_id).order_by(
+            '-external_id').values_list('category_id', 'external_id'):
+        external[category_id] = external_id
+    return external
+
+
+def iter_goods(shop_id):
+    """
+    Построчно выдает товары магазина в формате раздела goods файла импорта (data/shop1.yaml).
+
+    Предложения и их параметры читаются двумя курсорами, отсортированными по id предложения,
+    и склеиваются слиянием, поэтому в памяти одновременно находится не больше одной порции строк.
+
+    :param shop_id: идентификатор магазина
+    :return: генератор словарей товаров
+    """
+    offers = ProductInfo.objects.filter(shop_id=shop_id).order_by('id').values_list(
+        'id', 'external_id', 'product__category_id', 'model', 'product__name', 'price', 'price_rrc',
+        'quantity').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    parameters = iter(ProductParameter.objects.filter(product_info__shop_id=shop_id).order_by(
+        'product_info_id', 'id').values_list('product_info_id', 'parameter__name', 'value').iterator(
+        chunk_size=EXPORT_CHUNK_SIZE))
+
+    categories = external_category_ids(shop_id)
+    parameter = next(parameters, None)
+    for offer_id, external_id, category_id, model, name, price, price_rrc, quantity in offers:
+        item_parameters = {}
+        while parameter is not None and parameter[0] <= offer_id:
+            if parameter[0] == offer_id:
+                item_parameters[parameter[1]] = parameter[2]
+            parameter = next(parameters, None)
+
+        yield {
+            'id': external_id,
+            'category': categories.get(category_id, category_id),
+            'model': model,
+            'name': name,
+            'price': price,
+            'price_rrc': price_rrc,
+            'quantity': quantity,
+            'parameters': item_parameters,
+        }
+
+
+def _batched(lines):
+    """
+    Склеивает строки в фрагменты по EXPORT_BATCH_SIZE, чтобы не отдавать клиенту каждую строку отдельно.
+    """
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_catalog_yaml(shop):
+    """
+    Выдает прайс магазина в формате YAML той же структуры, что и файлы импорта.
+
+    :param shop: объект магазина
+    :return: генератор фрагментов текста
+    """
+    yield dump_yaml({'shop': shop.name}, allow_unicode=True)
+    external = external_category_ids(shop.id)
+    categories = []
+    for category_id, name, parent_id in shop.categories.values_list('id', 'name', 'parent_id'):
+        category = {'id': external.get(category_id, category_id), 'name': name}
+        if parent_id is not None:
+            category['parent'] = external.get(parent_id, parent_id)
+        categories.append(category)
+    categories.sort(key=lambda category: category['id'])
+    yield dump_yaml({'categories': categories}, allow_unicode=True, sort_keys=False)
+
+    goods = iter_goods(shop.id)
+    first = next(goods, None)
+    if first is None:
+        yield 'goods: []\n'
+        return
+
+    yield 'goods:\n'
+    yield dump_yaml([first], allow_unicode=True, sort_keys=False)
+    yield from _batched(dump_yaml([item], allow_unicode=True, sort_keys=False) for item in goods)
+
+
+def iter_catalog_jsonl(shop):
+    """
+    Выдает товары магазина в формате JSON Lines: одна строка - один товар.
+
+    :param shop: объект магазина
+    :return: генератор фрагментов текста
+    """
+    yield from _batched(dump_json(item, ensure_ascii=False) + '\n' for item in iter_goods(shop.id))
+
+
+EXPORT_FORMATS = {
+    'yaml': iter_catalog_yaml,
+    'jsonl': iter_catalog_jsonl,
+}
+
+
+def write_catalog(shop, export_format):
+    """
+    Записывает прайс магазина во временный файл, который удаляется при закрытии.
+
+    Нужна только под ASGI: Django перебирает потоковый ответ в цикле событий, где генератор с запросами
+    к базе упал бы с SynchronousOnlyOperation, поэтому ответ отдается уже готовым файлом. Под WSGI
+    прайс отдается генератором EXPORT_FORMATS без промежуточного файла.
+
+    :return: файловый объект, установленный на начало
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    for chunk in EXPORT_FORMATS[export_format](shop):
+        file.write(chunk.encode())
+    file.seek(0)
+    return file
+
+
+# как часто (в строках) фоновая выгрузка сохраняет прогресс в базу
+EXPORT_PROGRESS_STEP = 5000
+
+CATALOG_COLUMNS = ('id', 'category', 'model', 'name', 'price', 'price_rrc', 'quantity', 'parameters')
+
+ORDER_COLUMNS = ('order', 'dt', 'state', 'product_info', 'external_id', 'name', 'shop', 'quantity', 'price')
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': 'gz',
+    'zstd': 'zst',
+}
+
+COMPRESSION_CONTENT_TYPES = {
+    'gzip': 'application/gzip',
+    'zstd': 'application/zstd',
+}
+
+
+def available_compressions():
+    """
+    Возвращает алгоритмы сжатия, доступные в текущем окружении.
+    """
+    return ('gzip', 'zstd') if zstandard is not None else ('gzip',)
+
+
+def order_items_for(user):
+    """
+    Возвращает позиции оформленных заказов: для покупателя - его заказы, для магазина - заказы с его товарами.
+    """
+    if user.type == 'shop':
+        query = Q(product_info__shop__user_id=user.id)
+    else:
+        query = Q(order__user_id=user.id)
+    return OrderItem.objects.filter(query).exclude(order__state='basket')
+
+
+def iter_order_rows(user):
+    """
+    Построчно выдает позиции заказов пользователя.
+
+    :param user: пользователь, для которого делается выгрузка
+    :return: генератор словарей с полями ORDER_COLUMNS
+    """
+    items = order_items_for(user).order_by('order_id', 'id').values_list(
+        'order_id', 'order__dt', 'order__state', 'product_info_id', 'product_info__external_id',
+        'product_info__product__name', 'product_info__shop_id', 'quantity',
+        'product_info__price').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in items:
+        item = dict(zip(ORDER_COLUMNS, row))
+        item['dt'] = item['dt'].isoformat()
+        yield item
+
+
+def count_export_rows(job):
+    """
+    Возвращает количество строк, которое будет выгружено для задания.
+    """
+    if job.kind == 'catalog':
+        return ProductInfo.objects.filter(shop__user_id=job.user_id).count()
+    return order_items_for(job.user).count()
+
+
+def iter_export_rows(job):
+    """
+    Возвращает генератор строк и набор колонок для задания выгрузки.
+    """
+    if job.kind == 'catalog':
+        shop = job.user.shop
+        return iter_goods(shop.id), CATALOG_COLUMNS
+    return iter_order_rows(job.user), ORDER_COLUMNS
+
+
+def open_compressed(path, compression):
+    """
+    Открывает файл на запись в текстовом режиме со сжатием gzip или zstd.
+    """
+    if compression == 'zstd':
+        raw = open(path, 'wb')
+        writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8', newline='')
+    return gzip.open(path, 'wt', encoding='utf-8', newline='')
+
+
+def write_export(job):
+    """
+    Записывает выгрузку в сжатый файл в каталоге EXPORT_ROOT/jobs, периодически сохраняя прогресс.
+
+    :param job: задание выгрузки
+    :return: количество выгруженных строк
+    """
+    export_root = Path(settings.EXPORT_ROOT) / 'jobs'
+    export_root.mkdir(parents=True, exist_ok=True)
+    file_name = f'{job.kind}_{job.id}.{job.file_format}.{COMPRESSION_EXTENSIONS[job.compression]}'
+
+    ExportJob.objects.filter(id=job.id).update(status='running', file=file_name, total_rows=count_export_rows(job))
+
+    rows, columns = iter_export_rows(job)
+    count = 0
+    with open_compressed(export_root / file_name, job.compression) as file:
+        if job.file_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(columns)
+        for row in rows:
+            if job.file_format == 'csv':
+                if 'parameters' in row:
+                    row['parameters'] = dump_json(row['parameters'], ensure_ascii=False)
+                writer.writerow([row[column] for column in columns])
+            else:
+                file.write(dump_json(row, ensure_ascii=False))
+                file.write('\n')
+            count += 1
+            if count % EXPORT_PROGRESS_STEP == 0:
+                ExportJob.objects.filter(id=job.id).update(rows=count)
+
+    ExportJob.objects.filter(id=job.id).update(status='done', rows=count, finished_at=timezone.now())
+    return count
+
+
+def export_file_path(job):
+    """
+    Возвращает путь к файлу готовой выгрузки.
+    """
+    return Path(settings.EXPORT_ROOT) / 'jobs' / job.file
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байт.
+
+    Синтаксически неверный заголовок, в том числе диапазон с концом меньше начала (bytes=500-100),
+    по RFC 7233 игнорируется, и отдается весь файл.
+
+    :param header: значение заголовка Range
+    :param size: размер файла
+    :return: кортеж (start, end) включительно или None, если заголовок нужно проигнорировать
+    :raises ValueError: если диапазон невыполним: начинается за концом файла или пустой суффикс
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # суффиксный диапазон bytes=-N: последние N байт
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def iter_file_range(file, start, end, block_size=64 * 1024):
+    """
+    Читает из открытого двоичного файла байты с start по end включительно блоками по block_size
+    и закрывает файл.
+    """
+    with file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = file.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
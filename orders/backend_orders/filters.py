@@ -0,0 +1,130 @@
+import re
+
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import Parameter, ProductParameter
+from .offers import CATALOG_ORDERINGS
+from .parameters import NUMBER, DIMENSION, TEXT, parse_number, parse_dimension
+
+# Фильтры и сортировка каталога по характеристикам. Фильтр ?parameter_<id>=<значение> или диапазон
+# ?parameter_<id>=<от>..<до> (любую границу можно опустить: 6.. или ..1920x1080), сортировка
+# ?sort=parameter_<id> или ?sort=-parameter_<id>. Диапазоны сравнивают типизированные колонки
+# ProductParameter по индексам (parameter, колонка, product_info), поэтому база не приводит строки
+# к числам по всей таблице, а предложения с подходящим значением находятся по индексу.
+
+PARAMETER_ARGUMENT_RE = re.compile(r'^parameter_(\d+)$')
+
+SORT_RE = re.compile(r'^(-?)parameter_(\d+)$')
+
+# колонки, по которым сравниваются и сортируются значения характеристики каждого типа
+TYPE_COLUMNS = {
+    NUMBER: ('value_number',),
+    DIMENSION: ('value_width', 'value_height'),
+    TEXT: ('value',),
+}
+
+
+class CatalogQuery:
+    """
+    Фильтры по характеристикам и сортировка списка товаров из параметров запроса.
+
+    Разбор аргументов не обращается к базе; типы упомянутых характеристик загружаются одним
+    запросом (load_types или aload_types) перед построением условия.
+    """
+
+    def __init__(self, params):
+        """
+        :param params: параметры запроса (QueryDict)
+        :raises ValueError: если сортировка или фильтр указаны неправильно
+        """
+        self.sort = params.get('sort') or None
+        self.sort_parameter = None
+        self.filters = []
+        self.types = {}
+
+        if self.sort is not None and self.sort not in CATALOG_ORDERINGS:
+            match = SORT_RE.match(self.sort)
+            if match is None:
+                raise ValueError(self.sort)
+            self.sort_parameter = int(match[2])
+        for name, value in sorted(params.items()):
+            match = PARAMETER_ARGUMENT_RE.match(name)
+            if match is not None:
+                if not value:
+                    raise ValueError(name)
+                self.filters.append((int(match[1]), value))
+
+    def parameter_ids(self):
+        ids = {parameter_id for parameter_id, _ in self.filters}
+        if self.sort_parameter is not None:
+            ids.add(self.sort_parameter)
+        return ids
+
+    def load_types(self):
+        if self.parameter_ids():
+            self.types = dict(Parameter.objects.filter(id__in=self.parameter_ids()).values_list('id', 'value_type'))
+
+    async def aload_types(self):
+        if self.parameter_ids():
+            self.types = {parameter_id: value_type async for parameter_id, value_type in Parameter.objects.filter(
+                id__in=self.parameter_ids()).values_list('id', 'value_type')}
+
+    def cache_key(self):
+        """
+        Возвращает часть ключа кэша каталога для сортировки и фильтров.
+        """
+        return '&'.join([self.sort or ''] + [f'{parameter_id}={value}' for parameter_id, value in self.filters])
+
+    def condition(self):
+        """
+        Возвращает условие на предложения для всех фильтров по характеристикам.
+
+        :raises ValueError: если характеристика не найдена или значение не подходит под ее тип
+        """
+        query = Q()
+        for parameter_id, value in self.filters:
+            value_type = self.value_type(parameter_id)
+            low, separator, high = value.partition('..')
+            if separator:
+                if value_type == TEXT or not low and not high:
+                    raise ValueError(value)
+                lookups = {**self.bound_lookups(value_type, low, 'gte'), **self.bound_lookups(value_type, high, 'lte')}
+            else:
+                lookups = self.bound_lookups(value_type, value, 'exact')
+            query &= Q(id__in=ProductParameter.objects.filter(parameter_id=parameter_id, **lookups).values(
+                'product_info_id'))
+        return query
+
+    def ordering(self):
+        """
+        Возвращает сортировку предложений (как значения CATALOG_ORDERINGS) или None - порядок по id.
+        Предложения без значения характеристики идут в конце.
+        """
+        if self.sort_parameter is None:
+            return CATALOG_ORDERINGS.get(self.sort)
+        values = ProductParameter.objects.filter(product_info_id=OuterRef('pk'), parameter_id=self.sort_parameter)
+        ordering = []
+        for column in TYPE_COLUMNS[self.value_type(self.sort_parameter)]:
+            expression = Subquery(values.values(column)[:1])
+            ordering.append(expression.desc(nulls_last=True) if self.sort.startswith('-') else
+                            expression.asc(nulls_last=True))
+        return tuple(ordering)
+
+    def value_type(self, parameter_id):
+        if parameter_id not in self.types:
+            raise ValueError(parameter_id)
+        return self.types[parameter_id]
+
+    @staticmethod
+    def bound_lookups(value_type, value, lookup):
+        """
+        Возвращает условия на типизированные колонки для одной границы диапазона; пустая граница - без условий.
+        """
+        if not value:
+            return {}
+        if value_type == TEXT:
+            return {'value': value}
+        parsed = (parse_number(value),) if value_type == NUMBER else parse_dimension(value)
+        if parsed is None or None in parsed:
+            raise ValueError(value)
+        return {f'{column}__{lookup}': number for column, number in zip(TYPE_COLUMNS[value_type], parsed)}
@@ -0,0 +1,321 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from yaml import dump as dump_yaml
+
+from .models import User, Shop, Category, ShopCategory, Product, ProductInfo, ProductParameter, Order, \
+    OrderItem, Contact
+from .categories import recount_categories
+from .importer import ParameterDictionary
+from .matching import match_key, match_tokens
+from .offers import refresh_offers
+
+# категории с теми же id, что и в data/shop1.yaml
+CATEGORIES = (
+    (224, 'Смартфоны'),
+    (15, 'Аксессуары'),
+    (1, 'Flash-накопители'),
+    (5, 'Телевизоры'),
+    (3, 'Ноутбуки'),
+)
+
+COLORS = ('черный', 'белый', 'серебристый', 'золотистый', 'красный', 'синий', 'зеленый')
+
+# для каждой категории: тип товара, бренды, диапазон базовой цены и генераторы характеристик
+CATEGORY_TEMPLATES = {
+    224: {
+        'title': 'Смартфон',
+        'brands': ('Apple', 'Samsung', 'Xiaomi', 'Honor', 'Realme'),
+        'price': (8000, 150000),
+        'parameters': (
+            ('Диагональ (дюйм)', lambda rng: round(rng.uniform(5.0, 6.9), 1)),
+            ('Разрешение (пикс)', lambda rng: rng.choice(('2688x1242', '1792x828', '2400x1080', '1600x720'))),
+            ('Встроенная память (Гб)', lambda rng: rng.choice((32, 64, 128, 256, 512))),
+            ('Цвет', lambda rng: rng.choice(COLORS)),
+            ('Оперативная память (Гб)', lambda rng: rng.choice((2, 3, 4, 6, 8, 12))),
+            ('Емкость аккумулятора (мАч)', lambda rng: rng.randrange(2500, 6000, 100)),
+        ),
+    },
+    15: {
+        'title': 'Кабель',
+        'brands': ('Belkin', 'Baseus', 'Ugreen', 'Anker'),
+        'price': (300, 4000),
+        'parameters': (
+            ('Цвет', lambda rng: rng.choice(COLORS)),
+            ('Длина кабеля (м)', lambda rng: rng.choice((0.5, 1, 1.5, 2, 3))),
+            ('Тип разъема', lambda rng: rng.choice(('USB Type-C', 'Lightning', 'micro USB'))),
+        ),
+    },
+    1: {
+        'title': 'Флешка',
+        'brands': ('Kingston', 'SanDisk', 'Transcend', 'Silicon Power'),
+        'price': (400, 6000),
+        'parameters': (
+            ('Объем памяти (Гб)', lambda rng: rng.choice((16, 32, 64, 128, 256))),
+            ('Интерфейс', lambda rng: rng.choice(('USB 2.0', 'USB 3.0', 'USB 3.1'))),
+            ('Цвет', lambda rng: rng.choice(COLORS)),
+        ),
+    },
+    5: {
+        'title': 'Телевизор',
+        'brands': ('LG', 'Samsung', 'Sony', 'Philips', 'Hisense'),
+        'price': (15000, 300000),
+        'parameters': (
+            ('Диагональ (дюйм)', lambda rng: rng.choice((32, 43, 50, 55, 65, 75, 85))),
+            ('Разрешение (пикс)', lambda rng: rng.choice(('3840x2160', '1920x1080', '1366x768'))),
+            ('Частота обновления (Гц)', lambda rng: rng.choice((50, 60, 100, 120))),
+            ('Цвет', lambda rng: rng.choice(COLORS)),
+        ),
+    },
+    3: {
+        'title': 'Ноутбук',
+        'brands': ('Lenovo', 'ASUS', 'HP', 'Acer', 'Apple'),
+        'price': (30000, 250000),
+        'parameters': (
+            ('Диагональ (дюйм)', lambda rng: rng.choice((13.3, 14, 15.6, 16, 17.3))),
+            ('Оперативная память (Гб)', lambda rng: rng.choice((8, 16, 32, 64))),
+            ('Встроенная память (Гб)', lambda rng: rng.choice((256, 512, 1024, 2048))),
+            ('Процессор', lambda rng: rng.choice(('Intel Core i5', 'Intel Core i7', 'AMD Ryzen 5', 'AMD Ryzen 7'))),
+            ('Цвет', lambda rng: rng.choice(COLORS)),
+        ),
+    },
+}
+
+ORDER_STATES = ('new', 'confirmed', 'assembled', 'sent', 'delivered', 'canceled')
+
+CITIES = ('Москва', 'Санкт-Петербург', 'Самара', 'Казань', 'Новосибирск', 'Екатеринбург')
+
+STREETS = ('Ленина', 'Мира', 'Советская', 'Гагарина', 'Садовая')
+
+
+class CatalogGenerator:
+    """
+    Детерминированный генератор прайсов в формате data/shop1.yaml.
+
+    Каждый магазин предлагает skus товаров из общего пула размером pool_size, поэтому один и тот же
+    товар встречается у нескольких магазинов с разными ценами и остатками. Все значения зависят
+    только от seed и индексов, так что при одинаковых параметрах данные совпадают между запусками.
+    """
+
+    def __init__(self, seed=0, shops=10, skus=1000, parameters=4, pool_size=None):
+        self.seed = seed
+        self.shops = shops
+        self.skus = skus
+        self.parameters = parameters
+        self.pool_size = pool_size or skus * 2
+
+    def rng(self, *key):
+        """
+        Возвращает генератор случайных чисел, зависящий только от seed и ключа.
+        """
+        return random.Random('-'.join(str(part) for part in (self.seed,) + key))
+
+    def parameter_names(self, category_id):
+        """
+        Возвращает названия характеристик товаров категории с учетом заданного их количества.
+        """
+        names = [name for name, _ in CATEGORY_TEMPLATES[category_id]['parameters']][:self.parameters]
+        names += [f'Характеристика {i}' for i in range(len(names), self.parameters)]
+        return names
+
+    def all_parameter_names(self):
+        """
+        Возвращает названия всех характеристик, которые могут встретиться в прайсах.
+        """
+        names = []
+        for category_id, _ in CATEGORIES:
+            for name in self.parameter_names(category_id):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def product(self, index):
+        """
+        Возвращает товар из общего пула: категорию, название, модель, базовую цену и характеристики.
+        """
+        rng = self.rng('product', index)
+        category_id = CATEGORIES[index % len(CATEGORIES)][0]
+        template = CATEGORY_TEMPLATES[category_id]
+        brand = rng.choice(template['brands'])
+        line = f'{rng.choice("ABCDEGKMNSTXZ")}{rng.randint(1, 99)}'
+
+        parameters = {}
+        generators = dict(template['parameters'])
+        for name in self.parameter_names(category_id):
+            parameters[name] = generators[name](rng) if name in generators else rng.randint(1, 1000)
+
+        variant = ' '.join(str(value) for value in list(parameters.values())[:2])
+        return {
+            'category': category_id,
+            # артикул в названии делает пару (название, категория) уникальной, как ожидает импорт
+            'name': f'{template["title"]} {brand} {line} {variant}, арт. {index}',
+            'model': f'{brand.lower()}/{line.lower()}/{index}',
+            'price': rng.randint(*template['price']) // 10 * 10,
+            'parameters': parameters,
+        }
+
+    def shop_name(self, shop_index):
+        return f'Магазин {shop_index + 1}'
+
+    def shop_product_indexes(self, shop_index):
+        """
+        Возвращает индексы товаров пула, которые продает магазин.
+        """
+        rng = self.rng('shop', shop_index)
+        return sorted(rng.sample(range(self.pool_size), min(self.skus, self.pool_size)))
+
+    def iter_goods(self, shop_index):
+        """
+        Выдает товары магазина в формате раздела goods файла импорта.
+        """
+        for index in self.shop_product_indexes(shop_index):
+            product = self.product(index)
+            rng = self.rng('offer', shop_index, index)
+            price = int(product['price'] * rng.uniform(0.9, 1.1)) // 10 * 10
+            yield {
+                'id': 1000000 + index,
+                'category': product['category'],
+                'model': product['model'],
+                'name': product['name'],
+                'price': price,
+                'price_rrc': int(price * 1.07) // 10 * 10,
+                'quantity': rng.choice((0, rng.randint(1, 50))),
+                'parameters': product['parameters'],
+            }
+
+    def iter_price_list_yaml(self, shop_index):
+        """
+        Выдает прайс магазина в формате YAML фрагментами, не собирая его целиком в памяти.
+        """
+        yield dump_yaml({'shop': self.shop_name(shop_index)}, allow_unicode=True)
+        categories = [{'id': category_id, 'name': name} for category_id, name in CATEGORIES]
+        yield dump_yaml({'categories': categories}, allow_unicode=True, sort_keys=False)
+        yield 'goods:\n'
+        for item in self.iter_goods(shop_index):
+            yield dump_yaml([item], allow_unicode=True, sort_keys=False)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_catalog(generator, batch_size=5000, log=None):
+    """
+    Загружает магазины, категории, товары, предложения и характеристики напрямую в базу пачками bulk_create.
+
+    :param generator: CatalogGenerator
+    :param batch_size: размер пачки вставки
+    :param log: функция для вывода прогресса
+    :return: список id созданных предложений
+    """
+    log = log or (lambda message: None)
+    categories = {}
+    for category_id, name in CATEGORIES:
+        categories[category_id], _ = Category.objects.get_or_create(id=category_id, defaults={'name': name})
+
+    password = make_password(None)
+    partners = User.objects.bulk_create(
+        (User(email=f'partner{i}.s{generator.seed}@example.com', username=f'partner{i}', type='shop',
+              is_active=True, password=password) for i in range(generator.shops)), batch_size=batch_size)
+    shops = Shop.objects.bulk_create(
+        (Shop(name=generator.shop_name(i), user=partner) for i, partner in enumerate(partners)),
+        batch_size=batch_size)
+    Category.shops.through.objects.bulk_create(
+        [Category.shops.through(category_id=category_id, shop_id=shop.id)
+         for shop in shops for category_id in categories], ignore_conflicts=True, batch_size=batch_size)
+    ShopCategory.objects.bulk_create(
+        [ShopCategory(shop_id=shop.id, external_id=category_id, category_id=category_id)
+         for shop in shops for category_id in categories], ignore_conflicts=True, batch_size=batch_size)
+
+    product_ids = {}
+    parameter_values = {name: set() for name in generator.all_parameter_names()}
+    used_indexes = sorted({index for i in range(generator.shops) for index in generator.shop_product_indexes(i)})
+    for batch in _batches(used_indexes, batch_size):
+        products = [generator.product(index) for index in batch]
+        for product in products:
+            for name, value in product['parameters'].items():
+                parameter_values[name].add(str(value))
+        created = Product.objects.bulk_create(
+            Product(name=product['name'], category_id=product['category'],
+                    match_key=match_key(match_tokens(product['name'], product['model']))) for product in products)
+        product_ids.update((index, product.id) for index, product in zip(batch, created))
+    log(f'Товаров: {len(product_ids)}')
+    parameters = ParameterDictionary()
+    parameters.resolve(parameter_values)
+
+    offer_ids = []
+    for shop_index, shop in enumerate(shops):
+        goods = generator.iter_goods(shop_index)
+        for batch in _batches(goods, batch_size):
+            with transaction.atomic():
+                offers = ProductInfo.objects.bulk_create(
+                    ProductInfo(product_id=product_ids[item['id'] - 1000000], shop_id=shop.id,
+                                external_id=item['id'], model=item['model'], price=item['price'],
+                                price_rrc=item['price_rrc'], quantity=item['quantity'])
+                    for item in batch)
+                ProductParameter.objects.bulk_create(
+                    (ProductParameter(product_info_id=offer.id, parameter_id=parameters[name], value=value,
+                                      **parameters.typed(parameters[name], str(value)))
+                     for offer, item in zip(offers, batch) for name, value in item['parameters'].items()),
+                    batch_size=batch_size)
+            offer_ids.extend(offer.id for offer in offers)
+        log(f'{shop.name}: предложений {generator.skus}')
+    with transaction.atomic():
+        refresh_offers(product_ids.values())
+        recount_categories()
+    return offer_ids
+
+
+def load_orders(generator, offer_ids, buyers=100, orders=10, items=3, batch_size=5000, log=None):
+    """
+    Загружает покупателей с контактами, корзинами и историей заказов.
+
+    :param generator: CatalogGenerator (используется его seed)
+    :param offer_ids: id предложений, из которых собираются заказы
+    :param buyers: количество покупателей
+    :param orders: количество оформленных заказов у каждого покупателя
+    :param items: максимальное количество позиций в заказе
+    :param batch_size: размер пачки вставки
+    :param log: функция для вывода прогресса
+    :return: количество созданных заказов, включая корзины
+    """
+    log = log or (lambda message: None)
+    if not offer_ids:
+        return 0
+
+    password = make_password(None)
+    created_orders = 0
+    for batch in _batches(range(buyers), batch_size):
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(email=f'buyer{i}.s{generator.seed}@example.com', username=f'buyer{i}', is_active=True,
+                     password=password) for i in batch)
+            contacts = Contact.objects.bulk_create(
+                Contact(user=user, city=CITIES[i % len(CITIES)], street=STREETS[i % len(STREETS)],
+                        house=str(i % 100 + 1), phone=f'+7999{i:07d}') for i, user in zip(batch, users))
+
+            order_objects, plans = [], []
+            for i, user, contact in zip(batch, users, contacts):
+                rng = generator.rng('buyer', i)
+                for number in range(orders + 1):
+                    # последний заказ покупателя - его корзина
+                    state = 'basket' if number == orders else rng.choice(ORDER_STATES)
+                    order_objects.append(Order(user=user, state=state,
+                                               contact=None if state == 'basket' else contact))
+                    plans.append(rng.sample(offer_ids, min(rng.randint(1, items), len(offer_ids))))
+            order_objects = Order.objects.bulk_create(order_objects, batch_size=batch_size)
+
+            OrderItem.objects.bulk_create(
+                (OrderItem(order=order, product_info_id=offer_id, quantity=1 + offer_id % 3)
+                 for order, plan in zip(order_objects, plans) for offer_id in plan), batch_size=batch_size)
+        created_orders += len(order_objects)
+        log(f'Покупателей: {batch[-1] + 1}, заказов: {created_orders}')
+    return created_orders
@@ -0,0 +1,301 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .caching import bump_catalog_version
+from .categories import apply_category_deltas, link_shop_categories
+from .changes import lock_change_log, record_changes
+from .matching import ProductMatcher, match_key, match_tokens
+from .models import Shop, Category, ShopCategory, Product, ProductInfo, Parameter, ProductParameter
+from .offers import refresh_offers
+from .parameters import TEXT, clean_name, detect_type, infer_type, parameter_key, typed_columns
+
+# поля предложения, которые сравниваются с прайсом при повторном импорте
+OFFER_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+# поля, от которых зависит сводка предложений продукта (offers.py)
+SUMMARY_FIELDS = {'product_id', 'price', 'quantity'}
+
+# сколько строк пишется одним запросом при сохранении предложений и их характеристик
+WRITE_BATCH_SIZE = 500
+
+# ключ advisory-блокировки PostgreSQL, под которой импорты прайсов идут по одному: категории, продукты
+# и характеристики каталога общие для всех магазинов, и два импорта не должны создать их дважды
+IMPORT_LOCK = 41042
+
+
+def lock_import():
+    """
+    Берет блокировку импорта до конца текущей транзакции. Ее ждут только другие импорты, а оформление
+    заказов и смена статуса магазина ждут лишь короткую запись результата под блокировкой журнала.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [IMPORT_LOCK])
+
+
+class ParameterDictionary:
+    """
+    Справочник характеристик на время импорта: название из прайса -> id Parameter и тип значений.
+    Ключи всех характеристик загружаются одним запросом при создании.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.types = {}
+        self.names = {}
+        for key, parameter_id, value_type in Parameter.objects.values_list('key', 'id', 'value_type'):
+            self.ids[key] = parameter_id
+            self.types[parameter_id] = value_type
+
+    def resolve(self, values):
+        """
+        Находит id характеристик по названиям; характеристики с новыми ключами создает одной пачкой.
+        Тип новой характеристики определяется по ее значениям. Тип уже известной характеристики импорт
+        не меняет: значение, которое под него не подходит, сохраняется только текстом (fits).
+
+        :param values: словарь {название из прайса: значения этой характеристики}
+        """
+        missing = {}
+        for name in values:
+            if name not in self.names:
+                key = parameter_key(name)
+                if key in self.ids:
+                    self.names[name] = self.ids[key]
+                else:
+                    missing.setdefault(key, []).append(name)
+
+        if missing:
+            # параллельный импорт мог создать те же ключи, поэтому конфликты пропускаются и id перечитываются
+            Parameter.objects.bulk_create([
+                Parameter(name=clean_name(variants[0])[:40], key=key,
+                          value_type=infer_type(value for name in variants for value in values[name]))
+                for key, variants in missing.items()], ignore_conflicts=True)
+            for key, parameter_id, value_type in Parameter.objects.filter(key__in=missing).values_list(
+                    'key', 'id', 'value_type'):
+                self.ids[key] = parameter_id
+                self.types[parameter_id] = value_type
+            for key, variants in missing.items():
+                for name in variants:
+                    self.names[name] = self.ids[key]
+
+    def fits(self, parameter_id, value):
+        """
+        Проверяет, подходит ли значение под тип характеристики. Неподходящее значение хранится без
+        типизированных колонок и не участвует в фильтрах и сортировке по характеристике.
+        """
+        value_type = self.types[parameter_id]
+        return value_type == TEXT or detect_type(value) == value_type
+
+    def typed(self, parameter_id, value):
+        """
+        Возвращает значения типизированных колонок ProductParameter для значения характеристики.
+        """
+        return typed_columns(self.types[parameter_id], value)
+
+    def __getitem__(self, name):
+        return self.names[name]
+
+
+def resolve_categories(shop_id, categories):
+    """
+    Находит категории каталога для категорий прайса. Id категории в прайсе действует только внутри
+    магазина (ShopCategory): новая категория прайса присоединяется к категории каталога с тем же
+    названием и тем же родителем или создается.
+
+    :param shop_id: идентификатор магазина
+    :param categories: раздел categories прайса: id, name и необязательный parent - id родителя в прайсе
+    :return: словарь {id категории в прайсе: id категории каталога}
+    """
+    resolved = dict(ShopCategory.objects.filter(shop_id=shop_id).values_list('external_id', 'category_id'))
+    by_id = {category['id']: category for category in categories}
+    for category in categories:
+        # сначала разрешаются еще не известные предки категории, от корня вниз
+        chain = []
+        node = category
+        while node is not None and node['id'] not in resolved and node not in chain:
+            chain.append(node)
+            node = by_id.get(node.get('parent'))
+        for node in reversed(chain):
+            parent_id = resolved.get(node.get('parent'))
+            category_object = Category.objects.filter(name=node['name'], parent_id=parent_id).order_by('id').first()
+            if category_object is None:
+                category_object = Category.objects.create(name=node['name'], parent_id=parent_id)
+            ShopCategory.objects.create(shop_id=shop_id, external_id=node['id'], category=category_object)
+            resolved[node['id']] = category_object.id
+    return resolved
+
+
+def resolve_products(goods, categories):
+    """
+    Находит продукты для товаров прайса по нормализованным названию и модели (matching.py),
+    ненайденные продукты создает одной пачкой.
+
+    :return: кортеж (список id продуктов в порядке goods, количество созданных продуктов,
+        отчет о слияниях - товары, присоединенные к продукту с похожим, но не совпадающим названием)
+    """
+    matchers = {}
+    names = {}
+    pending = []
+    resolved = []
+    merged = []
+    for item in goods:
+        category_id = categories[item['category']]
+        matcher = matchers.get(category_id)
+        if matcher is None:
+            matcher = matchers[category_id] = ProductMatcher()
+            for product_id, name, key in Product.objects.filter(category_id=category_id).order_by(
+                    'id').values_list('id', 'name', 'match_key'):
+                matcher.add(product_id, frozenset(key.split()) if key else match_tokens(name))
+                names[product_id] = name
+
+        tokens = match_tokens(item['name'], item['model'])
+        product_id, score = matcher.match(tokens)
+        if product_id is None:
+            # новые продукты получают временные отрицательные id, чтобы с ними сопоставлялись
+            # следующие товары того же прайса
+            pending.append(Product(name=item['name'], category_id=category_id, match_key=match_key(tokens)))
+            product_id = -len(pending)
+            matcher.add(product_id, tokens)
+            names[product_id] = item['name']
+        elif score < 1:
+            merged.append({'id': item['id'], 'name': item['name'], 'product': product_id,
+                           'product_name': names[product_id], 'score': round(score, 2)})
+        resolved.append(product_id)
+
+    created = Product.objects.bulk_create(pending)
+    product_ids = [created[-product_id - 1].id if product_id < 0 else product_id for product_id in resolved]
+    for merge in merged:
+        if merge['product'] < 0:
+            merge['product'] = created[-merge['product'] - 1].id
+    return product_ids, created, merged
+
+
+def import_price(partner, data):
+    """
+    Импортирует прайс магазина (формат data/shop1.yaml) одной транзакцией.
+
+    Предложения сопоставляются с уже загруженными по external_id: новые добавляются, измененные
+    обновляются на месте, отсутствующие в прайсе удаляются, неизмененные не трогаются. Поэтому id
+    предложений сохраняются между импортами, и в журнал изменений попадает только реальная разница.
+    Сводки предложений пересчитываются только для продуктов, у которых изменились цены или остатки.
+    Товары присоединяются к уже известным продуктам с похожим названием (resolve_products), категории
+    прайса - к категориям каталога (resolve_categories), счетчики категорий меняются на разницу.
+
+    Сопоставление категорий, продуктов и характеристик идет под блокировкой импорта (lock_import),
+    а блокировка журнала берется только на запись предложений пачками и изменений в журнал.
+
+    :param partner: Идентификатор пользователя-магазина
+    :param data: Разобранный прайс
+    :return: Словарь с количеством добавленных, измененных и удаленных предложений, созданных
+        продуктов, отчетом о слияниях и значениями характеристик, не подходящими под их тип
+    """
+    with transaction.atomic():
+        lock_import()
+        shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=partner)
+        categories = resolve_categories(shop.id, data['categories'])
+        link_shop_categories(shop.id, [categories[category['id']] for category in data['categories']])
+
+        existing_parameters = {}
+        for product_info_id, parameter_id, value in ProductParameter.objects.filter(
+                product_info__shop_id=shop.id).values_list('product_info_id', 'parameter_id', 'value'):
+            existing_parameters.setdefault(product_info_id, {})[parameter_id] = value
+
+        product_ids, products_created, merged = resolve_products(data['goods'], categories)
+        parameter_values = {}
+        for item in data['goods']:
+            for name, value in item['parameters'].items():
+                parameter_values.setdefault(name, []).append(str(value))
+        parameters = ParameterDictionary()
+        parameters.resolve(parameter_values)
+        mismatched = [{'id': item['id'], 'parameter': name, 'value': str(value)}
+                      for item in data['goods'] for name, value in item['parameters'].items()
+                      if not parameters.fits(parameters[name], str(value))]
+
+        # остатки списываются при оформлении заказа, а статус магазина меняется под блокировкой журнала,
+        # поэтому предложения и статус читаются уже под ней
+        lock_change_log()
+        shop.refresh_from_db(fields=['state'])
+        existing = {offer.external_id: offer for offer in ProductInfo.objects.filter(shop_id=shop.id).annotate(
+            category_id=F('product__category_id'))}
+        # изменения счетчиков категорий: созданные продукты и предложения, добавленные в категорию или
+        # убранные из нее; предложения магазина, не принимающего заказы, в счетчиках не учитываются
+        products_delta, offers_delta = Counter(product.category_id for product in products_created), Counter()
+        created_offers = []
+        updated_offers = []
+        updated_fields = set()
+        # характеристики предложений: (предложение, {id характеристики: значение}) для записи и
+        # id предложений, старые характеристики которых удаляются
+        offer_parameters = []
+        replaced = []
+        # продукты, сводку предложений которых нужно пересчитать
+        touched = set()
+        for item, product_id in zip(data['goods'], product_ids):
+            fields = {'product_id': product_id, 'model': item['model'], 'price': item['price'],
+                      'price_rrc': item['price_rrc'], 'quantity': item['quantity']}
+            # варианты написания одной характеристики сводятся к одному id, последнее значение побеждает
+            item_parameters = {parameters[name]: str(value) for name, value in item['parameters'].items()}
+
+            offer = existing.pop(item['id'], None)
+            if offer is None:
+                offer = ProductInfo(shop_id=shop.id, external_id=item['id'], is_visible=shop.state, **fields)
+                created_offers.append(offer)
+                touched.add(offer.product_id)
+                offers_delta[categories[item['category']]] += 1
+            else:
+                changed_fields = [name for name in OFFER_FIELDS if getattr(offer, name) != fields[name]]
+                parameters_changed = item_parameters != existing_parameters.get(offer.id, {})
+                if not changed_fields and not parameters_changed:
+                    continue
+                if offer.category_id != categories[item['category']]:
+                    offers_delta[offer.category_id] -= 1
+                    offers_delta[categories[item['category']]] += 1
+                if SUMMARY_FIELDS.intersection(changed_fields):
+                    touched.update((offer.product_id, fields['product_id']))
+                for name in changed_fields:
+                    setattr(offer, name, fields[name])
+                updated_fields.update(changed_fields)
+                updated_offers.append(offer)
+                if not parameters_changed:
+                    continue
+                replaced.append(offer.id)
+            offer_parameters.append((offer, item_parameters))
+
+        # у новых предложений id появляются только после вставки, поэтому характеристики собираются после нее
+        ProductInfo.objects.bulk_create(created_offers, batch_size=WRITE_BATCH_SIZE)
+        if updated_fields:
+            ProductInfo.objects.bulk_update(updated_offers, sorted(updated_fields), batch_size=WRITE_BATCH_SIZE)
+        for start in range(0, len(replaced), WRITE_BATCH_SIZE):
+            ProductParameter.objects.filter(product_info_id__in=replaced[start:start + WRITE_BATCH_SIZE]).delete()
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info_id=offer.id, parameter_id=parameter_id, value=value,
+                             **parameters.typed(parameter_id, value))
+            for offer, item_parameters in offer_parameters for parameter_id, value in item_parameters.items()],
+            batch_size=WRITE_BATCH_SIZE)
+
+        changes = [(offer.id, shop.id, 'insert') for offer in created_offers]
+        changes.extend((offer.id, shop.id, 'update') for offer in updated_offers)
+        removed = [offer.id for offer in existing.values()]
+        if removed:
+            ProductInfo.objects.filter(id__in=removed).delete()
+            changes.extend((product_info_id, shop.id, 'delete') for product_info_id in removed)
+            touched.update(offer.product_id for offer in existing.values())
+            offers_delta.subtract(offer.category_id for offer in existing.values())
+        record_changes(changes)
+        refresh_offers(touched)
+        if not shop.state:
+            offers_delta.clear()
+        apply_category_deltas({category_id: (products_delta[category_id], offers_delta[category_id])
+                               for category_id in products_delta.keys() | offers_delta.keys()})
+
+    if changes:
+        bump_catalog_version()
+    return {
+        'inserted': len(created_offers),
+        'updated': len(updated_offers),
+        'deleted': len(removed),
+        'products_created': len(products_created),
+        'merged': merged,
+        'mismatched': mismatched,
+    }
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from backend_orders.benchmarks import percentile
+
+POOL_ENGINE = 'backend_orders.postgresql_pool'
+
+MODES = {
+    # новое соединение на каждый запрос, как при CONN_MAX_AGE=0
+    'none': {'CONN_MAX_AGE': 0},
+    # постоянное соединение с проверкой перед повторным использованием
+    'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True},
+    # пул соединений процесса
+    'pool': {'CONN_MAX_AGE': 0, 'ENGINE': POOL_ENGINE},
+}
+
+
+def simulate_requests(settings_dict, alias, requests):
+    """
+    Повторяет цикл запроса Django: проверка соединения в начале запроса, один SQL-запрос
+    и закрытие устаревшего соединения в конце.
+
+    :return: кортеж (список задержек в мс, количество открытых физических соединений)
+    """
+    wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+    timings = []
+    physical = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            if not any(raw is wrapper.connection for raw in physical):
+                physical.append(wrapper.connection)
+            wrapper.close_if_unusable_or_obsolete()
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        wrapper.close()
+        if settings_dict['ENGINE'] == POOL_ENGINE:
+            wrapper.get_pool().close_all()
+    return timings, len(physical)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает стоимость соединения с базой без постоянных соединений, с постоянными
+    соединениями и с пулом соединений.
+    """
+    help = 'Замер стоимости установки соединения с базой: без переиспользования, постоянные соединения и пул'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество имитируемых запросов')
+        parser.add_argument('--database', default='default', help='Псевдоним базы данных')
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES), help='Режимы замера')
+
+    def handle(self, *args, **options):
+        source = connections[options['database']]
+        self.stdout.write(f"{'mode':<12}{'avg ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'connections':>13}")
+        for mode in options['modes']:
+            if mode == 'pool' and source.vendor != 'postgresql':
+                self.stdout.write(self.style.WARNING(f'pool: пул доступен только для PostgreSQL, '
+                                                     f'текущая база - {source.vendor}'))
+                continue
+            settings_dict = {**source.settings_dict, **MODES[mode]}
+            timings, physical = simulate_requests(settings_dict, f"{options['database']}_{mode}",
+                                                  options['requests'])
+            self.stdout.write(f'{mode:<12}{sum(timings) / len(timings):>10.3f}{percentile(timings, 0.5):>10.3f}'
+                              f'{percentile(timings, 0.95):>10.3f}{physical:>13}')
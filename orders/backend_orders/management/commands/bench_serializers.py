@@ -0,0 +1,83 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, F
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from backend_orders.benchmarks import seed_dataset
+from backend_orders.models import ProductInfo, Order
+from backend_orders.projections import load_products, load_orders, load_product_columns
+from backend_orders.renderers import dumps, load_json
+from backend_orders.serializers import ProductInfoSerializer, OrderSerializer
+
+
+def best_of(function, repeat):
+    """
+    Возвращает лучшее время выполнения функции из repeat попыток, в мс.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def drf_products():
+    queryset = ProductInfo.objects.select_related('product__category').prefetch_related(
+        'product_parameters__parameter').order_by('id')
+    return JSONRenderer().render(ProductInfoSerializer(queryset, many=True).data)
+
+
+def drf_orders():
+    queryset = Order.objects.exclude(state='basket').prefetch_related(
+        'ordered_items__product_info__product__category',
+        'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+        total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+    return JSONRenderer().render(OrderSerializer(queryset, many=True).data)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает сериализаторы DRF с быстрой сериализацией projections на списках товаров
+    и заказов во временной тестовой базе.
+    """
+    help = 'Сравнение скорости ModelSerializer из DRF и сериализации через values() на больших списках'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество предложений и позиций заказов')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество повторов, берется лучшее время')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with tempfile.TemporaryDirectory() as export_root, override_settings(EXPORT_ROOT=export_root):
+                # в каждом заказе три позиции, поэтому позиций заказов примерно столько же, сколько предложений
+                seed_dataset(shops=2, offers=rows // 2, parameters=4, orders=rows // 3)
+                cases = (
+                    ('products', drf_products, lambda: dumps(load_products(ProductInfo.objects.all()))),
+                    ('orders', drf_orders, lambda: dumps(load_orders(Order.objects.exclude(state='basket')))),
+                )
+                self.stdout.write(f"{'list':<12}{'DRF ms':>12}{'projection ms':>16}{'speedup':>10}")
+                for name, drf, projection in cases:
+                    drf_ms = best_of(drf, options['repeat'])
+                    projection_ms = best_of(projection, options['repeat'])
+                    self.stdout.write(f'{name:<12}{drf_ms:>12.1f}{projection_ms:>16.1f}'
+                                      f'{drf_ms / projection_ms:>9.1f}x')
+
+                # колоночный формат списка товаров: размер ответа и время разбора на стороне клиента
+                products = dumps(load_products(ProductInfo.objects.all())).encode()
+                columns = dumps(load_product_columns(ProductInfo.objects.all())).encode()
+                self.stdout.write(f"\n{'format':<12}{'KB':>12}{'parse ms':>16}")
+                for name, content in (('json', products), ('columnar', columns)):
+                    parse_ms = best_of(lambda: load_json(content), options['repeat'])
+                    self.stdout.write(f'{name:<12}{len(content) / 1024:>12.1f}{parse_ms:>16.1f}')
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
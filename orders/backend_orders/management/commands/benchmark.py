@@ -0,0 +1,65 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from backend_orders.benchmarks import DEFAULT_SCALE, BASELINE_PATH, seed_dataset, run_benchmarks, load_baseline, \
+    save_baseline, compare_with_baseline
+
+
+class Command(BaseCommand):
+    """
+    Прогоняет все URL API на синтетических данных во временной тестовой базе и сравнивает
+    количество SQL-запросов с эталоном bench_baseline.json для текущей базы данных. Задержка и пиковая
+    память сравниваются, только если они есть в эталоне (локальный эталон, снятый с --with-timings).
+    """
+    help = 'Замеры SQL-запросов, задержки и памяти для всех URL API со сравнением с эталоном'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=DEFAULT_SCALE['shops'], help='Количество магазинов')
+        parser.add_argument('--offers', type=int, default=DEFAULT_SCALE['offers'],
+                            help='Количество предложений в магазине')
+        parser.add_argument('--parameters', type=int, default=DEFAULT_SCALE['parameters'],
+                            help='Количество характеристик у предложения')
+        parser.add_argument('--orders', type=int, default=DEFAULT_SCALE['orders'],
+                            help='Количество заказов покупателя')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз повторять каждый запрос')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Путь к файлу эталона')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Сохранить количество запросов и статусы как эталон для текущей базы данных')
+        parser.add_argument('--with-timings', action='store_true',
+                            help='Сохранить в эталон и задержку с памятью (для локального файла --baseline)')
+
+    def handle(self, *args, **options):
+        scale = {key: options[key] for key in DEFAULT_SCALE}
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        vendor = connection.vendor
+        try:
+            with tempfile.TemporaryDirectory() as export_root, override_settings(EXPORT_ROOT=export_root):
+                context = seed_dataset(**scale)
+                results = run_benchmarks(context, repeat=options['repeat'])
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        self.stdout.write(f"{'endpoint':<32}{'status':>8}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>10}")
+        for key, result in results.items():
+            self.stdout.write(f"{key:<32}{result['status']:>8}{result['queries']:>9}{result['p50_ms']:>10}"
+                              f"{result['p95_ms']:>10}{result['peak_kb']:>10}")
+
+        if options['update_baseline']:
+            save_baseline(results, scale, options['baseline'], vendor=vendor, timings=options['with_timings'])
+            self.stdout.write(self.style.SUCCESS(f"Эталон для базы {vendor} сохранен: {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline['scale'] != scale:
+            self.stdout.write(self.style.WARNING(f"Эталон снят на другом объеме данных: {baseline['scale']}"))
+        regressions = compare_with_baseline(results, baseline, vendor=vendor)
+        if regressions:
+            raise CommandError('Регрессии относительно эталона:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
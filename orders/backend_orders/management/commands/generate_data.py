@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from backend_orders.generator import CatalogGenerator, load_catalog, load_orders
+
+
+class Command(BaseCommand):
+    """
+    Генерирует детерминированные синтетические данные для нагрузочного тестирования: прайсы в формате
+    data/shop1.yaml и/или магазины, товары, покупателей, корзины и заказы прямо в базе.
+    """
+    help = 'Генерация синтетических прайсов и заказов для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора')
+        parser.add_argument('--shops', type=int, default=10, help='Количество магазинов')
+        parser.add_argument('--skus', type=int, default=1000, help='Количество предложений в магазине')
+        parser.add_argument('--parameters', type=int, default=4, help='Количество характеристик у товара')
+        parser.add_argument('--pool-size', type=int, default=None,
+                            help='Размер общего пула товаров (по умолчанию skus * 2)')
+        parser.add_argument('--buyers', type=int, default=100, help='Количество покупателей')
+        parser.add_argument('--orders', type=int, default=10, help='Количество заказов у покупателя')
+        parser.add_argument('--items', type=int, default=3, help='Максимальное количество позиций в заказе')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--yaml-dir', default=None, help='Каталог для записи прайсов в формате YAML')
+        parser.add_argument('--no-db', action='store_true', help='Не загружать данные в базу')
+
+    def handle(self, *args, **options):
+        generator = CatalogGenerator(seed=options['seed'], shops=options['shops'], skus=options['skus'],
+                                     parameters=options['parameters'], pool_size=options['pool_size'])
+        started = time.perf_counter()
+
+        if options['yaml_dir']:
+            directory = Path(options['yaml_dir'])
+            directory.mkdir(parents=True, exist_ok=True)
+            for shop_index in range(generator.shops):
+                path = directory / f'shop{shop_index + 1}.yaml'
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.writelines(generator.iter_price_list_yaml(shop_index))
+                self.stdout.write(f'Прайс записан: {path}')
+
+        if not options['no_db']:
+            offer_ids = load_catalog(generator, batch_size=options['batch_size'], log=self.stdout.write)
+            orders = load_orders(generator, offer_ids, buyers=options['buyers'], orders=options['orders'],
+                                 items=options['items'], batch_size=options['batch_size'], log=self.stdout.write)
+            self.stdout.write(f'Предложений: {len(offer_ids)}, заказов: {orders}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_orders.benchmarks import percentile
+
+
+def run_load(url, concurrency, total, headers, timeout):
+    """
+    Отправляет total GET-запросов на url из concurrency параллельных клиентов.
+
+    :return: словарь с пропускной способностью, перцентилями задержки и количеством ошибок
+    """
+    local = threading.local()
+    timings = []
+    errors = []
+
+    def request(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            response.content
+        except requests.RequestException as error:
+            errors.append(str(error))
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            errors.append(str(response.status_code))
+        timings.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, range(total)))
+    duration = time.perf_counter() - started
+
+    return {
+        'rps': round(len(timings) / duration, 1) if duration else 0,
+        'p50_ms': round(percentile(timings, 0.5), 1) if timings else None,
+        'p95_ms': round(percentile(timings, 0.95), 1) if timings else None,
+        'errors': len(errors),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест запущенного сервера: параллельные GET-запросы к одному или нескольким URL.
+
+    Для сравнения WSGI и ASGI один и тот же набор URL прогоняется против сервера, запущенного
+    одним процессом, например:
+        gunicorn orders.wsgi --workers 1 --threads 8 --bind 127.0.0.1:8000
+        uvicorn orders.asgi:application --workers 1 --port 8001
+    и затем
+        python manage.py loadtest http://127.0.0.1:8000/api/v1/basket http://127.0.0.1:8001/api/v1/async/basket \
+            --token <токен> --concurrency 100
+    """
+    help = 'Нагрузочный тест: пропускная способность и задержка GET-запросов к запущенному серверу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Полные URL для проверки')
+        parser.add_argument('--concurrency', type=int, default=50, help='Количество параллельных клиентов')
+        parser.add_argument('--requests', type=int, default=1000, help='Общее количество запросов на URL')
+        parser.add_argument('--token', help='Токен пользователя для заголовка Authorization')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут одного запроса, с')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency и --requests должны быть положительными')
+        headers = {'Authorization': f"Token {options['token']}"} if options['token'] else {}
+
+        self.stdout.write(f"{'url':<56}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for url in options['urls']:
+            result = run_load(url, options['concurrency'], options['requests'], headers, options['timeout'])
+            self.stdout.write(f"{url:<56}{result['rps']:>10}{str(result['p50_ms']):>10}"
+                              f"{str(result['p95_ms']):>10}{result['errors']:>8}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend_orders.categories import recount_categories
+from backend_orders.changes import lock_change_log
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает количество продуктов и предложений в категориях с нуля, например после изменения
+    товаров через панель управления или массовой загрузки в обход импорта.
+    """
+    help = 'Пересчет счетчиков продуктов и предложений в дереве категорий'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # импорт меняет счетчики под той же блокировкой, поэтому пересчет не смешается с его разницей
+            lock_change_log()
+            recount_categories()
+        self.stdout.write(self.style.SUCCESS('Счетчики категорий пересчитаны'))
@@ -0,0 +1,175 @@
+import re
+from math import ceil
+
+from django.conf import settings
+
+# Сопоставление товаров прайса с уже известными продуктами. Название и модель приводятся к набору
+# токенов: 'Смартфон Apple iPhone XR 64GB (красный)' и модель 'apple/iphone/xr' дают
+# {'смартфон', 'apple', 'iphone', 'xr', '64', 'gb', 'красныи'}. Совпадение набора - тот же продукт.
+# Иначе продукт ищется по инвертированному индексу токенов категории, а опечатки в словах
+# находятся через индекс триграмм словаря. Числа (объем памяти, диагональ) и короткие токены
+# моделей (xs, xr, gb, pro) - ключевые: они должны совпадать точно, поэтому ни варианты 64GB и 256GB,
+# ни модели iPhone XS и iPhone XR не сливаются, а кандидаты сразу ограничиваются продуктами с тем же
+# набором ключевых токенов.
+
+TOKEN_RE = re.compile(r'[a-zа-я]+|\d+')
+
+# минимальная похожесть слов по триграммам, чтобы считать их одним словом с опечаткой
+TOKEN_SIMILARITY = 0.6
+
+# слова короче этого - ключевые токены: у них слишком мало триграмм для сравнения с опечаткой,
+# и обычно это обозначение модели
+MIN_FUZZY_LENGTH = 4
+
+# группу продуктов с теми же числами меньше этого размера проще проверить целиком
+SMALL_GROUP_SIZE = 64
+
+
+def match_threshold():
+    """
+    Возвращает минимальную похожесть наборов токенов, при которой товар присоединяется к продукту.
+    """
+    return getattr(settings, 'PRODUCT_MATCH_THRESHOLD', 0.9)
+
+
+def tokenize(text):
+    """
+    Разбивает текст на токены: нижний регистр, ё и й заменены на е и и, буквы и цифры разделены.
+    """
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е').replace('й', 'и'))
+
+
+def match_tokens(name, model=''):
+    """
+    Возвращает набор токенов названия и модели товара.
+    """
+    return frozenset(tokenize(name)) | frozenset(tokenize(model or ''))
+
+
+def match_key(tokens):
+    """
+    Возвращает строку для точного сравнения наборов токенов (Product.match_key).
+    """
+    return ' '.join(sorted(tokens))
+
+
+def key_tokens(tokens):
+    """
+    Возвращает ключевые токены набора: числа и короткие слова, которые должны совпадать точно.
+    """
+    return frozenset(token for token in tokens if token.isdigit() or len(token) < MIN_FUZZY_LENGTH)
+
+
+def trigrams(token):
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductMatcher:
+    """
+    Индекс продуктов одной категории для поиска продукта по набору токенов.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = match_threshold() if threshold is None else threshold
+        self.keys = {}
+        self.tokens = {}
+        self.groups = {}
+        self.postings = {}
+        self.vocabulary = {}
+        self.trigram_counts = {}
+        self.similar_cache = {}
+
+    def add(self, product_id, tokens):
+        """
+        Добавляет продукт в индекс. Продукт с тем же набором токенов, что у уже добавленного, не индексируется.
+        """
+        key = match_key(tokens)
+        if key in self.keys:
+            return
+        self.keys[key] = product_id
+        self.tokens[product_id] = tokens
+        self.groups.setdefault(key_tokens(tokens), set()).add(product_id)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = set()
+                if not token.isdigit() and len(token) >= MIN_FUZZY_LENGTH:
+                    token_trigrams = trigrams(token)
+                    self.trigram_counts[token] = len(token_trigrams)
+                    for trigram in token_trigrams:
+                        self.vocabulary.setdefault(trigram, set()).add(token)
+                    self.similar_cache.clear()
+            posting.add(product_id)
+
+    def similar(self, token):
+        """
+        Возвращает слова индекса, совпадающие с token или отличающиеся от него опечаткой.
+        """
+        result = self.similar_cache.get(token)
+        if result is not None:
+            return result
+        result = {token} if token in self.postings else set()
+        if not token.isdigit() and len(token) >= MIN_FUZZY_LENGTH:
+            token_trigrams = trigrams(token)
+            shared = {}
+            for trigram in token_trigrams:
+                for candidate in self.vocabulary.get(trigram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            for candidate, count in shared.items():
+                if 2 * count / (len(token_trigrams) + self.trigram_counts[candidate]) >= TOKEN_SIMILARITY:
+                    result.add(candidate)
+        self.similar_cache[token] = result
+        return result
+
+    def score(self, tokens, product_tokens):
+        """
+        Возвращает похожесть наборов токенов (коэффициент Дайса), 0 - если не совпадают ключевые токены.
+        """
+        if key_tokens(tokens) != key_tokens(product_tokens):
+            return 0
+        matched = 0
+        unused = set(product_tokens)
+        for token in tokens:
+            if token in unused:
+                unused.discard(token)
+                matched += 1
+                continue
+            candidate = next((candidate for candidate in self.similar(token) if candidate in unused), None)
+            if candidate is not None:
+                unused.discard(candidate)
+                matched += 1
+        return 2 * matched / (len(tokens) + len(product_tokens))
+
+    def match(self, tokens):
+        """
+        Ищет продукт для набора токенов.
+
+        :return: кортеж (id продукта или None, похожесть); похожесть 1 - точное совпадение набора
+        """
+        product_id = self.keys.get(match_key(tokens))
+        if product_id is not None:
+            return product_id, 1.0
+        candidates = self.groups.get(key_tokens(tokens))
+        if not tokens or not candidates:
+            return None, 0
+
+        if len(candidates) > SMALL_GROUP_SIZE:
+            # у подходящего продукта совпадает не меньше required токенов, поэтому достаточно собрать
+            # кандидатов по самым редким len(tokens) - required + 1 токенам (префиксная фильтрация)
+            required = ceil(self.threshold * len(tokens) / (2 - self.threshold))
+            rare = sorted(tokens, key=lambda token: sum(len(self.postings[similar]) for similar in self.similar(token)))
+            prefix = set()
+            for token in rare[:max(len(tokens) - required + 1, 1)]:
+                for similar in self.similar(token):
+                    prefix |= self.postings[similar]
+            candidates = candidates & prefix
+
+        best_id, best_score = None, 0
+        for candidate in sorted(candidates):
+            score = self.score(tokens, self.tokens[candidate])
+            if score > best_score:
+                best_id, best_score = candidate, score
+        if best_score < self.threshold:
+            return None, best_score
+        return best_id, best_score
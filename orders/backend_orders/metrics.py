@@ -0,0 +1,429 @@
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import before_task_publish, task_prerun, task_postrun
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+from .authentication import resolve_user
+
+# границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# задачи Celery, которые составляют очередь писем
+EMAIL_TASKS = {'backend_orders.tasks.send_email', 'backend_orders.tasks.send_bulk_email'}
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """
+    Базовая метрика: значения хранятся в словаре по кортежу меток, изменение значения берет
+    короткую блокировку только этой метрики.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: ожидаются метки {self.labelnames}, переданы {tuple(labels)}')
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def add(self, amount, labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.start_flusher()
+
+    def samples(self):
+        with self.lock:
+            return [(key, list(value) if isinstance(value, list) else value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    """
+    Монотонно растущий счетчик.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Счетчик не может уменьшаться')
+        self.add(amount, labels)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. При объединении процессов значения складываются; для режима live
+    учитываются только живые процессы.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, mode='sum'):
+        self.mode = mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def inc(self, amount=1, **labels):
+        self.add(amount, labels)
+
+    def dec(self, amount=1, **labels):
+        self.add(-amount, labels)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+        self.registry.start_flusher()
+
+
+class Histogram(Metric):
+    """
+    Гистограмма: количество наблюдений по корзинам, их сумма и число.
+    Значение по кортежу меток - список [корзина_1, ..., корзина_n, сумма, количество].
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        self.registry.start_flusher()
+
+    def time(self, **labels):
+        """
+        Контекстный менеджер, который записывает длительность блока в гистограмму.
+        """
+        return _Timer(self, labels)
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
+        self.histogram.observe(self.elapsed, **self.labels)
+
+
+class Registry:
+    """
+    Реестр метрик процесса.
+
+    Если задана настройка METRICS_DIR, фоновый поток каждого процесса (воркера gunicorn или Celery)
+    раз в METRICS_FLUSH_INTERVAL секунд сохраняет его значения в файл METRICS_DIR/metrics_<pid>.json,
+    а при выдаче метрик файлы всех процессов объединяются. Обработка запроса файл не пишет.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.flush_lock = threading.Lock()
+        self.flusher_lock = threading.Lock()
+        self.flusher_pid = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self.metrics[metric.name] = metric
+
+    def directory(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        return Path(directory) if directory else None
+
+    def snapshot(self):
+        """
+        Возвращает значения метрик процесса: {имя: [[метки, значение], ...]}.
+        """
+        return {name: [[list(key), value] for key, value in metric.samples()]
+                for name, metric in self.metrics.items()}
+
+    def start_flusher(self):
+        """
+        Запускает поток сохранения значений, если в этом процессе его еще нет. Поток проверяется
+        по pid: после fork воркера gunicorn поток родительского процесса в нем не работает.
+        """
+        pid = os.getpid()
+        if self.flusher_pid == pid or self.directory() is None:
+            return
+        with self.flusher_lock:
+            if self.flusher_pid != pid:
+                self.flusher_pid = pid
+                threading.Thread(target=self.run_flusher, name='metrics-flusher', daemon=True).start()
+
+    def run_flusher(self):
+        while True:
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0))
+            self.flush()
+
+    def flush(self):
+        """
+        Атомарно записывает значения процесса в файл; без METRICS_DIR ничего не делает.
+        """
+        directory = self.directory()
+        if directory is None or not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f'metrics_{os.getpid()}.json'
+            temp_path = path.with_suffix('.tmp')
+            temp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(temp_path, path)
+        finally:
+            self.flush_lock.release()
+
+    def collect(self):
+        """
+        Объединяет значения всех процессов: счетчики и гистограммы складываются,
+        датчики в режиме live учитываются только для живых процессов.
+
+        :return: словарь {имя метрики: {кортеж меток: значение}}
+        """
+        directory = self.directory()
+        if directory is None:
+            return {name: dict(metric.samples()) for name, metric in self.metrics.items()}
+
+        self.flush()
+        merged = {name: {} for name in self.metrics}
+        for path in directory.glob('metrics_*.json'):
+            pid = int(path.stem.split('_')[1])
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                if metric.kind == 'gauge' and metric.mode == 'live' and not _process_alive(pid):
+                    continue
+                values = merged[name]
+                for key, value in samples:
+                    key = tuple(tuple(pair) for pair in key)
+                    if metric.kind == 'histogram':
+                        current = values.get(key)
+                        values[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    else:
+                        values[key] = values.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """
+        Возвращает все метрики в текстовом формате Prometheus.
+        """
+        collected = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(collected[name].items()):
+                if metric.kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    labels = _format_labels(key + (('le', _format_value(bound)),))
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(key)} {_format_value(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(key)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self.metrics.values():
+            with metric.lock:
+                metric.values.clear()
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+HTTP_REQUESTS = Counter('http_requests_total', 'Количество запросов к API', ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки запросов к API', ('route', 'method'))
+IMPORT_DURATION = Histogram('import_duration_seconds', 'Длительность импорта прайса', ('source',))
+IMPORT_ROWS = Counter('import_rows_total', 'Количество импортированных товаров', ('source',))
+IMPORT_ROWS_PER_SECOND = Gauge('import_rows_per_second', 'Скорость последнего импорта, товаров в секунду',
+                               ('source',), mode='live')
+EMAIL_QUEUE_DEPTH = Gauge('email_queue_depth', 'Количество писем в очереди Celery')
+TASK_LATENCY = Histogram('celery_task_duration_seconds', 'Время выполнения задач Celery', ('task', 'state'))
+DB_CONNECTIONS_OPENED = Counter('db_connections_opened_total', 'Количество открытых соединений с базой', ('alias',))
+DB_CONNECTIONS_IN_USE = Gauge('db_connections_in_use', 'Количество открытых соединений с базой после запроса',
+                              ('alias',), mode='live')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Обращения к кэшу', ('cache', 'result'))
+WEBHOOK_LATENCY = Histogram('webhook_delivery_seconds', 'Время доставки пачки событий на вебхук', ('webhook',))
+WEBHOOK_DELIVERIES = Counter('webhook_deliveries_total', 'Попытки доставки на вебхуки', ('result',))
+
+
+_MISSING = object()
+
+
+def cache_get(key, default=None, alias='default'):
+    """
+    Читает значение из кэша и учитывает попадание или промах в метрике cache_requests_total.
+    """
+    value = caches[alias].get(key, _MISSING)
+    CACHE_REQUESTS.inc(cache=alias, result='miss' if value is _MISSING else 'hit')
+    return default if value is _MISSING else value
+
+
+async def acache_get(key, default=None, alias='default'):
+    """
+    Асинхронный вариант cache_get.
+    """
+    value = await caches[alias].aget(key, _MISSING)
+    CACHE_REQUESTS.inc(cache=alias, result='miss' if value is _MISSING else 'hit')
+    return default if value is _MISSING else value
+
+
+def record_import(source, rows, elapsed):
+    """
+    Записывает длительность импорта прайса, количество товаров и скорость импорта.
+
+    :param source: откуда запущен импорт: task или view
+    :param rows: количество импортированных товаров
+    :param elapsed: длительность импорта в секундах
+    """
+    IMPORT_DURATION.observe(elapsed, source=source)
+    IMPORT_ROWS.inc(rows, source=source)
+    IMPORT_ROWS_PER_SECOND.set(rows / elapsed if elapsed else 0, source=source)
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы и время их обработки по маршрутам (имени URL) и отмечает количество
+    открытых соединений с базой.
+
+    Работает и в синхронной, и в асинхронной цепочке: под ASGI запрос не переключается
+    в поток ради middleware. Соединения считаются в потоке, где выполняется middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, elapsed):
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        HTTP_LATENCY.observe(elapsed, route=route, method=request.method)
+        for connection in connections.all(initialized_only=True):
+            DB_CONNECTIONS_IN_USE.set(int(connection.connection is not None), alias=connection.alias)
+
+
+def metrics_view(request):
+    """
+    Выдает метрики в текстовом формате Prometheus. Если задана настройка METRICS_TOKEN,
+    требуется заголовок Authorization: Bearer <токен>, иначе метрики доступны только персоналу:
+    в них маршруты API, задачи Celery и id вебхуков.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = request.META.get('HTTP_AUTHORIZATION') == f'Bearer {token}'
+    else:
+        user = resolve_user(request)
+        allowed = user is not None and user.is_staff
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@connection_created.connect
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.inc(alias=connection.alias)
+
+
+@before_task_publish.connect
+def count_email_enqueued(sender=None, **kwargs):
+    if sender in EMAIL_TASKS:
+        EMAIL_QUEUE_DEPTH.inc()
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_LATENCY.observe(time.perf_counter() - started, task=task.name, state=state or 'UNKNOWN')
+    if task.name in EMAIL_TASKS and not task.request.is_eager:
+        EMAIL_QUEUE_DEPTH.dec()
+    # воркер может долго простаивать, поэтому значения сохраняются сразу после задачи
+    REGISTRY.flush()
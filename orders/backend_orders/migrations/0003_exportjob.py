@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-19 09:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0002_alter_order_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('catalog', 'Прайс магазина'), ('orders', 'История заказов')], max_length=10, verbose_name='Тип выгрузки')),
+                ('file_format', models.CharField(choices=[('jsonl', 'JSON Lines'), ('csv', 'CSV')], default='jsonl', max_length=5, verbose_name='Формат')),
+                ('compression', models.CharField(choices=[('gzip', 'gzip'), ('zstd', 'zstd')], default='gzip', max_length=4, verbose_name='Сжатие')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=7, verbose_name='Статус')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Выгружено строк')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего строк')),
+                ('file', models.CharField(blank=True, max_length=255, verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка',
+                'verbose_name_plural': 'Список выгрузок',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-19 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='confirmemailtoken',
+            index=models.Index(fields=['user', 'key'], name='confirm_token_user_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-dt'], name='order_dt_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state', 'basket')), fields=['user'], name='order_basket_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'product'], name='productinfo_shop_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(condition=models.Q(('state', True)), fields=['id'], name='shop_active_idx'),
+        ),
+    ]
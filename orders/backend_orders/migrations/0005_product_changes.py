@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductInfoChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Номер изменения')),
+                ('product_info_id', models.BigIntegerField(verbose_name='ИД предложения')),
+                ('action', models.CharField(choices=[('insert', 'Добавлено'), ('update', 'Изменено'), ('delete', 'Удалено')], max_length=6, verbose_name='Изменение')),
+                ('dt', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_changes', to='backend_orders.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Изменение предложения',
+                'verbose_name_plural': 'Журнал изменений предложений',
+                'ordering': ('seq',),
+            },
+        ),
+    ]
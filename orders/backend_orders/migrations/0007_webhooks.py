@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0006_order_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Webhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Адрес')),
+                ('secret', models.CharField(max_length=64, verbose_name='Ключ подписи')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('last_seq', models.BigIntegerField(default=0, verbose_name='Последнее доставленное событие')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='Неудачных попыток подряд')),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Занят до')),
+                ('last_status', models.PositiveIntegerField(blank=True, null=True, verbose_name='Последний статус')),
+                ('last_latency_ms', models.FloatField(blank=True, null=True, verbose_name='Последняя задержка, мс')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhooks', to=settings.AUTH_USER_MODEL, verbose_name='Поставщик')),
+            ],
+            options={
+                'verbose_name': 'Вебхук',
+                'verbose_name_plural': 'Список вебхуков',
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_product_offers(apps, schema_editor):
+    """
+    Заполняет сводки по уже загруженным предложениям.
+    """
+    ProductInfo = apps.get_model('backend_orders', 'ProductInfo')
+    ProductOffers = apps.get_model('backend_orders', 'ProductOffers')
+    summary = {}
+    for product_id, offer_id, shop_id, price, quantity in ProductInfo.objects.filter(
+            shop__state=True, quantity__gt=0).order_by('id').values_list(
+            'product_id', 'id', 'shop_id', 'price', 'quantity').iterator(chunk_size=2000):
+        offers, shops = summary.setdefault(product_id, (ProductOffers(product_id=product_id), set()))
+        if offers.min_price is None or price < offers.min_price:
+            offers.min_price = price
+            offers.best_offer_id = offer_id
+        offers.quantity += quantity
+        shops.add(shop_id)
+    for offers, shops in summary.values():
+        offers.shop_count = len(shops)
+    ProductOffers.objects.bulk_create((offers for offers, _ in summary.values()), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0007_webhooks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductOffers',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='offers', serialize=False, to='backend_orders.product', verbose_name='Продукт')),
+                ('min_price', models.PositiveIntegerField(blank=True, null=True, verbose_name='Минимальная цена')),
+                ('shop_count', models.PositiveIntegerField(default=0, verbose_name='Магазинов в наличии')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Суммарный остаток')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+                ('best_offer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend_orders.productinfo', verbose_name='Лучшее предложение')),
+            ],
+            options={
+                'verbose_name': 'Сводка предложений',
+                'verbose_name_plural': 'Сводки предложений продуктов',
+            },
+        ),
+        migrations.RunPython(fill_product_offers, migrations.RunPython.noop),
+    ]
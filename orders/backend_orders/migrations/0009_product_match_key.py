@@ -0,0 +1,38 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:26
+
+from django.db import migrations, models
+
+from backend_orders.matching import match_key, match_tokens
+
+
+def fill_match_keys(apps, schema_editor):
+    """
+    Заполняет ключи сопоставления уже загруженных продуктов по названию и модели первого предложения.
+    """
+    Product = apps.get_model('backend_orders', 'Product')
+    ProductInfo = apps.get_model('backend_orders', 'ProductInfo')
+    models_by_product = dict(ProductInfo.objects.order_by('-id').values_list('product_id', 'model'))
+    products = []
+    for product in Product.objects.only('id', 'name').iterator(chunk_size=2000):
+        product.match_key = match_key(match_tokens(product.name, models_by_product.get(product.id, '')))
+        products.append(product)
+        if len(products) == 2000:
+            Product.objects.bulk_update(products, ['match_key'])
+            products = []
+    Product.objects.bulk_update(products, ['match_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0008_product_offers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='match_key',
+            field=models.TextField(blank=True, verbose_name='Ключ сопоставления'),
+        ),
+        migrations.RunPython(fill_match_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+from backend_orders.parameters import parameter_key
+
+
+def merge_parameters(apps, schema_editor):
+    """
+    Заполняет канонические ключи и сливает характеристики, которые отличаются только написанием:
+    значения переносятся на характеристику с меньшим id, дубли удаляются.
+    """
+    Parameter = apps.get_model('backend_orders', 'Parameter')
+    ProductParameter = apps.get_model('backend_orders', 'ProductParameter')
+    kept = {}
+    for parameter in Parameter.objects.order_by('id'):
+        key = parameter_key(parameter.name)
+        if key not in kept:
+            kept[key] = parameter.id
+            Parameter.objects.filter(id=parameter.id).update(key=key)
+            continue
+        target = kept[key]
+        # у предложения уже есть значение основной характеристики - дубль просто удаляется
+        ProductParameter.objects.filter(
+            parameter_id=parameter.id,
+            product_info_id__in=ProductParameter.objects.filter(parameter_id=target).values('product_info_id'),
+        ).delete()
+        ProductParameter.objects.filter(parameter_id=parameter.id).update(parameter_id=target)
+        parameter.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0009_product_match_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parameter',
+            name='key',
+            field=models.CharField(default='', max_length=100, verbose_name='Канонический ключ'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_parameters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # уникальность добавляется отдельной миграцией: в PostgreSQL нельзя менять таблицу
+    # в той же транзакции, где перенесены ссылки на нее с отложенной проверкой внешних ключей
+
+    dependencies = [
+        ('backend_orders', '0010_parameter_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parameter',
+            name='key',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Канонический ключ'),
+        ),
+    ]
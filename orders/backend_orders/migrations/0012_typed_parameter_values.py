@@ -0,0 +1,71 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+from backend_orders.parameters import TEXT, infer_type, typed_columns
+
+
+def fill_typed_values(apps, schema_editor):
+    """
+    Определяет тип каждой характеристики по ее значениям и заполняет типизированные колонки.
+    """
+    Parameter = apps.get_model('backend_orders', 'Parameter')
+    ProductParameter = apps.get_model('backend_orders', 'ProductParameter')
+    for parameter_id in Parameter.objects.values_list('id', flat=True):
+        values = ProductParameter.objects.filter(parameter_id=parameter_id)
+        value_type = infer_type(values.values_list('value', flat=True).iterator())
+        if value_type == TEXT:
+            continue
+        Parameter.objects.filter(id=parameter_id).update(value_type=value_type)
+        batch = []
+        for item in values.only('id', 'value').iterator(chunk_size=2000):
+            for name, value in typed_columns(value_type, item.value).items():
+                setattr(item, name, value)
+            batch.append(item)
+            if len(batch) >= 2000:
+                ProductParameter.objects.bulk_update(batch, ['value_number', 'value_width', 'value_height'])
+                batch = []
+        ProductParameter.objects.bulk_update(batch, ['value_number', 'value_width', 'value_height'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0011_parameter_key_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parameter',
+            name='value_type',
+            field=models.CharField(choices=[('number', 'Число'), ('dimension', 'Размер'), ('text', 'Текст')], default='text', max_length=10, verbose_name='Тип значений'),
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_height',
+            field=models.FloatField(blank=True, null=True, verbose_name='Размер: второе число'),
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_width',
+            field=models.FloatField(blank=True, null=True, verbose_name='Размер: первое число'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(condition=models.Q(('value_number__isnull', False)), fields=['parameter', 'value_number', 'product_info'], name='product_parameter_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(condition=models.Q(('value_width__isnull', False)), fields=['parameter', 'value_width', 'value_height', 'product_info'], name='product_parameter_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ),
+        migrations.RunPython(fill_typed_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_tree(apps, schema_editor):
+    """
+    Делает существующие категории корневыми, переносит связи магазинов с категориями в ShopCategory
+    (прежде id категории в прайсе совпадал с id категории каталога) и считает счетчики.
+    """
+    Category = apps.get_model('backend_orders', 'Category')
+    ShopCategory = apps.get_model('backend_orders', 'ShopCategory')
+    Product = apps.get_model('backend_orders', 'Product')
+    ProductInfo = apps.get_model('backend_orders', 'ProductInfo')
+    products = dict(Product.objects.values('category_id').annotate(count=Count('id')).order_by().values_list(
+        'category_id', 'count'))
+    offers = dict(ProductInfo.objects.filter(shop__state=True).values('product__category_id').annotate(
+        count=Count('id')).order_by().values_list('product__category_id', 'count'))
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = f'{category.id:010d}'
+        category.product_count = products.get(category.id, 0)
+        category.offer_count = offers.get(category.id, 0)
+    Category.objects.bulk_update(categories, ['path', 'product_count', 'offer_count'], batch_size=500)
+    ShopCategory.objects.bulk_create(
+        [ShopCategory(shop_id=link.shop_id, external_id=link.category_id, category_id=link.category_id)
+         for link in Category.shops.through.objects.all()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0012_typed_parameter_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+            ],
+            options={
+                'verbose_name': 'Категория магазина',
+                'verbose_name_plural': 'Список категорий магазинов',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='offer_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество предложений'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='backend_orders.category', verbose_name='Родительская категория'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=250, verbose_name='Путь'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество продуктов'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx'),
+        ),
+        migrations.AddField(
+            model_name='shopcategory',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='backend_orders.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='shopcategory',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_aliases', to='backend_orders.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddConstraint(
+            model_name='shopcategory',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_shop_category'),
+        ),
+        migrations.RunPython(fill_tree, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0013_category_tree'),
+    ]
+
+    # таблица backend_orders_category_shops уже создана для Category.shops; модель связи только
+    # описывает ее, в базе добавляется один индекс (shop, category)
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CategoryShop',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend_orders.category', verbose_name='Категория')),
+                        ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend_orders.shop', verbose_name='Магазин')),
+                    ],
+                    options={
+                        'verbose_name': 'Категория в прайсе магазина',
+                        'verbose_name_plural': 'Список категорий в прайсах магазинов',
+                        'db_table': 'backend_orders_category_shops',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='category',
+                    name='shops',
+                    field=models.ManyToManyField(blank=True, related_name='categories', through='backend_orders.CategoryShop', to='backend_orders.shop', verbose_name='Магазины'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='categoryshop',
+                    unique_together={('category', 'shop')},
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categoryshop',
+            index=models.Index(fields=['shop', 'category'], name='category_shop_shop_idx'),
+        ),
+    ]
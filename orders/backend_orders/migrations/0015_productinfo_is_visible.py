@@ -0,0 +1,36 @@
+# Generated by Django 4.1.13 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+def fill_visibility(apps, schema_editor):
+    """
+    Скрывает предложения магазинов, не принимающих заказы.
+    """
+    Shop = apps.get_model('backend_orders', 'Shop')
+    ProductInfo = apps.get_model('backend_orders', 'ProductInfo')
+    ProductInfo.objects.filter(shop_id__in=Shop.objects.filter(state=False).values('id')).update(is_visible=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0014_category_shop_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='is_visible',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Виден в каталоге'),
+        ),
+        migrations.RunPython(fill_visibility, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['id'], name='productinfo_visible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('is_visible', True)), fields=['product'], name='productinfo_visible_prod_idx'),
+        ),
+    ]
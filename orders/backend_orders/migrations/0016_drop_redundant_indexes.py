@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-19 11:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_orders', '0015_productinfo_is_visible'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='confirmemailtoken',
+            name='confirm_token_user_key_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_basket_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shop',
+            name='shop_active_idx',
+        ),
+    ]
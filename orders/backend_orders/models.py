@@ -1,10 +1,13 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
+from .parameters import TEXT, VALUE_TYPES, parameter_key
+
 STATE_CHOICES = (
     ('basket', 'Статус корзины'),
     ('new', 'Новый'),
@@ -15,6 +18,46 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+# допустимые переходы статусов заказа: корзина оформляется в новый заказ, дальше заказ идет по порядку
+# сборки и доставки; отменить можно до отправки, доставленный и отмененный заказы не меняются
+ORDER_TRANSITIONS = {
+    'basket': ('new',),
+    'new': ('confirmed', 'canceled'),
+    'confirmed': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+    'delivered': (),
+    'canceled': (),
+}
+
+EXPORT_KIND_CHOICES = (
+    ('catalog', 'Прайс магазина'),
+    ('orders', 'История заказов'),
+)
+
+EXPORT_FORMAT_CHOICES = (
+    ('jsonl', 'JSON Lines'),
+    ('csv', 'CSV'),
+)
+
+EXPORT_COMPRESSION_CHOICES = (
+    ('gzip', 'gzip'),
+    ('zstd', 'zstd'),
+)
+
+EXPORT_STATUS_CHOICES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Готово'),
+    ('failed', 'Ошибка'),
+)
+
+PRODUCT_CHANGE_CHOICES = (
+    ('insert', 'Добавлено'),
+    ('update', 'Изменено'),
+    ('delete', 'Удалено'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -186,6 +229,10 @@ class Shop(models.Model):
         return self.name
 
 
+# ширина сегмента пути категории: id категории, дополненный нулями
+CATEGORY_PATH_WIDTH = 10
+
+
 class Category(models.Model):
     """
     Модель категории.
@@ -193,19 +240,133 @@ class Category(models.Model):
     Атрибуты:
         name (str): название категории
         shops (QuerySet): связанные магазины
+        parent (Category): родительская категория, None - для корневой
+        path (str): материализованный путь - id всех предков и самой категории по CATEGORY_PATH_WIDTH цифр
+        product_count (int): количество продуктов в категории и всех вложенных
+        offer_count (int): количество предложений магазинов, принимающих заказы, в категории и всех вложенных
     """
     name = models.CharField(max_length=40, verbose_name='Название')
-    shops = models.ManyToManyField(Shop, verbose_name='Магазины', related_name='categories', blank=True)
+    shops = models.ManyToManyField(Shop, verbose_name='Магазины', related_name='categories', blank=True,
+                                   through='CategoryShop')
+    parent = models.ForeignKey('self', verbose_name='Родительская категория', related_name='children', null=True,
+                               blank=True, on_delete=models.CASCADE)
+    path = models.CharField(max_length=250, verbose_name='Путь', blank=True, editable=False)
+    product_count = models.PositiveIntegerField(verbose_name='Количество продуктов', default=0, editable=False)
+    offer_count = models.PositiveIntegerField(verbose_name='Количество предложений', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Категория'
         verbose_name_plural = "Список категорий"
         ordering = ('-name',)
+        indexes = [
+            # все категории поддерева - диапазон путей (Category.subtree_query)
+            models.Index(fields=['path'], name='category_path_idx'),
+        ]
+
+    @staticmethod
+    def subtree_query(path, field='path'):
+        """
+        Возвращает условие "категория в поддереве категории с путем path": диапазон от path до пути
+        следующей категории того же уровня. В отличие от LIKE 'path%' диапазон проходит по обычному
+        индексу при любой сортировке строк в базе.
+        """
+        head, tail = path[:-CATEGORY_PATH_WIDTH], int(path[-CATEGORY_PATH_WIDTH:])
+        return models.Q(**{f'{field}__gte': path, f'{field}__lt': f'{head}{tail + 1:0{CATEGORY_PATH_WIDTH}d}'})
+
+    @staticmethod
+    def path_ids(path):
+        """
+        Возвращает id категорий пути от корня до самой категории.
+        """
+        return [int(path[i:i + CATEGORY_PATH_WIDTH]) for i in range(0, len(path), CATEGORY_PATH_WIDTH)]
+
+    def clean(self):
+        """
+        Метод для проверки категории: родителем не может быть сама категория или вложенная в нее.
+        """
+        if self.id and self.parent_id and self.id in self.path_ids(
+                Category.objects.filter(id=self.parent_id).values_list('path', flat=True).first() or ''):
+            raise ValidationError({'parent': 'Категория не может быть вложена сама в себя'})
+
+    def save(self, *args, **kwargs):
+        """
+        Метод для сохранения категории. Путь вычисляется после получения id; при смене родителя
+        пути всех вложенных категорий переписываются, а счетчики поддерева переносятся к новым предкам.
+        """
+        super().save(*args, **kwargs)
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(id=self.parent_id).values_list('path', flat=True).first() or ''
+        path = f'{parent_path}{self.id:0{CATEGORY_PATH_WIDTH}d}'
+        if path == self.path:
+            return
+        old_path, self.path = self.path, path
+        Category.objects.filter(id=self.id).update(path=path)
+        if old_path:
+            descendants = list(Category.objects.filter(self.subtree_query(old_path)).exclude(id=self.id))
+            for category in descendants:
+                category.path = path + category.path[len(old_path):]
+            Category.objects.bulk_update(descendants, ['path'])
+            # счетчики поддерева переходят от старых предков к новым
+            products, offers = Category.objects.filter(id=self.id).values_list(
+                'product_count', 'offer_count').get()
+            Category.objects.filter(id__in=self.path_ids(old_path)[:-1]).update(
+                product_count=models.F('product_count') - products, offer_count=models.F('offer_count') - offers)
+            Category.objects.filter(id__in=self.path_ids(path)[:-1]).update(
+                product_count=models.F('product_count') + products, offer_count=models.F('offer_count') + offers)
 
     def __str__(self):
         return self.name
 
 
+class ShopCategory(models.Model):
+    """
+    Модель категории магазина: id категории в прайсе магазина и соответствующая ей категория каталога.
+    Атрибуты:
+        shop (Shop): магазин
+        external_id (int): id категории в прайсе магазина
+        category (Category): категория каталога
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='category_aliases', on_delete=models.CASCADE)
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='aliases',
+                                 on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = 'Категория магазина'
+        verbose_name_plural = "Список категорий магазинов"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_shop_category'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop} {self.external_id}: {self.category}'
+
+
+class CategoryShop(models.Model):
+    """
+    Модель связи категории с магазином, в прайсе которого она есть (таблица Category.shops).
+    Атрибуты:
+        category (Category): категория каталога
+        shop (Shop): магазин
+    """
+    category = models.ForeignKey(Category, verbose_name='Категория', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'backend_orders_category_shops'
+        verbose_name = 'Категория в прайсе магазина'
+        verbose_name_plural = "Список категорий в прайсах магазинов"
+        unique_together = (('category', 'shop'),)
+        indexes = [
+            # категории магазина читаются только из индекса, без обращения к таблице
+            models.Index(fields=['shop', 'category'], name='category_shop_shop_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop}: {self.category}'
+
+
 class Product(models.Model):
     """
     Модель продукта.
@@ -213,10 +374,12 @@ class Product(models.Model):
     Атрибуты:
         name (str): название продукта
         category (Category): категория продукта
+        match_key (str): нормализованные токены названия и модели для сопоставления товаров при импорте
     """
     name = models.CharField(max_length=80, verbose_name='Название')
     category = models.ForeignKey(Category, verbose_name='Категория', related_name='products', blank=True,
                                  on_delete=models.CASCADE)
+    match_key = models.TextField(verbose_name='Ключ сопоставления', blank=True)
 
     class Meta:
         verbose_name = 'Продукт'
@@ -239,6 +402,8 @@ class ProductInfo(models.Model):
         quantity (int): количество товара в наличии
         price (int): цена товара
         price_rrc (int): рекомендуемая розничная цена
+        is_visible (bool): предложение показывается в каталоге - копия статуса магазина (Shop.state),
+            чтобы каталог не соединял предложения с магазинами и не читал предложения отключенных магазинов
     """
     model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
     external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
@@ -249,6 +414,7 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    is_visible = models.BooleanField(verbose_name='Виден в каталоге', default=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -256,6 +422,43 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            # каталог фильтрует предложения по магазину и соединяет их с продуктом для фильтра по категории
+            models.Index(fields=['shop', 'product'], name='productinfo_shop_product_idx'),
+            # список каталога и предложения продукта читают только видимые предложения
+            models.Index(fields=['id'], condition=models.Q(is_visible=True), name='productinfo_visible_idx'),
+            models.Index(fields=['product'], condition=models.Q(is_visible=True), name='productinfo_visible_prod_idx'),
+        ]
+
+
+class ProductOffers(models.Model):
+    """
+    Модель сводки предложений продукта для сравнения цен между магазинами.
+    Учитываются предложения в наличии у магазинов, принимающих заказы. Сводка пересчитывается
+    при изменении предложений продукта (offers.py), чтобы не агрегировать предложения при чтении.
+    Атрибуты:
+        product (Product): продукт
+        best_offer (ProductInfo): самое дешевое предложение
+        min_price (int): минимальная цена, None - если предложений в наличии нет
+        shop_count (int): количество магазинов с товаром в наличии
+        quantity (int): суммарный остаток во всех магазинах
+        updated_at (datetime): дата и время пересчета
+    """
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='offers', primary_key=True,
+                                   on_delete=models.CASCADE)
+    best_offer = models.ForeignKey(ProductInfo, verbose_name='Лучшее предложение', related_name='+', null=True,
+                                   blank=True, on_delete=models.SET_NULL)
+    min_price = models.PositiveIntegerField(verbose_name='Минимальная цена', null=True, blank=True)
+    shop_count = models.PositiveIntegerField(verbose_name='Магазинов в наличии', default=0)
+    quantity = models.PositiveIntegerField(verbose_name='Суммарный остаток', default=0)
+    updated_at = models.DateTimeField(verbose_name='Пересчитано', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Сводка предложений'
+        verbose_name_plural = "Сводки предложений продуктов"
+
+    def __str__(self):
+        return f'{self.product_id}: от {self.min_price}'
 
 
 class Parameter(models.Model):
@@ -263,14 +466,26 @@ class Parameter(models.Model):
     Модель параметра, хранящего имя параметра.
     Атрибуты:
         name (str): название параметра
+        key (str): канонический ключ названия (parameters.parameter_key), общий для вариантов написания
+        value_type (str): тип значений (число, размер или текст), определяется при импорте
     """
     name = models.CharField(max_length=40, verbose_name='Название')
+    key = models.CharField(max_length=100, verbose_name='Канонический ключ', unique=True)
+    value_type = models.CharField(max_length=10, verbose_name='Тип значений', choices=VALUE_TYPES, default=TEXT)
 
     class Meta:
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ('-name',)
 
+    def save(self, *args, **kwargs):
+        """
+        Метод для сохранения параметра. Если ключ не задан, он вычисляется из названия.
+        """
+        if not self.key:
+            self.key = parameter_key(self.name)
+        return super().save(*args, **kwargs)
+
     def __str__(self):
         """
         Метод, возвращающий название параметра в виде строки.
@@ -285,6 +500,9 @@ class ProductParameter(models.Model):
         product_info (ProductInfo): информация о продукте
         parameter (Parameter): параметр продукта
         value (str): значение параметра продукта
+        value_number (float): значение числовой характеристики
+        value_width (float): первое число значения-размера
+        value_height (float): второе число значения-размера
     """
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='product_parameters', blank=True,
@@ -292,6 +510,9 @@ class ProductParameter(models.Model):
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    value_number = models.FloatField(verbose_name='Числовое значение', null=True, blank=True)
+    value_width = models.FloatField(verbose_name='Размер: первое число', null=True, blank=True)
+    value_height = models.FloatField(verbose_name='Размер: второе число', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -299,6 +520,15 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            # фильтры каталога по диапазону и точному значению характеристики (filters.CatalogQuery);
+            # product_info в конце индекса позволяет найти предложения без чтения таблицы
+            models.Index(fields=['parameter', 'value_number', 'product_info'], condition=models.Q(
+                value_number__isnull=False), name='product_parameter_number_idx'),
+            models.Index(fields=['parameter', 'value_width', 'value_height', 'product_info'], condition=models.Q(
+                value_width__isnull=False), name='product_parameter_size_idx'),
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ]
 
 
 class Contact(models.Model):
@@ -350,7 +580,7 @@ class Order(models.Model):
                              related_name='orders', blank=True,
                              on_delete=models.CASCADE)
     dt = models.DateTimeField(auto_now_add=True)
-    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15, db_index=True)
     contact = models.ForeignKey(Contact, verbose_name='Контакт',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
@@ -359,6 +589,12 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказ"
         ordering = ('-dt',)
+        indexes = [
+            # заказы пользователя без корзины и заказы по статусу
+            models.Index(fields=['user', 'state'], name='order_user_state_idx'),
+            # сортировка списков заказов по умолчанию
+            models.Index(fields=['-dt'], name='order_dt_desc_idx'),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -386,3 +622,139 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'product_info'], name='unique_order_item'),
         ]
+
+
+class ExportJob(models.Model):
+    """
+    Модель фоновой выгрузки в сжатый файл.
+    Атрибуты:
+        user (User): пользователь, запросивший выгрузку
+        kind (str): что выгружается - прайс магазина или история заказов
+        file_format (str): формат файла (JSON Lines или CSV)
+        compression (str): алгоритм сжатия файла
+        status (str): состояние выгрузки
+        rows (int): количество уже выгруженных строк
+        total_rows (int): ожидаемое количество строк
+        file (str): имя файла в каталоге EXPORT_ROOT
+        error (str): текст ошибки, если выгрузка не удалась
+        created_at (datetime): дата и время создания выгрузки
+        finished_at (datetime): дата и время завершения выгрузки
+    """
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='export_jobs',
+                             on_delete=models.CASCADE)
+    kind = models.CharField(verbose_name='Тип выгрузки', choices=EXPORT_KIND_CHOICES, max_length=10)
+    file_format = models.CharField(verbose_name='Формат', choices=EXPORT_FORMAT_CHOICES, max_length=5,
+                                   default='jsonl')
+    compression = models.CharField(verbose_name='Сжатие', choices=EXPORT_COMPRESSION_CHOICES, max_length=4,
+                                   default='gzip')
+    status = models.CharField(verbose_name='Статус', choices=EXPORT_STATUS_CHOICES, max_length=7,
+                              default='pending')
+    rows = models.PositiveIntegerField(verbose_name='Выгружено строк', default=0)
+    total_rows = models.PositiveIntegerField(verbose_name='Всего строк', null=True, blank=True)
+    file = models.CharField(verbose_name='Файл', max_length=255, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана', auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = "Список выгрузок"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.id}'
+
+
+class ProductInfoChange(models.Model):
+    """
+    Модель журнала изменений предложений для ленты изменений каталога.
+    Атрибуты:
+        seq (int): монотонно возрастающий номер изменения (курсор ленты)
+        product_info_id (int): идентификатор предложения; ссылки нет, т.к. предложение может быть удалено
+        shop (Shop): магазин предложения
+        action (str): что произошло с предложением
+        dt (datetime): дата и время изменения
+    """
+    seq = models.BigAutoField(primary_key=True, verbose_name='Номер изменения')
+    product_info_id = models.BigIntegerField(verbose_name='ИД предложения')
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_changes',
+                             on_delete=models.CASCADE)
+    action = models.CharField(verbose_name='Изменение', choices=PRODUCT_CHANGE_CHOICES, max_length=6)
+    dt = models.DateTimeField(verbose_name='Дата', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Изменение предложения'
+        verbose_name_plural = "Журнал изменений предложений"
+        ordering = ('seq',)
+
+    def __str__(self):
+        return f'#{self.seq} {self.get_action_display()} {self.product_info_id}'
+
+
+class OrderEvent(models.Model):
+    """
+    Модель события смены статуса заказа для push-уведомлений (long-poll и SSE).
+    Событие записывается отдельно для каждого получателя: покупателя и поставщиков товаров заказа.
+    Атрибуты:
+        seq (int): монотонно возрастающий номер события (курсор)
+        user (User): получатель события
+        order (Order): заказ
+        state (str): новый статус заказа
+        dt (datetime): дата и время события
+    """
+    seq = models.BigAutoField(primary_key=True, verbose_name='Номер события')
+    user = models.ForeignKey(User, verbose_name='Получатель', related_name='order_events', on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='events', on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    dt = models.DateTimeField(verbose_name='Дата', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = "Список событий заказов"
+        ordering = ('seq',)
+        indexes = [
+            # клиент читает только свои события после курсора
+            models.Index(fields=['user', 'seq'], name='order_event_user_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.seq} {self.order_id}: {self.state}'
+
+
+class Webhook(models.Model):
+    """
+    Модель адреса, на который поставщику отправляются события заказов с его товарами.
+    Атрибуты:
+        user (User): поставщик
+        url (str): адрес для POST-запросов
+        secret (str): ключ подписи тела запроса (HMAC-SHA256)
+        is_active (bool): отправка включена; отключается после серии неудачных попыток
+        last_seq (int): номер последнего доставленного события OrderEvent
+        failures (int): количество неудачных попыток подряд
+        next_attempt_at (datetime): время следующей попытки после неудачи
+        locked_until (datetime): до какого времени адрес занят отправкой
+        last_status (int): HTTP-статус последней попытки
+        last_latency_ms (float): длительность последней попытки, мс
+        last_error (str): текст последней ошибки
+        created_at (datetime): дата и время создания
+    """
+    user = models.ForeignKey(User, verbose_name='Поставщик', related_name='webhooks', on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Адрес')
+    secret = models.CharField(verbose_name='Ключ подписи', max_length=64)
+    is_active = models.BooleanField(verbose_name='Активен', default=True)
+    last_seq = models.BigIntegerField(verbose_name='Последнее доставленное событие', default=0)
+    failures = models.PositiveIntegerField(verbose_name='Неудачных попыток подряд', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', null=True, blank=True)
+    locked_until = models.DateTimeField(verbose_name='Занят до', null=True, blank=True)
+    last_status = models.PositiveIntegerField(verbose_name='Последний статус', null=True, blank=True)
+    last_latency_ms = models.FloatField(verbose_name='Последняя задержка, мс', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создан', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Вебхук'
+        verbose_name_plural = "Список вебхуков"
+        ordering = ('id',)
+
+    def __str__(self):
+        return self.url
@@ -0,0 +1,78 @@
+from django.db.models import F
+
+from .models import ProductInfo, ProductOffers
+
+# Сводка предложений продукта для сравнения цен между магазинами: лучшее предложение, минимальная
+# цена, количество магазинов и суммарный остаток. Сводка пересчитывается только для продуктов,
+# предложения которых изменились (импорт прайса, списание остатков, включение и отключение магазина),
+# поэтому карточка сравнения и сортировка каталога читают готовые числа без GROUP BY.
+# Пересчет идет в транзакции изменения под блокировкой журнала (changes.lock_change_log), и две
+# транзакции не перезапишут сводку одного продукта по устаревшим данным.
+
+# сколько продуктов пересчитывается одним запросом
+REFRESH_BATCH_SIZE = 500
+
+# варианты сортировки каталога ?sort=; сортировки по сводке ставят продукты без предложений в конце
+CATALOG_ORDERINGS = {
+    'price': (F('price').asc(),),
+    '-price': (F('price').desc(),),
+    'min_price': (F('product__offers__min_price').asc(nulls_last=True), F('price').asc()),
+    'shops': (F('product__offers__shop_count').desc(nulls_last=True), F('price').asc()),
+}
+
+
+def refresh_offers(product_ids):
+    """
+    Пересчитывает сводку предложений продуктов. Вызывается внутри транзакции, которая меняет предложения.
+    """
+    product_ids = sorted(set(product_ids))
+    for start in range(0, len(product_ids), REFRESH_BATCH_SIZE):
+        batch = product_ids[start:start + REFRESH_BATCH_SIZE]
+        summary = {product_id: ProductOffers(product_id=product_id) for product_id in batch}
+        shops = {product_id: set() for product_id in batch}
+        for product_id, offer_id, shop_id, price, quantity in ProductInfo.objects.filter(
+                product_id__in=batch, is_visible=True, quantity__gt=0).order_by('id').values_list(
+                'product_id', 'id', 'shop_id', 'price', 'quantity'):
+            offers = summary[product_id]
+            if offers.min_price is None or price < offers.min_price:
+                offers.min_price = price
+                offers.best_offer_id = offer_id
+            offers.quantity += quantity
+            shops[product_id].add(shop_id)
+        for product_id, offers in summary.items():
+            offers.shop_count = len(shops[product_id])
+        ProductOffers.objects.bulk_create(summary.values(), update_conflicts=True, unique_fields=['product'],
+                                          update_fields=['best_offer', 'min_price', 'shop_count', 'quantity',
+                                                         'updated_at'])
+
+
+def refresh_shop_offers(shop_ids):
+    """
+    Пересчитывает сводки всех продуктов магазинов, например при включении или отключении приема заказов.
+    """
+    refresh_offers(ProductInfo.objects.filter(shop_id__in=shop_ids).values_list('product_id', flat=True).distinct())
+
+
+def load_offers(product_info_id):
+    """
+    Возвращает сводку и предложения в наличии того же продукта, что и предложение product_info_id,
+    от самого дешевого; None - если предложение не найдено или его магазин не принимает заказы.
+    """
+    product = ProductInfo.objects.filter(id=product_info_id, is_visible=True).values_list(
+        'product_id', 'product__name', 'product__category__name', 'product__offers__best_offer_id',
+        'product__offers__min_price', 'product__offers__shop_count', 'product__offers__quantity').first()
+    if product is None:
+        return None
+    product_id, name, category, best_offer, min_price, shop_count, quantity = product
+    offers = ProductInfo.objects.filter(product_id=product_id, is_visible=True, quantity__gt=0).order_by(
+        'price', 'id').values_list('id', 'shop_id', 'shop__name', 'model', 'price', 'price_rrc', 'quantity')
+    return {
+        'product': {'name': name, 'category': category},
+        'best_offer': best_offer,
+        'min_price': min_price,
+        'shop_count': shop_count or 0,
+        'quantity': quantity or 0,
+        'offers': [{'id': offer_id, 'shop': shop_id, 'shop_name': shop_name, 'model': model, 'price': price,
+                    'price_rrc': price_rrc, 'quantity': offer_quantity}
+                   for offer_id, shop_id, shop_name, model, price, price_rrc, offer_quantity in offers],
+    }
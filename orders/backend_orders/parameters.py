@@ -0,0 +1,111 @@
+import re
+from functools import lru_cache
+
+# Справочник названий характеристик. Поставщики пишут одну характеристику по-разному:
+# 'Диагональ (дюйм)', 'диагональ, дюймы', 'ДИАГОНАЛЬ  (")'. Название приводится к каноническому
+# ключу (Parameter.key): регистр, пробелы, ё и единица измерения в скобках или после запятой,
+# и все варианты ссылаются на одну строку Parameter. Ключ сырого названия вычисляется один раз
+# на процесс (lru_cache), справочник ключей загружается одним запросом на импорт
+# (importer.ParameterDictionary), поэтому характеристика товара находится поиском в словаре.
+# Значение хранится строкой и, по типу характеристики, в типизированных колонках ProductParameter
+# (число или размер вида 2688x1242), чтобы фильтры по диапазону шли по индексу без приведения строк.
+
+# синонимы единиц измерения -> каноническое написание
+UNIT_ALIASES = {
+    'дюйм': 'дюйм', 'дюйма': 'дюйм', 'дюймы': 'дюйм', 'дюймов': 'дюйм', '"': 'дюйм', 'in': 'дюйм', 'inch': 'дюйм',
+    'гб': 'гб', 'gb': 'гб', 'гбайт': 'гб', 'гигабайт': 'гб',
+    'мб': 'мб', 'mb': 'мб', 'мбайт': 'мб', 'мегабайт': 'мб',
+    'тб': 'тб', 'tb': 'тб', 'тбайт': 'тб', 'терабайт': 'тб',
+    'пикс': 'пикс', 'px': 'пикс', 'пиксель': 'пикс', 'пикселей': 'пикс', 'пикс.': 'пикс',
+    'мп': 'мп', 'mp': 'мп', 'мпикс': 'мп', 'мегапиксель': 'мп',
+    'мм': 'мм', 'mm': 'мм', 'см': 'см', 'cm': 'см',
+    'г': 'г', 'гр': 'г', 'g': 'г', 'кг': 'кг', 'kg': 'кг',
+    'вт': 'вт', 'w': 'вт', 'мач': 'мач', 'mah': 'мач', 'ма*ч': 'мач',
+    'гц': 'гц', 'hz': 'гц', 'мгц': 'мгц', 'mhz': 'мгц', 'ггц': 'ггц', 'ghz': 'ггц',
+}
+
+# типы значений характеристики (Parameter.value_type)
+NUMBER = 'number'
+DIMENSION = 'dimension'
+TEXT = 'text'
+VALUE_TYPES = ((NUMBER, 'Число'), (DIMENSION, 'Размер'), (TEXT, 'Текст'))
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+NUMBER_RE = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')
+
+# размер из двух чисел: 2688x1242, 1920 х 1080 (кириллицей), 40×60
+DIMENSION_RE = re.compile(r'^(\d+(?:[.,]\d+)?)\s*[xх×*]\s*(\d+(?:[.,]\d+)?)$')
+
+# единица в скобках в конце названия или известная единица после последней запятой
+UNIT_RE = re.compile(r'^(?P<base>.+?)\s*(?:\((?P<paren>[^()]*)\)|,\s*(?P<comma>[^,()]+))$')
+
+
+def clean_name(name):
+    """
+    Убирает лишние пробелы в названии характеристики для отображения.
+    """
+    return WHITESPACE_RE.sub(' ', str(name)).strip()
+
+
+@lru_cache(maxsize=4096)
+def parameter_key(name):
+    """
+    Возвращает канонический ключ названия характеристики: у 'Диагональ (дюйм)', ' диагональ,  дюймы '
+    и 'ДИАГОНАЛЬ (")' ключ один - 'диагональ (дюйм)'.
+    """
+    name = clean_name(name).casefold().replace('ё', 'е')
+    match = UNIT_RE.match(name)
+    if match:
+        if match.group('paren') is not None:
+            unit = match.group('paren').strip()
+            name = f"{match.group('base').rstrip(' ,')} ({UNIT_ALIASES.get(unit, unit)})"
+        elif match.group('comma').strip() in UNIT_ALIASES:
+            name = f"{match.group('base').rstrip(' ,')} ({UNIT_ALIASES[match.group('comma').strip()]})"
+    return name
+
+
+def parse_number(value):
+    """
+    Возвращает число из строки вида '6.5' или '6,5', None - если строка не число.
+    """
+    value = str(value).strip()
+    return float(value.replace(',', '.')) if NUMBER_RE.match(value) else None
+
+
+def parse_dimension(value):
+    """
+    Возвращает пару чисел из строки вида '2688x1242', None - если строка не размер.
+    """
+    match = DIMENSION_RE.match(str(value).strip().lower())
+    if match is None:
+        return None
+    return float(match[1].replace(',', '.')), float(match[2].replace(',', '.'))
+
+
+def detect_type(value):
+    """
+    Возвращает тип одного значения характеристики.
+    """
+    if parse_number(value) is not None:
+        return NUMBER
+    if parse_dimension(value) is not None:
+        return DIMENSION
+    return TEXT
+
+
+def infer_type(values):
+    """
+    Возвращает тип характеристики по ее значениям: число или размер, только если под него подходят все значения.
+    """
+    types = {detect_type(value) for value in values}
+    return types.pop() if len(types) == 1 else TEXT
+
+
+def typed_columns(value_type, value):
+    """
+    Возвращает значения типизированных колонок ProductParameter для значения характеристики типа value_type.
+    """
+    number = parse_number(value) if value_type == NUMBER else None
+    width, height = (parse_dimension(value) if value_type == DIMENSION else None) or (None, None)
+    return {'value_number': number, 'value_width': width, 'value_height': height}
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# пулы процесса по псевдониму базы; pid в ключе нужен, чтобы не делить соединения с родителем после fork
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 в пределах процесса.
+
+    Одновременно выдается не больше size соединений; если все заняты, запрос ждет освобождения
+    до timeout секунд. Соединение, пролежавшее в пуле дольше check_after секунд, перед выдачей
+    проверяется запросом SELECT 1.
+    """
+
+    def __init__(self, size, timeout=10.0, check_after=30.0):
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, connect):
+        """
+        Выдает свободное соединение из пула или открывает новое функцией connect.
+
+        :param connect: функция без аргументов, которая открывает новое соединение
+        :return: кортеж (соединение, уровень изоляции, с которым оно было открыто)
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'Нет свободных соединений в пуле за {self.timeout} с')
+        try:
+            while True:
+                with self.lock:
+                    entry = self.idle.pop() if self.idle else None
+                if entry is None:
+                    return connect()
+                connection, isolation_level, released_at = entry
+                if self.is_usable(connection, time.monotonic() - released_at):
+                    return connection, isolation_level
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection, isolation_level, discard=False):
+        """
+        Возвращает соединение в пул. Закрытые, сломанные и оставленные посреди транзакции
+        соединения закрываются.
+        """
+        try:
+            if discard or connection.closed or connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                self.discard(connection)
+            else:
+                with self.lock:
+                    self.idle.append((connection, isolation_level, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    def is_usable(self, connection, idle_for):
+        if connection.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self.lock:
+            while self.idle:
+                self.discard(self.idle.pop()[0])
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд PostgreSQL, который берет соединения из пула процесса вместо открытия нового
+    соединения на каждый запрос и возвращает их в пул при закрытии.
+
+    Размер пула, время ожидания и интервал проверки задаются в DATABASES[...]['POOL']:
+    {'SIZE': 10, 'TIMEOUT': 10, 'CHECK_AFTER': 30}. CONN_MAX_AGE при этом должен быть 0,
+    чтобы соединение возвращалось в пул в конце каждого запроса.
+    """
+
+    def get_pool(self):
+        key = (os.getpid(), self.alias)
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = self.settings_dict.get('POOL', {})
+                pool = _pools[key] = ConnectionPool(size=options.get('SIZE', 10),
+                                                    timeout=options.get('TIMEOUT', 10.0),
+                                                    check_after=options.get('CHECK_AFTER', 30.0))
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        def connect():
+            connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+            return connection, self.isolation_level
+
+        connection, self.isolation_level = self.get_pool().acquire(connect)
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is None:
+            return
+        # при закрытии внутри atomic() Django оставляет ссылку на соединение до следующего connect(),
+        # поэтому такое соединение нельзя возвращать в пул
+        discard = self.in_atomic_block or self.errors_occurred
+        with self.wrap_database_errors:
+            self.get_pool().release(self.connection, self.isolation_level, discard=discard)
@@ -0,0 +1,299 @@
+import cProfile
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+from .authentication import resolve_user
+
+# профиль текущего запроса; None, если запрос не попал в выборку
+current_profile = ContextVar('current_profile', default=None)
+
+# сколько самых медленных запросов хранится для каждого представления
+SLOW_SAMPLES = 5
+
+
+class RequestProfile:
+    """
+    Замеры одного запроса: SQL-запросы, время сериализации и отрисовки.
+    """
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.sql_templates = Counter()
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.view_finished = None
+
+    def duplicates(self):
+        """
+        Возвращает SQL-шаблоны, выполненные больше одного раза, и число их повторов.
+        """
+        return {sql: count for sql, count in self.sql_templates.items() if count > 1}
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Обертка для connection.execute_wrapper: считает количество и время SQL-запросов.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_templates[sql] += 1
+
+
+class ProfileStore:
+    """
+    Накопленная статистика по представлениям в пределах процесса.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def add(self, view, method, wall_time, profile, render_time):
+        duplicates = profile.duplicates()
+        with self.lock:
+            stat = self.stats.setdefault((view, method), {
+                'count': 0, 'wall_time': 0.0, 'wall_time_max': 0.0, 'sql_count': 0, 'sql_time': 0.0,
+                'serializer_time': 0.0, 'render_time': 0.0, 'duplicate_queries': 0, 'slowest': [],
+            })
+            stat['count'] += 1
+            stat['wall_time'] += wall_time
+            stat['wall_time_max'] = max(stat['wall_time_max'], wall_time)
+            stat['sql_count'] += profile.sql_count
+            stat['sql_time'] += profile.sql_time
+            stat['serializer_time'] += profile.serializer_time
+            stat['render_time'] += render_time
+            stat['duplicate_queries'] += sum(count - 1 for count in duplicates.values())
+            stat['slowest'].append({
+                'wall_time': round(wall_time, 6),
+                'sql_count': profile.sql_count,
+                'duplicates': sorted(duplicates.items(), key=lambda item: -item[1])[:3],
+            })
+            stat['slowest'] = sorted(stat['slowest'], key=lambda sample: -sample['wall_time'])[:SLOW_SAMPLES]
+
+    def snapshot(self):
+        """
+        Возвращает статистику в виде списка словарей со средними значениями.
+        """
+        with self.lock:
+            items = [(key, dict(stat, slowest=list(stat['slowest']))) for key, stat in self.stats.items()]
+
+        result = []
+        for (view, method), stat in sorted(items):
+            count = stat['count']
+            result.append({
+                'view': view,
+                'method': method,
+                'count': count,
+                'wall_time_avg': round(stat['wall_time'] / count, 6),
+                'wall_time_max': round(stat['wall_time_max'], 6),
+                'sql_count_avg': round(stat['sql_count'] / count, 2),
+                'sql_time_avg': round(stat['sql_time'] / count, 6),
+                'serializer_time_avg': round(stat['serializer_time'] / count, 6),
+                'render_time_avg': round(stat['render_time'] / count, 6),
+                'duplicate_queries': stat['duplicate_queries'],
+                'slowest': stat['slowest'],
+            })
+        return result
+
+    def prometheus(self):
+        """
+        Возвращает статистику в текстовом формате Prometheus.
+        """
+        with self.lock:
+            items = sorted(self.stats.items())
+
+        metrics = (
+            ('count', 'requests_total', 'counter', 'Количество профилированных запросов'),
+            ('wall_time', 'wall_seconds_total', 'counter', 'Суммарное время обработки'),
+            ('sql_count', 'sql_queries_total', 'counter', 'Количество SQL-запросов'),
+            ('sql_time', 'sql_seconds_total', 'counter', 'Суммарное время SQL-запросов'),
+            ('serializer_time', 'serializer_seconds_total', 'counter', 'Суммарное время сериализации'),
+            ('render_time', 'render_seconds_total', 'counter', 'Суммарное время отрисовки ответа'),
+            ('duplicate_queries', 'duplicate_queries_total', 'counter', 'Количество повторных SQL-запросов'),
+        )
+        lines = []
+        for field, name, metric_type, description in metrics:
+            lines.append(f'# HELP profiling_{name} {description}')
+            lines.append(f'# TYPE profiling_{name} {metric_type}')
+            for (view, method), stat in items:
+                lines.append(f'profiling_{name}{{view="{view}",method="{method}"}} {stat[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+store = ProfileStore()
+
+
+def _install_serializer_timer():
+    """
+    Оборачивает BaseSerializer.data, чтобы учитывать время сериализации в профиле текущего запроса.
+    """
+    original = BaseSerializer.data
+    if getattr(original.fget, 'profiled', False):
+        return
+
+    def data(self):
+        profile = current_profile.get()
+        if profile is None:
+            return original.fget(self)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+
+    data.profiled = True
+    BaseSerializer.data = property(data)
+
+
+class ProfilingMiddleware:
+    """
+    Выборочное профилирование запросов: время обработки, количество и время SQL-запросов, время
+    сериализации и отрисовки ответа, повторяющиеся SQL-запросы. Статистика доступна персоналу
+    по адресу profiling/stats.
+
+    Включается настройкой PROFILING_ENABLED, доля профилируемых запросов задается PROFILING_SAMPLE_RATE.
+    Запрос с заголовком X-Profile: 1 (от персонала или при DEBUG) дополнительно профилируется cProfile,
+    дамп сохраняется в PROFILING_DUMP_DIR, а его имя возвращается в заголовке X-Profile-Dump.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        _install_serializer_timer()
+
+    def wants_cprofile(self, request):
+        """
+        Проверяет заголовок X-Profile: 1 и права на cProfile. Пользователь API определяется и по токену,
+        поэтому функция обращается к базе и в асинхронном режиме вызывается через sync_to_async.
+        """
+        if request.META.get('HTTP_X_PROFILE') != '1':
+            return False
+        if settings.DEBUG:
+            return True
+        user = resolve_user(request)
+        return bool(user and user.is_staff)
+
+    def start(self, profile, profiler):
+        """
+        Подключает замер SQL-запросов к соединениям текущего потока и запускает cProfile.
+        Соединения у каждого потока свои, поэтому в асинхронном режиме функция выполняется в потоке,
+        где sync_to_async выполняет синхронный код запроса.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        if profiler:
+            profiler.enable()
+        return stack
+
+    def stop(self, stack, profiler):
+        if profiler:
+            profiler.disable()
+        stack.close()
+
+    def finish(self, request, response, profile, profiler, wall_time, finished):
+        """
+        Записывает замеры запроса в статистику и сохраняет дамп cProfile.
+        """
+        render_time = finished - profile.view_finished if profile.view_finished else 0.0
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        store.add(view, request.method, wall_time, profile, render_time)
+
+        if profiler:
+            response['X-Profile-Dump'] = self.dump(profiler, view)
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        cprofile = self.wants_cprofile(request)
+        if not cprofile and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile() if cprofile else None
+        started = time.perf_counter()
+        try:
+            stack = self.start(profile, profiler)
+            try:
+                response = self.get_response(request)
+            finally:
+                self.stop(stack, profiler)
+        finally:
+            current_profile.reset(token)
+
+        finished = time.perf_counter()
+        return self.finish(request, response, profile, profiler, finished - started, finished)
+
+    async def __acall__(self, request):
+        """
+        Асинхронный вариант для развертывания через ASGI. cProfile работает в потоке синхронного кода
+        запроса: цикл событий обслуживает и чужие запросы, их замеры в дамп не попадают.
+        """
+        cprofile = 'HTTP_X_PROFILE' in request.META and await sync_to_async(self.wants_cprofile)(request)
+        if not cprofile and random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile() if cprofile else None
+        started = time.perf_counter()
+        try:
+            stack = await sync_to_async(self.start)(profile, profiler)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(self.stop)(stack, profiler)
+        finally:
+            current_profile.reset(token)
+
+        finished = time.perf_counter()
+        return await sync_to_async(self.finish)(request, response, profile, profiler, finished - started, finished)
+
+    def process_template_response(self, request, response):
+        """
+        Отмечает момент, когда представление вернуло ответ: дальше идет только его отрисовка.
+        """
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view_finished = time.perf_counter()
+        return response
+
+    def dump(self, profiler, view):
+        dump_dir = Path(getattr(settings, 'PROFILING_DUMP_DIR', settings.BASE_DIR / 'profiles'))
+        dump_dir.mkdir(parents=True, exist_ok=True)
+        file_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{view.replace(":", "_")}.prof'
+        profiler.dump_stats(dump_dir / file_name)
+        return file_name
@@ -0,0 +1,254 @@
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import ProductParameter, OrderItem
+
+# Быстрая сериализация для списков только на чтение. Данные читаются через values_list() кортежами
+# с заранее известным порядком колонок и собираются в словари той же структуры, что отдают
+# ProductInfoSerializer и OrderSerializer, без построения моделей и полей DRF на каждую строку.
+# У каждого загрузчика есть асинхронный вариант с тем же результатом для async_views.
+
+# колонки предложения в порядке полей ProductInfoSerializer
+PRODUCT_COLUMNS = ('id', 'model', 'product__name', 'product__category__name', 'shop_id', 'quantity', 'price',
+                   'price_rrc')
+
+CONTACT_FIELDS = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+
+ORDER_COLUMNS = ('id', 'state', 'dt') + tuple(f'contact__{field}' for field in CONTACT_FIELDS)
+
+ITEM_COLUMNS = ('id', 'order_id', 'quantity') + tuple(f'product_info__{column}' for column in PRODUCT_COLUMNS)
+
+PARAMETER_COLUMNS = ('product_info_id', 'parameter__name', 'value')
+
+
+def format_datetime(value):
+    """
+    Форматирует дату так же, как DateTimeField из DRF: ISO 8601 в текущем часовом поясе, UTC как 'Z'.
+    """
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def group_parameters(rows):
+    """
+    Группирует строки PARAMETER_COLUMNS по предложениям.
+
+    :return: словарь {id предложения: [{'parameter': имя, 'value': значение}, ...]}
+    """
+    parameters = {}
+    for product_info_id, name, value in rows:
+        items = parameters.get(product_info_id)
+        if items is None:
+            items = parameters[product_info_id] = []
+        items.append({'parameter': name, 'value': value})
+    return parameters
+
+
+def product_dict(row, parameters):
+    """
+    Собирает предложение в формате ProductInfoSerializer из строки PRODUCT_COLUMNS.
+    """
+    product_info_id, model, name, category, shop_id, quantity, price, price_rrc = row
+    return {
+        'id': product_info_id,
+        'model': model,
+        'product': {'name': name, 'category': category},
+        'shop': shop_id,
+        'quantity': quantity,
+        'price': price,
+        'price_rrc': price_rrc,
+        'product_parameters': parameters.get(product_info_id, []),
+    }
+
+
+def iter_products(product_infos, chunk_size=2000, ordering=None):
+    """
+    Построчно выдает предложения в формате ProductInfoSerializer.
+
+    Предложения и характеристики читаются двумя курсорами, отсортированными по id предложения,
+    и склеиваются слиянием, поэтому в памяти не держится весь список. При другой сортировке
+    характеристики читаются отдельным запросом на каждую порцию из chunk_size предложений.
+    """
+    rows, parameters = product_querysets(product_infos, ordering)
+    if ordering:
+        rows = rows.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(rows, chunk_size)):
+            grouped = group_parameters(ProductParameter.objects.filter(
+                product_info_id__in=[row[0] for row in chunk]).order_by('id').values_list(*PARAMETER_COLUMNS))
+            for row in chunk:
+                yield product_dict(row, grouped)
+        return
+    parameters = iter(parameters.order_by('product_info_id', 'id').iterator(chunk_size=chunk_size))
+    parameter = next(parameters, None)
+    for row in rows.iterator(chunk_size=chunk_size):
+        items = []
+        while parameter is not None and parameter[0] <= row[0]:
+            if parameter[0] == row[0]:
+                items.append({'parameter': parameter[1], 'value': parameter[2]})
+            parameter = next(parameters, None)
+        yield product_dict(row, {row[0]: items})
+
+
+def build_products(rows, parameter_rows):
+    parameters = group_parameters(parameter_rows)
+    return [product_dict(row, parameters) for row in rows]
+
+
+def build_product_columns(rows, parameter_rows):
+    """
+    Собирает предложения в колоночном виде для машинных клиентов.
+
+    Каждое поле - отдельный массив, категории и названия характеристик заменены индексами
+    в словарях, характеристики предложения i - элементы parameters с offsets[i] по offsets[i + 1].
+    """
+    columns = {'id': [], 'model': [], 'name': [], 'category': [], 'shop': [], 'quantity': [], 'price': [],
+               'price_rrc': []}
+    categories, category_index = [], {}
+    for product_info_id, model, name, category, shop_id, quantity, price, price_rrc in rows:
+        index = category_index.get(category)
+        if index is None:
+            index = category_index[category] = len(categories)
+            categories.append(category)
+        columns['id'].append(product_info_id)
+        columns['model'].append(model)
+        columns['name'].append(name)
+        columns['category'].append(index)
+        columns['shop'].append(shop_id)
+        columns['quantity'].append(quantity)
+        columns['price'].append(price)
+        columns['price_rrc'].append(price_rrc)
+
+    grouped = {}
+    for product_info_id, name, value in parameter_rows:
+        items = grouped.get(product_info_id)
+        if items is None:
+            items = grouped[product_info_id] = []
+        items.append((name, value))
+
+    names, name_index = [], {}
+    offsets, parameter, value = [0], [], []
+    for product_info_id in columns['id']:
+        for name, item_value in grouped.get(product_info_id, ()):
+            index = name_index.get(name)
+            if index is None:
+                index = name_index[name] = len(names)
+                names.append(name)
+            parameter.append(index)
+            value.append(item_value)
+        offsets.append(len(parameter))
+
+    return {
+        'count': len(columns['id']),
+        'columns': columns,
+        'categories': categories,
+        'parameters': {'names': names, 'offsets': offsets, 'parameter': parameter, 'value': value},
+    }
+
+
+def build_orders(order_rows, item_rows, parameter_rows, counted=None):
+    """
+    Собирает заказы в формате OrderSerializer.
+
+    :param counted: идентификаторы позиций, которые входят в total_sum; None - все позиции
+    """
+    result = []
+    by_id = {}
+    for row in order_rows:
+        contact = dict(zip(CONTACT_FIELDS, row[3:])) if row[3] is not None else None
+        order = {'id': row[0], 'ordered_items': [], 'state': row[1], 'dt': format_datetime(row[2]),
+                 'total_sum': None, 'contact': contact}
+        result.append(order)
+        by_id[row[0]] = order
+
+    parameters = group_parameters(parameter_rows)
+    for row in item_rows:
+        item_id, order_id, quantity = row[:3]
+        product_info = product_dict(row[3:], parameters)
+        order = by_id[order_id]
+        order['ordered_items'].append({'id': item_id, 'product_info': product_info, 'quantity': quantity})
+        if counted is None or item_id in counted:
+            order['total_sum'] = (order['total_sum'] or 0) + quantity * product_info['price']
+    return result
+
+
+def product_querysets(product_infos, ordering=None):
+    """
+    Возвращает запросы строк предложений и их характеристик для queryset предложений.
+
+    :param ordering: сортировка предложений (offers.CATALOG_ORDERINGS); по умолчанию - по id
+    """
+    rows = product_infos.order_by(*(ordering or ()), 'id').values_list(*PRODUCT_COLUMNS)
+    parameters = ProductParameter.objects.filter(product_info_id__in=product_infos.values('id')).order_by(
+        'id').values_list(*PARAMETER_COLUMNS)
+    return rows, parameters
+
+
+def order_querysets(orders, items_filter=None):
+    """
+    Возвращает запросы заказов, позиций, характеристик и позиций, входящих в сумму заказа.
+
+    Синхронные представления аннотируют total_sum, и из-за GROUP BY Django не применяет
+    Meta.ordering, поэтому заказы там идут в порядке id; здесь порядок задается явно.
+
+    :param orders: queryset заказов
+    :param items_filter: условие на позиции, которые входят в total_sum (для заказов поставщика
+        сумма считается только по его товарам, как в аннотации PartnerOrders)
+    """
+    items = OrderItem.objects.filter(order_id__in=orders.values('id'))
+    parameters = ProductParameter.objects.filter(product_info_id__in=items.values('product_info_id')).order_by(
+        'id').values_list(*PARAMETER_COLUMNS)
+    counted = items.filter(items_filter).values_list('id', flat=True) if items_filter is not None else None
+    return (orders.order_by('id').values_list(*ORDER_COLUMNS), items.order_by('id').values_list(*ITEM_COLUMNS),
+            parameters, counted)
+
+
+def load_products(product_infos, ordering=None):
+    """
+    Возвращает предложения в формате ProductInfoSerializer за два запроса.
+    """
+    rows, parameters = product_querysets(product_infos, ordering)
+    return build_products(rows, parameters)
+
+
+def load_product_columns(product_infos, ordering=None):
+    """
+    Возвращает предложения в колоночном виде (build_product_columns) за два запроса.
+    """
+    rows, parameters = product_querysets(product_infos, ordering)
+    return build_product_columns(rows, parameters)
+
+
+async def aload_products(product_infos, ordering=None):
+    rows, parameters = product_querysets(product_infos, ordering)
+    return build_products([row async for row in rows], [row async for row in parameters])
+
+
+async def aload_product_page(product_infos, ordering, offset, limit):
+    """
+    Возвращает страницу предложений в формате ProductInfoSerializer и признак следующей страницы.
+    Характеристики читаются только для предложений страницы.
+    """
+    rows, _ = product_querysets(product_infos, ordering)
+    rows = [row async for row in rows[offset:offset + limit + 1]]
+    parameters = ProductParameter.objects.filter(product_info_id__in=[row[0] for row in rows[:limit]]).order_by(
+        'id').values_list(*PARAMETER_COLUMNS)
+    return build_products(rows[:limit], [row async for row in parameters]), len(rows) > limit
+
+
+def load_orders(orders, items_filter=None):
+    """
+    Возвращает заказы в формате OrderSerializer за три-четыре запроса независимо от количества заказов.
+    """
+    order_rows, item_rows, parameters, counted = order_querysets(orders, items_filter)
+    return build_orders(order_rows, item_rows, parameters, set(counted) if counted is not None else None)
+
+
+async def aload_orders(orders, items_filter=None):
+    order_rows, item_rows, parameters, counted = order_querysets(orders, items_filter)
+    if counted is not None:
+        counted = {item_id async for item_id in counted}
+    return build_orders([row async for row in order_rows], [row async for row in item_rows],
+                        [row async for row in parameters], counted)
@@ -0,0 +1,175 @@
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from ujson import dumps as dump_json, loads as load_json
+
+try:
+    import msgpack
+except ImportError:  # формат msgpack доступен только при установленном пакете msgpack
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+# сколько элементов массива склеивается в один фрагмент потокового ответа
+STREAM_BATCH_SIZE = 500
+
+# JSON-массив до этого размера в байтах собирается в памяти, больше - во временном файле
+SPOOL_SIZE = 4 * 1024 * 1024
+
+
+def dumps(data, indent=0):
+    """
+    Сериализует данные в JSON через ujson так же, как JSONRenderer из DRF: без экранирования
+    кириллицы и '/', типы, которые ujson не знает (даты, Decimal, UUID, ленивые строки), приводятся
+    энкодером DRF.
+    """
+    content = dump_json(data, ensure_ascii=False, escape_forward_slashes=False, indent=indent,
+                        default=_encoder.default)
+    # как и DRF, экранируем разделители строк, чтобы JSON оставался подмножеством JavaScript
+    if '\u2028' in content or '\u2029' in content:
+        content = content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return content
+
+
+class UJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на ujson: тот же формат ответа, но в несколько раз быстрее на больших списках.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(data, indent=indent or 0).encode()
+
+
+class ColumnarJSONRenderer(UJSONRenderer):
+    """
+    Колоночный JSON для машинных клиентов (?format=columnar или Accept: application/vnd.orders.columnar+json).
+    Данные в колоночном виде готовит представление.
+    """
+    media_type = 'application/vnd.orders.columnar+json'
+    format = 'columnar'
+
+
+class MsgPackRenderer(BaseRenderer):
+    """
+    Тот же колоночный ответ в msgpack (?format=msgpack или Accept: application/x-msgpack).
+    """
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default)
+
+
+# форматы, в которых представления каталога отдают данные колонками
+COLUMNAR_FORMATS = ('columnar', 'msgpack')
+
+
+def columnar_renderer_classes():
+    """
+    Возвращает рендереры колоночных форматов; msgpack - только при установленном пакете.
+    """
+    return (ColumnarJSONRenderer, MsgPackRenderer) if msgpack is not None else (ColumnarJSONRenderer,)
+
+
+class UJSONParser(JSONParser):
+    """
+    JSONParser на ujson.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return load_json(stream.read().decode(encoding))
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class JsonResponse(HttpResponse):
+    """
+    Замена django.http.JsonResponse с тем же интерфейсом: JSON формируется через ujson,
+    кириллица не экранируется.
+    """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def iter_json_array(items, batch_size=STREAM_BATCH_SIZE):
+    """
+    Выдает JSON-массив фрагментами по batch_size элементов, не собирая весь ответ в памяти.
+    """
+    yield '['
+    batch = []
+    first = True
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) >= batch_size:
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
+
+def write_json_array(items):
+    """
+    Записывает JSON-массив из генератора элементов во временный файл.
+
+    :return: файловый объект, установленный на начало
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for chunk in iter_json_array(items):
+        file.write(chunk.encode())
+    file.seek(0)
+    return file
+
+
+class JsonArrayResponse(FileResponse):
+    """
+    Ответ с JSON-массивом из генератора элементов. Массив целиком записывается во временный файл
+    еще в представлении: под ASGI тело ответа читается в цикле событий, где генератор с запросами
+    к базе упал бы с SynchronousOnlyOperation.
+    """
+
+    def __init__(self, items, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(write_json_array(items), **kwargs)
+
+
+def parse_items(value):
+    """
+    Возвращает список из параметра items: в JSON-запросе он приходит списком, в форме - строкой с JSON.
+
+    :raises ValueError: если строка не является JSON
+    """
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str):
+        raise ValueError('items должен быть списком')
+    return load_json(value)
+
+
+def parse_ids(value):
+    """
+    Возвращает список идентификаторов из параметра items: списка или строки вида '1,2,3'.
+    """
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return str(value).split(',')
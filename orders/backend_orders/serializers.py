@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from .models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from .models import User, Category, Shop, ProductInfo, Product, Parameter, ProductParameter, OrderItem, Order, \
+    Contact, ExportJob, Webhook
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -47,8 +48,16 @@ class CategorySerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Category
-        fields = ('id', 'name',)
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'parent', 'product_count', 'offer_count',)
+        read_only_fields = ('id', 'product_count', 'offer_count',)
+
+    def validate_parent(self, parent):
+        """
+        Проверяет, что категория не вкладывается сама в себя или во вложенную в нее.
+        """
+        if parent is not None and self.instance is not None and self.instance.id in Category.path_ids(parent.path):
+            raise serializers.ValidationError('Категория не может быть вложена сама в себя')
+        return parent
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -80,6 +89,19 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ('name', 'category',)
 
 
+class ParameterSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для модели характеристики.
+    Атрибуты:
+        model (Parameter): модель характеристики
+        fields (tuple): поля сериализации
+    """
+    class Meta:
+        model = Parameter
+        fields = ('id', 'name', 'value_type',)
+        read_only_fields = fields
+
+
 class ProductParameterSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели параметра продукта.
@@ -158,3 +180,36 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
         read_only_fields = ('id',)
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для модели фоновой выгрузки.
+    Атрибуты:
+        model (ExportJob): модель выгрузки
+        fields (tuple): поля сериализации
+        read_only_fields (tuple): только для чтения поля
+    """
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'kind', 'file_format', 'compression', 'status', 'rows', 'total_rows', 'error',
+                  'created_at', 'finished_at',)
+        read_only_fields = ('id', 'status', 'rows', 'total_rows', 'error', 'created_at', 'finished_at',)
+
+
+class WebhookSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для модели вебхука поставщика.
+    Атрибуты:
+        model (Webhook): модель вебхука
+        fields (tuple): поля сериализации
+        read_only_fields (tuple): только для чтения поля
+    """
+    class Meta:
+        model = Webhook
+        fields = ('id', 'url', 'is_active', 'secret', 'last_seq', 'failures', 'next_attempt_at', 'last_status',
+                  'last_latency_ms', 'last_error', 'created_at',)
+        read_only_fields = ('id', 'secret', 'last_seq', 'failures', 'next_attempt_at', 'last_status',
+                            'last_latency_ms', 'last_error', 'created_at',)
+        # в form-data отсутствующий флаг иначе читается как False
+        extra_kwargs = {'is_active': {'default': True}}
@@ -0,0 +1,109 @@
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .async_views import get_token_user
+from .events import alatest_seq, await_events
+from .renderers import dumps
+
+# Django 4.1 не умеет отдавать асинхронный потоковый ответ, поэтому поток событий - отдельное
+# ASGI-приложение, которое asgi.py ставит перед Django. Через WSGI этот путь недоступен,
+# там остается long-poll async/order/events.
+SSE_PATH = '/api/v1/sse/order/events'
+
+
+def heartbeat_interval():
+    """
+    Возвращает период комментария-пинга в секундах, чтобы прокси не закрывали простаивающее соединение.
+    """
+    return getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 15.0)
+
+
+def format_events(events):
+    """
+    Форматирует события в кадры text/event-stream; id кадра - курсор для Last-Event-ID.
+    """
+    return ''.join(f"id: {event['seq']}\nevent: order\ndata: {dumps(event)}\n\n" for event in events).encode()
+
+
+async def send_json(send, status, data):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': dumps(data).encode()})
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def order_event_stream(scope, receive, send):
+    """
+    Поток событий смены статусов заказов в формате Server-Sent Events.
+
+    Токен передается заголовком Authorization: Token <ключ> или параметром token (EventSource
+    в браузере не умеет задавать заголовки). Курсор - заголовок Last-Event-ID при переподключении
+    или параметр since; без них поток начинается с текущего момента.
+    """
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    params = {name: values[-1] for name, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+    # как и обработчик Django, закрываем устаревшие соединения с базой до и после запроса
+    await sync_to_async(close_old_connections)()
+    try:
+        authorization = headers.get('authorization', '')
+        key = authorization[6:].strip() if authorization.startswith('Token ') else params.get('token', '')
+        user = await get_token_user(key) if key else None
+        if user is None:
+            await send_json(send, 403, {'Status': False, 'Error': 'Log in required'})
+            return
+
+        since = headers.get('last-event-id') or params.get('since')
+        if since is not None and not since.isdigit():
+            await send_json(send, 400, {'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+            return
+        since = int(since) if since is not None else await alatest_seq(user.id)
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # nginx не должен буферизовать поток
+            (b'x-accel-buffering', b'no'),
+        ]})
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            while True:
+                waiter = asyncio.ensure_future(await_events(user.id, since, heartbeat_interval()))
+                await asyncio.wait((waiter, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiter.cancel()
+                    return
+                events = waiter.result()
+                if events:
+                    since = events[-1]['seq']
+                    body = format_events(events)
+                else:
+                    body = b': ping\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+    finally:
+        await sync_to_async(close_old_connections)()
+
+
+def sse_router(application):
+    """
+    Оборачивает ASGI-приложение Django: запросы к SSE_PATH обслуживает order_event_stream.
+    """
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == SSE_PATH:
+            await order_event_stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return router
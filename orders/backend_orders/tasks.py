@@ -1,13 +1,21 @@
+import time
+from pathlib import Path
+
 import requests
 from django.conf import settings
 from celery import shared_task
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.validators import URLValidator
+from django.utils import timezone
 from django.db import IntegrityError
 from yaml import load as load_yaml, Loader
 
-from .models import Shop, Category, ProductInfo, Product, Parameter, ProductParameter
+from .exports import EXPORT_FORMATS, write_export
+from .importer import import_price
+from .metrics import record_import
+from .models import Shop, ExportJob
+from .webhooks import dispatch
 
 
 @shared_task()
@@ -32,6 +40,24 @@ def send_email(title, message, email, *args, **kwargs):
         raise e
 
 
+@shared_task()
+def send_bulk_email(title, message, emails, *args, **kwargs):
+    """
+    Отправляет одно и то же письмо списку получателей через одно SMTP-соединение
+
+    :param title: Заголовок письма
+    :param message: Тело письма
+    :param emails: Список email-адресов получателей
+    :param args: Аргументы
+    :param kwargs: Ключевые аргументы
+    :return: Количество отправленных писем
+    """
+    connection = get_connection()
+    messages = [EmailMultiAlternatives(subject=title, body=message, from_email=settings.EMAIL_HOST_USER,
+                                       to=[email], connection=connection) for email in emails]
+    return connection.send_messages(messages) or 0
+
+
 @shared_task()
 def get_import(partner, url):
     """
@@ -39,7 +65,7 @@ def get_import(partner, url):
 
     :param partner: Идентификатор пользователя
     :param url: URL YAML-файла
-    :return: Словарь со статусом выполнения операции и информацией об ошибках
+    :return: Словарь со статусом выполнения операции, отчетом импорта и информацией об ошибках
     """
     if url:
         validate_url = URLValidator()
@@ -50,37 +76,75 @@ def get_import(partner, url):
         else:
             stream = requests.get(url).content
 
+        started = time.perf_counter()
         data = load_yaml(stream, Loader=Loader)
         try:
-            shop, _ = Shop.objects.get_or_create(name=data['shop'],
-                                                 user_id=partner)
+            report = import_price(partner, data)
         except IntegrityError as e:
             return {'Status': False, 'Error': str(e)}
-
-        for category in data['categories']:
-            category_object, _ = Category.objects.get_or_create(
-                id=category['id'], name=category['name'])
-            category_object.shops.add(shop.id)
-            category_object.save()
-
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-        for item in data['goods']:
-            product, _ = Product.objects.get_or_create(
-                name=item['name'], category_id=item['category']
-            )
-            product_info = ProductInfo.objects.create(
-                product_id=product.id, external_id=item['id'],
-                model=item['model'], price=item['price'],
-                price_rrc=item['price_rrc'], quantity=item['quantity'],
-                shop_id=shop.id
-            )
-            for name, value in item['parameters'].items():
-                parameter_object, _ = Parameter.objects.get_or_create(
-                    name=name
-                )
-                ProductParameter.objects.create(
-                    product_info_id=product_info.id,
-                    parameter_id=parameter_object.id, value=value
-                )
-        return {'Status': True}
+        record_import('task', len(data['goods']), time.perf_counter() - started)
+        return {'Status': True, 'Report': report}
     return {'Status': False, 'Errors': 'Url is false'}
+
+
+@shared_task()
+def get_export(partner, export_format='yaml'):
+    """
+    Выгружает прайс магазина в файл в каталоге EXPORT_ROOT.
+
+    :param partner: Идентификатор пользователя
+    :param export_format: Формат выгрузки (yaml или jsonl)
+    :return: Словарь со статусом выполнения операции и путем к файлу
+    """
+    if export_format not in EXPORT_FORMATS:
+        return {'Status': False, 'Errors': 'Unknown export format'}
+
+    shop = Shop.objects.filter(user_id=partner).first()
+    if not shop:
+        return {'Status': False, 'Errors': 'Shop not found'}
+
+    export_root = Path(settings.EXPORT_ROOT)
+    export_root.mkdir(parents=True, exist_ok=True)
+    path = export_root / f'shop_{shop.id}.{export_format}'
+    with open(path, 'w', encoding='utf-8') as file:
+        for chunk in EXPORT_FORMATS[export_format](shop):
+            file.write(chunk)
+    return {'Status': True, 'File': str(path)}
+
+
+@shared_task()
+def run_export_job(job_id):
+    """
+    Выполняет фоновую выгрузку прайса или истории заказов в сжатый файл.
+
+    :param job_id: Идентификатор задания выгрузки
+    :return: Словарь со статусом выполнения операции и количеством строк
+    """
+    job = ExportJob.objects.select_related('user').filter(id=job_id).first()
+    if not job:
+        return {'Status': False, 'Errors': 'Export job not found'}
+
+    try:
+        rows = write_export(job)
+    except Exception as e:
+        ExportJob.objects.filter(id=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        return {'Status': False, 'Error': str(e)}
+    return {'Status': True, 'Rows': rows}
+
+
+@shared_task()
+def dispatch_webhooks():
+    """
+    Отправляет поставщикам новые события заказов на их вебхуки.
+    Если какие-то адреса ответили ошибкой или были заняты другим запуском, задача ставит себя
+    в очередь повторно.
+
+    :return: Словарь с результатом отправки
+    """
+    result = dispatch()
+    if result['retry_at'] is not None:
+        dispatch_webhooks.apply_async(eta=result['retry_at'])
+    elif result['busy']:
+        dispatch_webhooks.apply_async(countdown=getattr(settings, 'WEBHOOK_TIMEOUT', 5.0))
+    result['retry_at'] = result['retry_at'] and result['retry_at'].isoformat()
+    return result
@@ -1,9 +1,81 @@
+import asyncio
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
 from copy import deepcopy
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipIf
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q, Sum, F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from rest_framework.authtoken.models import Token
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from ujson import loads as load_json
+from yaml import load as load_yaml, Loader
+
+from .models import User, Order, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, OrderItem, \
+    ExportJob, ConfirmEmailToken, Contact, ProductInfoChange, OrderEvent, Webhook, ProductOffers, ShopCategory, \
+    CategoryShop
+from .serializers import ProductInfoSerializer, OrderSerializer
+from . import projections
+from .compression import CompressionMiddleware, acompress_stream, choose_encoding
+from .renderers import UJSONRenderer, dumps, iter_json_array, msgpack
+from .tasks import run_export_job
+from .exports import export_file_path
+from .generator import CatalogGenerator, load_catalog, load_orders
+from .profiling import ProfilingMiddleware, store as profile_store
+from .metrics import REGISTRY, EMAIL_QUEUE_DEPTH, MetricsMiddleware, count_email_enqueued, stop_task_timer
+from .tasks import get_import
+from .importer import ParameterDictionary, import_price
+from .matching import ProductMatcher, match_tokens
+from .categories import recount_categories
+from .offers import CATALOG_ORDERINGS
+from .parameters import NUMBER, DIMENSION, TEXT, infer_type, parameter_key, parse_dimension, parse_number
+from .sse import SSE_PATH, sse_router
+from .events import record_order_events
+from .webhooks import dispatch, sign
+from .postgresql_pool.base import ConnectionPool
+from .management.commands.bench_connections import MODES, simulate_requests
+from .benchmarks import seed_dataset, run_benchmarks, benchmark_cases, load_baseline, baseline_endpoints, \
+    compare_with_baseline, save_baseline, case_key, app_url_names
+
+
+def asgi_get(client, path, data=None, **headers):
+    """
+    Выполняет GET-запрос асинхронным тестовым клиентом и читает ответ в цикле событий, как
+    ASGIHandler при развертывании через orders/asgi.py: потоковый ответ, который обращается к базе
+    при переборе, здесь падает с SynchronousOnlyOperation.
+
+    :param client: django.test.AsyncClient, при необходимости уже с выполненным входом
+    :param headers: заголовки запроса в виде ASGI, например **{'x-profile': '1'}
+    :return: кортеж (ответ, тело ответа)
+    """
+    async def request():
+        response = await client.get(path, data, **headers)
+        return response, b''.join(response) if response.streaming else response.content
 
-from .models import User
+    return async_to_sync(request)()
 
 
 class APITests(APITestCase):
@@ -20,8 +92,8 @@ class APITests(APITestCase):
         'position': 'manager',
 
     }
-    url_user_register = reverse('user-register')
-    url_user_login = reverse('user-login')
+    url_user_register = reverse('backend_orders:user-register')
+    url_user_login = reverse('backend_orders:user-login')
 
     def setUp(self):
         return super().setUp()
@@ -129,7 +201,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
 
         self.create_test_user()
         email = self.data['email']
@@ -149,7 +221,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
         response = self.client.get(url_contact, format='json')
 
         assert response.status_code == 403
@@ -163,7 +235,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
 
         self.create_test_user()
         email = self.data['email']
@@ -194,7 +266,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
 
         self.create_test_user()
         email = self.data['email']
@@ -223,7 +295,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
 
         self.create_test_user()
         email = self.data['email']
@@ -244,7 +316,7 @@ class APITests(APITestCase):
         Представление ContactView.
         """
 
-        url_contact = reverse('user-contact')
+        url_contact = reverse('backend_orders:user-contact')
 
         self.create_test_user()
         email = self.data['email']
@@ -256,4 +328,2269 @@ class APITests(APITestCase):
 
         response = self.client.delete(url_contact, data=data, format='json')
 
-        assert response.status_code == 400
\ No newline at end of file
+        assert response.status_code == 400
+
+
+class OrderAdminTests(TestCase):
+    """
+    Класс для тестирования массовой смены статуса заказов в админке.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass3450',
+                                               is_active=True)
+        self.client.force_login(self.admin)
+        self.buyers = [User.objects.create(email=f'buyer{i}@example.com', username=f'buyer{i}') for i in range(3)]
+        self.orders = [Order.objects.create(user=user, state='new') for user in self.buyers for _ in range(2)]
+        self.basket = Order.objects.create(user=self.buyers[0], state='basket')
+
+    def test_bulk_state_change(self):
+        """
+        Проверяет, что действие меняет статус всех выбранных заказов, кроме корзин,
+        и ставит в очередь одно пакетное уведомление на всех покупателей.
+        """
+        selected = [order.id for order in self.orders] + [self.basket.id]
+
+        with mock.patch('backend_orders.admin.send_bulk_email.delay') as delay:
+            response = self.client.post(reverse('admin:backend_orders_order_changelist'),
+                                        {'action': 'make_confirmed', '_selected_action': selected})
+
+        assert response.status_code == 302
+        assert Order.objects.filter(state='confirmed').count() == len(self.orders)
+        assert Order.objects.get(id=self.basket.id).state == 'basket'
+        delay.assert_called_once()
+        assert sorted(delay.call_args.args[2]) == sorted(user.email for user in self.buyers)
+
+    def test_invalid_transition_rejected(self):
+        """
+        Проверяет, что действие не возвращает отмененные и доставленные заказы в работу и не пишет для них событий.
+        """
+        canceled, delivered = self.orders[0], self.orders[1]
+        Order.objects.filter(id=canceled.id).update(state='canceled')
+        Order.objects.filter(id=delivered.id).update(state='delivered')
+
+        with mock.patch('backend_orders.admin.send_bulk_email.delay') as delay:
+            response = self.client.post(reverse('admin:backend_orders_order_changelist'),
+                                        {'action': 'make_confirmed', '_selected_action': [canceled.id, delivered.id]},
+                                        follow=True)
+
+        assert Order.objects.get(id=canceled.id).state == 'canceled'
+        assert Order.objects.get(id=delivered.id).state == 'delivered'
+        assert not OrderEvent.objects.exists()
+        delay.assert_not_called()
+        assert f'Статус не изменен у заказов: {canceled.id}, {delivered.id}' in response.content.decode()
+
+
+class AdminChangelistQueryTests(TestCase):
+    """
+    Класс для проверки того, что число запросов на страницах админки не зависит от количества строк.
+    """
+
+    changelists = ('productinfo', 'productparameter', 'orderitem', 'order')
+
+    def setUp(self):
+        admin_user = User.objects.create_superuser(email='admin@example.com', password='pass3450', is_active=True)
+        self.client.force_login(admin_user)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer')
+        self.category = Category.objects.create(name='Смартфоны')
+        self.parameter = Parameter.objects.create(name='Цвет')
+
+    def create_rows(self, count):
+        shop = Shop.objects.create(name=f'Магазин {Shop.objects.count()}')
+        order = Order.objects.create(user=self.buyer, state='new')
+        for i in range(count):
+            product = Product.objects.create(name=f'Товар {i}', category=self.category)
+            product_info = ProductInfo.objects.create(product=product, shop=shop, external_id=i, quantity=1,
+                                                      price=100, price_rrc=120)
+            ProductParameter.objects.create(product_info=product_info, parameter=self.parameter, value='черный')
+            OrderItem.objects.create(order=order, product_info=product_info, quantity=1)
+
+    def count_queries(self, model_name):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(f'admin:backend_orders_{model_name}_changelist'))
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    def test_changelist_query_count_is_bounded(self):
+        """
+        Проверяет, что число запросов при отображении списка не растет вместе с числом строк на странице.
+        """
+        self.create_rows(2)
+        small = {name: self.count_queries(name) for name in self.changelists}
+
+        self.create_rows(20)
+        for name in self.changelists:
+            assert self.count_queries(name) == small[name], name
+
+    def test_change_form_has_no_full_selects(self):
+        """
+        Проверяет, что форма редактирования не выводит все предложения и заказы в виде <select>.
+        """
+        self.create_rows(20)
+        item = OrderItem.objects.first()
+
+        response = self.client.get(reverse('admin:backend_orders_orderitem_change', args=(item.id,)))
+
+        assert response.status_code == 200
+        assert b'<option' not in response.content
+
+
+class PartnerExportTests(APITestCase):
+    """
+    Класс для тестирования выгрузки прайса поставщика.
+    Представление PartnerExport.
+    """
+
+    url_export = reverse('backend_orders:partner-export')
+
+    def setUp(self):
+        self.partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.shop = Shop.objects.create(name='Связной', user=self.partner)
+        category = Category.objects.create(id=224, name='Смартфоны')
+        category.shops.add(self.shop)
+        color = Parameter.objects.create(name='Цвет')
+        memory = Parameter.objects.create(name='Встроенная память (Гб)')
+        for external_id in (4216292, 4216313):
+            product = Product.objects.create(name=f'Смартфон {external_id}', category=category)
+            product_info = ProductInfo.objects.create(product=product, shop=self.shop, external_id=external_id,
+                                                      model='apple/iphone/xr', quantity=9, price=65000,
+                                                      price_rrc=69990)
+            ProductParameter.objects.create(product_info=product_info, parameter=color, value='красный')
+            ProductParameter.objects.create(product_info=product_info, parameter=memory, value='256')
+        self.client.force_authenticate(self.partner)
+
+    def test_export_yaml(self):
+        """
+        Проверяет, что выгрузка в YAML повторяет структуру файла импорта.
+        """
+        response = self.client.get(self.url_export)
+
+        assert response.status_code == 200
+        data = load_yaml(b''.join(response.streaming_content), Loader=Loader)
+        assert data['shop'] == 'Связной'
+        assert data['categories'] == [{'id': 224, 'name': 'Смартфоны'}]
+        assert [item['id'] for item in data['goods']] == [4216292, 4216313]
+        assert data['goods'][0]['parameters'] == {'Цвет': 'красный', 'Встроенная память (Гб)': '256'}
+
+    def test_export_jsonl(self):
+        """
+        Проверяет выгрузку в формате JSON Lines.
+        """
+        with mock.patch('backend_orders.views.write_catalog') as write_catalog:
+            response = self.client.get(self.url_export, {'type': 'jsonl'})
+
+            assert response.status_code == 200
+            assert response['Content-Disposition'] == f'attachment; filename="shop_{self.shop.id}.jsonl"'
+            lines = b''.join(response.streaming_content).decode().splitlines()
+            assert [load_json(line)['id'] for line in lines] == [4216292, 4216313]
+        # под WSGI прайс отдается потоком без промежуточного файла
+        write_catalog.assert_not_called()
+
+    def test_export_buyer_forbidden(self):
+        """
+        Проверяет, что выгрузка доступна только магазинам.
+        """
+        self.client.force_authenticate(User.objects.create(email='buyer@example.com', username='buyer'))
+
+        response = self.client.get(self.url_export)
+
+        assert response.status_code == 403
+
+    def test_export_asgi(self):
+        """
+        Проверяет выгрузку под ASGI: ответ не читает базу в цикле событий.
+        """
+        client = AsyncClient()
+        client.force_login(self.partner)
+
+        response, body = asgi_get(client, self.url_export, {'type': 'jsonl'})
+
+        assert response.status_code == 200
+        assert response['Content-Disposition'] == f'attachment; filename="shop_{self.shop.id}.jsonl"'
+        assert [load_json(line)['id'] for line in body.decode().splitlines()] == [4216292, 4216313]
+
+    def test_export_asgi_large_shop(self):
+        """
+        Проверяет, что под ASGI прайс больше EXPORT_ASGI_LIMIT товаров не собирается в файл, а отправляется
+        в фоновую выгрузку.
+        """
+        client = AsyncClient()
+        client.force_login(self.partner)
+
+        with mock.patch('backend_orders.views.EXPORT_ASGI_LIMIT', 1), \
+                mock.patch('backend_orders.views.write_catalog') as write_catalog:
+            response, body = asgi_get(client, self.url_export, {'type': 'jsonl'})
+
+        assert response.status_code == 409
+        assert load_json(body)['Status'] is False
+        write_catalog.assert_not_called()
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0)
+class ProfilingTests(TestCase):
+    """
+    Класс для тестирования профилирования запросов.
+    Промежуточный слой ProfilingMiddleware и представление ProfilingStats.
+    """
+
+    url_basket = reverse('backend_orders:basket')
+    url_contact = reverse('backend_orders:user-contact')
+    url_partner_update = reverse('backend_orders:partner-update')
+    url_stats = reverse('backend_orders:profiling-stats')
+    url_products = reverse('backend_orders:products-list')
+
+    def setUp(self):
+        profile_store.reset()
+        self.staff = User.objects.create(email='staff@example.com', username='staff', is_staff=True, is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(id=224, name='Смартфоны')
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        for external_id in range(3):
+            product = Product.objects.create(name=f'Смартфон {external_id}', category=category)
+            product_info = ProductInfo.objects.create(product=product, shop=shop, external_id=external_id,
+                                                      quantity=9, price=65000, price_rrc=69990)
+            OrderItem.objects.create(order=basket, product_info=product_info, quantity=1)
+
+    def stats_for(self, view, method='GET'):
+        return next(stat for stat in profile_store.snapshot() if stat['view'] == view and stat['method'] == method)
+
+    def test_basket_breakdown(self):
+        """
+        Проверяет, что для корзины записываются время, SQL-запросы, сериализация и отрисовка.
+        """
+        self.client.force_login(self.buyer)
+
+        response = self.client.get(self.url_basket)
+
+        assert response.status_code == 200
+        stat = self.stats_for('backend_orders:basket')
+        assert stat['count'] == 1
+        assert stat['sql_count_avg'] > 0
+        assert stat['render_time_avg'] > 0
+        assert stat['wall_time_avg'] >= stat['sql_time_avg']
+
+    def test_serializer_time(self):
+        """
+        Проверяет, что учитывается время работы сериализаторов DRF.
+        """
+        self.client.force_login(self.buyer)
+        Contact.objects.create(user=self.buyer, city='Самара', street='Ленина', phone='+79990000000')
+
+        self.client.get(self.url_contact)
+
+        assert self.stats_for('backend_orders:user-contact')['serializer_time_avg'] > 0
+
+    def test_duplicate_queries(self):
+        """
+        Проверяет, что повторяющиеся SQL-запросы импорта прайса попадают в статистику.
+        """
+        partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.client.force_login(partner)
+        with open(Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml', 'rb') as file:
+            content = file.read()
+
+        with mock.patch('backend_orders.views.get') as get:
+            get.return_value.content = content
+            self.client.post(self.url_partner_update, {'url': 'http://example.com/shop1.yaml'})
+
+        stat = self.stats_for('backend_orders:partner-update', 'POST')
+        assert stat['duplicate_queries'] > 0
+        assert stat['slowest'][0]['duplicates']
+
+    @override_settings(PROFILING_SAMPLE_RATE=0.0)
+    def test_sampling(self):
+        """
+        Проверяет, что при нулевой доле выборки запросы не профилируются.
+        """
+        self.client.force_login(self.buyer)
+
+        self.client.get(self.url_basket)
+
+        assert profile_store.snapshot() == []
+
+    def test_stats_endpoint(self):
+        """
+        Проверяет выдачу статистики персоналу в JSON и в текстовом формате Prometheus.
+        """
+        self.client.force_login(self.buyer)
+        self.client.get(self.url_basket)
+        assert self.client.get(self.url_stats).status_code == 403
+
+        self.client.force_login(self.staff)
+        data = self.client.get(self.url_stats).json()
+        assert 'backend_orders:basket' in [stat['view'] for stat in data['Views']]
+
+        response = self.client.get(self.url_stats, {'type': 'prometheus'})
+        assert response['Content-Type'].startswith('text/plain')
+        assert 'profiling_requests_total{view="backend_orders:basket",method="GET"} 1' in response.content.decode()
+
+    def test_cprofile_dump(self):
+        """
+        Проверяет, что заголовок X-Profile сохраняет дамп cProfile для запроса персонала.
+        """
+        self.client.force_login(self.staff)
+
+        with tempfile.TemporaryDirectory() as dump_dir, override_settings(DEBUG=False, PROFILING_DUMP_DIR=dump_dir):
+            response = self.client.get(self.url_basket, HTTP_X_PROFILE='1')
+            assert (Path(dump_dir) / response['X-Profile-Dump']).exists()
+
+            self.client.force_login(self.buyer)
+            response = self.client.get(self.url_basket, HTTP_X_PROFILE='1')
+            assert not response.has_header('X-Profile-Dump')
+
+    def test_cprofile_token_user(self):
+        """
+        Проверяет, что X-Profile учитывает пользователя API, вошедшего по токену, а не только по сессии.
+        """
+        staff_token = Token.objects.create(user=self.staff)
+        buyer_token = Token.objects.create(user=self.buyer)
+
+        with tempfile.TemporaryDirectory() as dump_dir, override_settings(DEBUG=False, PROFILING_DUMP_DIR=dump_dir):
+            response = self.client.get(self.url_products, HTTP_X_PROFILE='1',
+                                       HTTP_AUTHORIZATION=f'Token {staff_token.key}')
+            assert (Path(dump_dir) / response['X-Profile-Dump']).exists()
+
+            response = self.client.get(self.url_products, HTTP_X_PROFILE='1',
+                                       HTTP_AUTHORIZATION=f'Token {buyer_token.key}')
+            assert not response.has_header('X-Profile-Dump')
+
+    def test_asgi(self):
+        """
+        Проверяет профилирование под ASGI: middleware остается корутиной, SQL-запросы синхронного
+        представления учитываются, а X-Profile от персонала с токеном сохраняет дамп cProfile.
+        """
+        async def get_response(request):
+            return HttpResponse()
+
+        assert iscoroutinefunction(ProfilingMiddleware(get_response))
+        token = Token.objects.create(user=self.staff)
+
+        with tempfile.TemporaryDirectory() as dump_dir, override_settings(DEBUG=False, PROFILING_DUMP_DIR=dump_dir):
+            response, body = asgi_get(AsyncClient(), self.url_products, **{'x-profile': '1',
+                                                                       'authorization': f'Token {token.key}'})
+            assert response.status_code == 200
+            assert (Path(dump_dir) / response['X-Profile-Dump']).exists()
+
+        client = AsyncClient()
+        client.force_login(self.buyer)
+        response, body = asgi_get(client, self.url_basket)
+        assert response.status_code == 200
+        assert self.stats_for('backend_orders:basket')['sql_count_avg'] > 0
+
+
+class MetricsTests(TestCase):
+    """
+    Класс для тестирования метрик Prometheus.
+    Реестр метрик, MetricsMiddleware и адрес /metrics.
+    """
+
+    url_metrics = reverse('metrics')
+    url_basket = reverse('backend_orders:basket')
+
+    def setUp(self):
+        REGISTRY.reset()
+
+    def test_request_metrics(self):
+        """
+        Проверяет, что запросы считаются по маршрутам вместе с гистограммой задержки.
+        """
+        self.client.force_login(User.objects.create(email='buyer@example.com', username='buyer', is_active=True))
+        self.client.get(self.url_basket)
+        self.client.force_login(User.objects.create(email='staff@example.com', username='staff', is_staff=True,
+                                                    is_active=True))
+
+        text = self.client.get(self.url_metrics).content.decode()
+
+        assert 'http_requests_total{route="backend_orders:basket",method="GET",status="200"} 1' in text
+        assert 'http_request_duration_seconds_count{route="backend_orders:basket",method="GET"} 1' in text
+        assert 'http_request_duration_seconds_bucket{route="backend_orders:basket",method="GET",le="+Inf"} 1' in text
+        assert 'db_connections_in_use{alias="default"} 1' in text
+
+    def test_async_middleware(self):
+        """
+        Проверяет, что в асинхронной цепочке middleware остается корутиной и считает запросы.
+        """
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        middleware = MetricsMiddleware(get_response)
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+
+        assert iscoroutinefunction(middleware)
+        assert response.status_code == 201
+        assert 'http_requests_total{route="unresolved",method="GET",status="201"} 1' in REGISTRY.render()
+
+    def test_flusher_started_once(self):
+        """
+        Проверяет, что изменения метрик запускают фоновый поток сохранения один раз на процесс.
+        """
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir), \
+                mock.patch.object(REGISTRY, 'flusher_pid', None), \
+                mock.patch('backend_orders.metrics.threading.Thread') as thread:
+            EMAIL_QUEUE_DEPTH.inc()
+            EMAIL_QUEUE_DEPTH.inc()
+
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    def test_import_metrics(self):
+        """
+        Проверяет запись длительности и скорости импорта в задаче get_import.
+        """
+        partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        with open(Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml', 'rb') as file:
+            content = file.read()
+
+        with mock.patch('backend_orders.tasks.requests.get') as get:
+            get.return_value.content = content
+            result = get_import(partner.id, 'http://example.com/shop1.yaml')
+        assert result['Status'] is True
+        assert result['Report']['inserted'] == ProductInfo.objects.count()
+
+        text = REGISTRY.render()
+        assert 'import_duration_seconds_count{source="task"} 1' in text
+        assert f'import_rows_total{{source="task"}} {ProductInfo.objects.count()}' in text
+        assert 'import_rows_per_second{source="task"}' in text
+
+    def test_email_queue_depth(self):
+        """
+        Проверяет, что глубина очереди писем растет при постановке задачи и уменьшается после ее выполнения.
+        """
+        count_email_enqueued(sender='backend_orders.tasks.send_email')
+        count_email_enqueued(sender='backend_orders.tasks.send_email')
+        count_email_enqueued(sender='backend_orders.tasks.get_import')
+        task = mock.Mock()
+        task.name = 'backend_orders.tasks.send_email'
+        task.request.is_eager = False
+        stop_task_timer(task_id='1', task=task, state='SUCCESS')
+
+        assert EMAIL_QUEUE_DEPTH.samples() == [((), 1)]
+
+    def test_multiprocess_merge(self):
+        """
+        Проверяет объединение значений процессов: счетчики складываются, датчики live
+        завершившихся процессов не учитываются.
+        """
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            (Path(metrics_dir) / 'metrics_999999999.json').write_text(json.dumps({
+                'email_queue_depth': [[[], 2]],
+                'db_connections_in_use': [[[['alias', 'default']], 5]],
+                'import_duration_seconds': [[[['source', 'view']], [1] + [0] * 13 + [0.004, 1]]],
+            }))
+            EMAIL_QUEUE_DEPTH.inc()
+
+            text = REGISTRY.render()
+
+            assert (Path(metrics_dir) / f'metrics_{os.getpid()}.json').exists()
+        assert 'email_queue_depth 3' in text
+        assert 'db_connections_in_use{alias="default"} 5' not in text
+        assert 'import_duration_seconds_count{source="view"} 1' in text
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """
+        Проверяет, что при заданном METRICS_TOKEN метрики выдаются только с токеном.
+        """
+        assert self.client.get(self.url_metrics).status_code == 403
+        assert self.client.get(self.url_metrics, HTTP_AUTHORIZATION='Bearer secret').status_code == 200
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_staff_only(self):
+        """
+        Проверяет, что без METRICS_TOKEN метрики закрыты для анонимов и покупателей и выдаются персоналу
+        по сессии или по токену API.
+        """
+        buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        staff = User.objects.create(email='staff@example.com', username='staff', is_staff=True, is_active=True)
+
+        assert self.client.get(self.url_metrics).status_code == 403
+        assert self.client.get(self.url_metrics, HTTP_AUTHORIZATION='Token wrong').status_code == 403
+        token = Token.objects.create(user=buyer)
+        assert self.client.get(self.url_metrics, HTTP_AUTHORIZATION=f'Token {token.key}').status_code == 403
+        token = Token.objects.create(user=staff)
+        assert self.client.get(self.url_metrics, HTTP_AUTHORIZATION=f'Token {token.key}').status_code == 200
+        self.client.force_login(staff)
+        assert self.client.get(self.url_metrics).status_code == 200
+
+
+class ConnectionPoolTests(TestCase):
+    """
+    Класс для тестирования пула соединений и замера стоимости соединений.
+    """
+
+    def make_connection(self):
+        connection = mock.Mock(closed=0)
+        connection.info.transaction_status = TRANSACTION_STATUS_IDLE
+        self.opened.append(connection)
+        return connection, None
+
+    def setUp(self):
+        self.opened = []
+
+    def test_reuse(self):
+        """
+        Проверяет, что возвращенное в пул соединение выдается повторно.
+        """
+        pool = ConnectionPool(size=2)
+
+        connection, isolation_level = pool.acquire(self.make_connection)
+        pool.release(connection, isolation_level)
+        again, _ = pool.acquire(self.make_connection)
+
+        assert again is connection
+        assert len(self.opened) == 1
+
+    def test_discard_broken(self):
+        """
+        Проверяет, что закрытые и оставленные в транзакции соединения не возвращаются в пул.
+        """
+        pool = ConnectionPool(size=2)
+        connection, _ = pool.acquire(self.make_connection)
+        connection.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        pool.release(connection, None)
+        closed, _ = pool.acquire(self.make_connection)
+        closed.closed = 1
+        pool.release(closed, None)
+
+        assert not pool.idle
+        connection.close.assert_called_once()
+
+    def test_stale_connection_checked(self):
+        """
+        Проверяет, что долго простаивавшее соединение проверяется перед выдачей.
+        """
+        pool = ConnectionPool(size=1, check_after=0)
+        connection, _ = pool.acquire(self.make_connection)
+        pool.release(connection, None)
+        connection.cursor.side_effect = Exception('server closed the connection')
+
+        fresh, _ = pool.acquire(self.make_connection)
+
+        assert fresh is not connection
+        assert len(self.opened) == 2
+
+    def test_exhausted(self):
+        """
+        Проверяет, что при занятых соединениях запрос ждет не дольше timeout.
+        """
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.acquire(self.make_connection)
+
+        with self.assertRaises(OperationalError):
+            pool.acquire(self.make_connection)
+
+    def test_bench_connections(self):
+        """
+        Проверяет, что постоянное соединение открывается один раз, а без него - на каждый запрос.
+        """
+        with tempfile.TemporaryDirectory() as db_dir:
+            settings_dict = {**connection.settings_dict, 'NAME': str(Path(db_dir) / 'bench.sqlite3')}
+            _, opened = simulate_requests({**settings_dict, **MODES['none']}, 'bench_none', 5)
+            _, persistent = simulate_requests({**settings_dict, **MODES['persistent']}, 'bench_persistent', 5)
+
+        assert opened == 5
+        assert persistent == 1
+
+    def test_bench_connections_command(self):
+        """
+        Проверяет вывод команды bench_connections.
+        """
+        out = io.StringIO()
+
+        call_command('bench_connections', requests=3, stdout=out)
+
+        output = out.getvalue()
+        assert 'none' in output and 'persistent' in output
+
+
+class CatalogFixtureMixin:
+    """
+    Два магазина, три предложения с характеристиками, корзина и заказы покупателя.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        other_partner = User.objects.create(email='other@example.com', username='other', type='shop', is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        self.shop = Shop.objects.create(name='Связной', user=self.partner)
+        other_shop = Shop.objects.create(name='Евросеть', user=other_partner)
+        category = Category.objects.create(name='Смартфоны')
+        color = Parameter.objects.create(name='Цвет')
+        contact = Contact.objects.create(user=self.buyer, city='Самара', street='Ленина', phone='+79990000000')
+        offers = []
+        for index, shop in enumerate((self.shop, other_shop, self.shop)):
+            product = Product.objects.create(name=f'Смартфон {index}', category=category)
+            offers.append(ProductInfo.objects.create(product=product, shop=shop, external_id=index, model='xr',
+                                                     quantity=9, price=1000 * (index + 1), price_rrc=5000))
+            ProductParameter.objects.create(product_info=offers[-1], parameter=color, value='красный')
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        OrderItem.objects.create(order=basket, product_info=offers[0], quantity=2)
+        for state in ('new', 'sent'):
+            order = Order.objects.create(user=self.buyer, state=state, contact=contact)
+            OrderItem.objects.create(order=order, product_info=offers[0], quantity=1)
+            OrderItem.objects.create(order=order, product_info=offers[1], quantity=3)
+        Order.objects.create(user=self.buyer, state='new')
+
+
+class ProjectionTests(CatalogFixtureMixin, TestCase):
+    """
+    Класс для тестирования быстрой сериализации: результат должен совпадать с сериализаторами DRF.
+    """
+
+    def drf(self, serializer):
+        return load_json(JSONRenderer().render(serializer.data))
+
+    def test_products(self):
+        """
+        Проверяет, что load_products совпадает с ProductInfoSerializer.
+        """
+        queryset = ProductInfo.objects.select_related('product__category').prefetch_related(
+            'product_parameters__parameter').order_by('id')
+
+        with self.assertNumQueries(2):
+            products = projections.load_products(ProductInfo.objects.all())
+
+        assert load_json(dumps(products)) == self.drf(ProductInfoSerializer(queryset, many=True))
+
+    def test_orders(self):
+        """
+        Проверяет, что load_orders совпадает с OrderSerializer для корзины, заказов покупателя и поставщика.
+        """
+        def annotated(queryset):
+            return queryset.prefetch_related(
+                'ordered_items__product_info__product__category',
+                'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+                total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+
+        basket = Order.objects.filter(user_id=self.buyer.id, state='basket')
+        orders = Order.objects.filter(user_id=self.buyer.id).exclude(state='basket')
+        partner_orders = Order.objects.filter(
+            ordered_items__product_info__shop__user_id=self.partner.id).exclude(state='basket')
+        own_items = Q(product_info__shop__user_id=self.partner.id)
+
+        for queryset, items_filter in ((basket, None), (orders, None), (partner_orders.distinct(), own_items)):
+            expected = self.drf(OrderSerializer(annotated(queryset), many=True))
+            assert load_json(dumps(projections.load_orders(queryset, items_filter))) == expected
+
+    def test_renderer(self):
+        """
+        Проверяет, что UJSONRenderer выдает те же байты, что и JSONRenderer из DRF.
+        """
+        data = {'name': 'Смартфон apple/iphone', 'dt': Order.objects.first().dt, 'line': 'a\u2028b', 'price': 1.5}
+
+        assert UJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+class AsyncViewTests(CatalogFixtureMixin, TestCase):
+    """
+    Класс для тестирования асинхронных представлений чтения.
+    Ответы сравниваются с синхронными представлениями DRF.
+    """
+
+    def test_same_output_as_sync(self):
+        """
+        Проверяет, что асинхронные корзина и заказы отдают то же, что и представления DRF.
+        """
+        for user, sync_name, async_name in ((self.buyer, 'basket', 'async-basket'),
+                                            (self.buyer, 'order', 'async-order'),
+                                            (self.partner, 'partner-orders', 'async-partner-orders')):
+            self.client.force_login(user)
+            expected = self.client.get(reverse(f'backend_orders:{sync_name}')).json()
+            response = self.client.get(reverse(f'backend_orders:{async_name}'))
+
+            assert response.status_code == 200
+            assert response.json() == expected, async_name
+
+    def test_products(self):
+        """
+        Проверяет список товаров, фильтры и карточку товара.
+        """
+        expected = ProductInfoSerializer(ProductInfo.objects.order_by('id'), many=True).data
+
+        response = self.client.get(reverse('backend_orders:async-products'))
+        assert response.json() == load_json(json.dumps(expected))
+
+        response = self.client.get(reverse('backend_orders:async-products'), {'shop_id': self.shop.id})
+        assert [item['shop'] for item in response.json()] == [self.shop.id, self.shop.id]
+
+        response = self.client.get(reverse('backend_orders:async-product-detail', args=(expected[0]['id'],)))
+        assert response.json() == load_json(json.dumps(expected[0]))
+
+        response = self.client.get(reverse('backend_orders:async-products'), {'shop_id': 'x'})
+        assert response.status_code == 400
+
+    def test_products_cache_invalidated(self):
+        """
+        Проверяет, что список товаров берется из кэша, а отключение магазина сбрасывает кэш.
+        """
+        url = reverse('backend_orders:async-products')
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            assert len(self.client.get(url).json()) == 3
+
+        self.client.force_login(self.partner)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'off'})
+        assert len(self.client.get(url).json()) == 1
+
+    def test_products_pages(self):
+        """
+        Проверяет, что список товаров отдается и кэшируется страницами, а адрес следующей страницы
+        приходит в заголовке Link.
+        """
+        url = reverse('backend_orders:async-products')
+        expected = self.client.get(url).json()
+
+        response = self.client.get(url, {'limit': 2})
+        assert response.json() == expected[:2]
+        assert response['Link'] == f'<http://testserver{url}?limit=2&offset=2>; rel="next"'
+
+        response = self.client.get(url, {'limit': 2, 'offset': 2})
+        assert response.json() == expected[2:]
+        assert not response.has_header('Link')
+        with self.assertNumQueries(0):
+            assert self.client.get(url, {'limit': 2, 'offset': 2}).json() == expected[2:]
+
+        with mock.patch('backend_orders.async_views.PRODUCTS_PAGE_SIZE', 1):
+            response = self.client.get(url, {'limit': 100})
+        assert response.json() == expected[:1]
+
+        for params in ({'offset': -1}, {'limit': 0}, {'limit': 'x'}):
+            assert self.client.get(url, params).status_code == 400
+
+    def test_token_auth(self):
+        """
+        Проверяет аутентификацию по заголовку Authorization: Token.
+        """
+        url = reverse('backend_orders:async-basket')
+        token = Token.objects.create(user=self.buyer)
+
+        assert self.client.get(url).status_code == 403
+        assert self.client.get(url, HTTP_AUTHORIZATION='Token wrong').status_code == 403
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {token.key}')
+        assert response.json()[0]['total_sum'] == 2000
+
+        self.client.force_login(self.buyer)
+        assert self.client.get(reverse('backend_orders:async-partner-orders')).status_code == 403
+
+
+class RendererTests(CatalogFixtureMixin, APITestCase):
+    """
+    Класс для тестирования рендерера и парсера на ujson во всех представлениях API.
+    """
+
+    def test_cyrillic_not_escaped(self):
+        """
+        Проверяет, что кириллица в ответах API и JsonResponse не экранируется.
+        """
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(reverse('backend_orders:basket'))
+        assert 'Смартфон 0'.encode() in response.content
+        response = self.client.put(reverse('backend_orders:basket'), {'items': 'x'})
+        assert 'Неверный формат запроса'.encode() in response.content
+
+    def test_basket_items_as_list(self):
+        """
+        Проверяет, что в JSON-запросе позиции корзины можно передать списком, а не строкой.
+        """
+        self.client.force_authenticate(self.buyer)
+        offer = ProductInfo.objects.filter(shop=self.shop).last()
+        response = self.client.post(reverse('backend_orders:basket'),
+                                    {'items': [{'product_info': offer.id, 'quantity': 1}]}, format='json')
+
+        assert response.json() == {'Status': True, 'Создано объектов': 1}
+        item = OrderItem.objects.get(order__state='basket', product_info=offer)
+
+        response = self.client.delete(reverse('backend_orders:basket'), {'items': [item.id]}, format='json')
+        assert response.json()['Удалено объектов'] == 1
+
+    def test_parse_error(self):
+        """
+        Проверяет, что некорректный JSON в теле запроса возвращает 400.
+        """
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post(reverse('backend_orders:basket'), '{"items": [', content_type='application/json')
+
+        assert response.status_code == 400
+
+    def test_streaming_products(self):
+        """
+        Проверяет, что список товаров, отданный из временного файла, совпадает с load_products и учитывает фильтры.
+        """
+        url = reverse('backend_orders:products-list')
+        response = self.client.get(url)
+
+        assert response.streaming
+        expected = projections.load_products(ProductInfo.objects.all())
+        assert load_json(b''.join(response.streaming_content)) == load_json(dumps(expected))
+
+        response = self.client.get(url, {'shop_id': self.shop.id})
+        assert len(load_json(b''.join(response.streaming_content))) == 2
+
+    def test_products_asgi(self):
+        """
+        Проверяет список товаров через асинхронный клиент: тело ответа читается в цикле событий без запросов к базе.
+        """
+        response, body = asgi_get(AsyncClient(), reverse('backend_orders:products-list'), {'shop_id': self.shop.id})
+
+        assert response.status_code == 200
+        expected = projections.load_products(ProductInfo.objects.filter(shop_id=self.shop.id))
+        assert load_json(body) == load_json(dumps(expected))
+
+    def test_iter_json_array(self):
+        """
+        Проверяет склейку JSON-массива из пакетов.
+        """
+        for count in (0, 1, 5, 6):
+            assert load_json(''.join(iter_json_array(range(count), batch_size=3))) == list(range(count))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionTests(CatalogFixtureMixin, TestCase):
+    """
+    Класс для тестирования сжатия ответов по Accept-Encoding.
+    """
+
+    def test_choose_encoding(self):
+        """
+        Проверяет выбор кодировки по заголовку Accept-Encoding.
+        """
+        assert choose_encoding('gzip, deflate') == 'gzip'
+        assert choose_encoding('gzip;q=0, deflate') is None
+        assert choose_encoding('*') == 'gzip'
+        assert choose_encoding('') is None
+        with mock.patch('backend_orders.compression.brotli', object()):
+            assert choose_encoding('gzip, br') == 'br'
+            assert choose_encoding('gzip, br;q=0.5') == 'gzip'
+
+    def test_gzip(self):
+        """
+        Проверяет сжатие ответа и порог размера.
+        """
+        self.client.force_login(self.buyer)
+        url = reverse('backend_orders:order')
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert 'Content-Encoding' not in plain
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert gzip.decompress(response.content) == plain.content
+
+        self.client.logout()
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response.status_code == 403
+        assert 'Content-Encoding' not in response
+
+    def test_streaming(self):
+        """
+        Проверяет сжатие потокового списка товаров на лету.
+        """
+        url = reverse('backend_orders:products-list')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.streaming_content)) == plain
+
+    def test_async_middleware(self):
+        """
+        Проверяет сжатие в асинхронной цепочке и потоковое сжатие асинхронного итератора.
+        """
+        async def get_response(request):
+            return HttpResponse(b'x' * 1000, content_type='application/json')
+
+        async def chunks():
+            for _ in range(100):
+                yield b'{"model": "iphone"}'
+
+        async def compress_chunks():
+            return b''.join([data async for data in acompress_stream(chunks(), 'gzip')])
+
+        middleware = CompressionMiddleware(get_response)
+        response = async_to_sync(middleware)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        assert iscoroutinefunction(middleware)
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == b'x' * 1000
+        assert gzip.decompress(async_to_sync(compress_chunks)()) == b'{"model": "iphone"}' * 100
+
+    def test_precompressed_catalog(self):
+        """
+        Проверяет, что асинхронный список товаров хранит сжатый вариант в кэше.
+        """
+        url = reverse('backend_orders:async-products')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert load_json(gzip.decompress(response.content)) == self.client.get(url).json()
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert cached.content == response.content
+        assert cached['Vary'] == 'Accept-Encoding'
+
+
+class ColumnarFormatTests(CatalogFixtureMixin, APITestCase):
+    """
+    Класс для тестирования колоночного формата списка товаров.
+    """
+
+    def expand(self, data):
+        """
+        Восстанавливает предложения в формате ProductInfoSerializer из колоночного ответа.
+        """
+        columns, parameters = data['columns'], data['parameters']
+        products = []
+        for index in range(data['count']):
+            start, end = parameters['offsets'][index], parameters['offsets'][index + 1]
+            products.append({
+                'id': columns['id'][index],
+                'model': columns['model'][index],
+                'product': {'name': columns['name'][index], 'category': data['categories'][columns['category'][index]]},
+                'shop': columns['shop'][index],
+                'quantity': columns['quantity'][index],
+                'price': columns['price'][index],
+                'price_rrc': columns['price_rrc'][index],
+                'product_parameters': [{'parameter': parameters['names'][name], 'value': value} for name, value in
+                                       zip(parameters['parameter'][start:end], parameters['value'][start:end])],
+            })
+        return products
+
+    def test_same_data_as_json(self):
+        """
+        Проверяет, что колоночный ответ содержит те же данные, что и JSON, и выбирается по ?format и Accept.
+        """
+        url = reverse('backend_orders:products-list')
+        expected = load_json(b''.join(self.client.get(url).streaming_content))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'format': 'columnar'})
+        assert response['Content-Type'] == 'application/vnd.orders.columnar+json'
+        data = load_json(response.content)
+        assert data['categories'] == ['Смартфоны']
+        assert data['parameters']['names'] == ['Цвет']
+        assert self.expand(data) == expected
+
+        response = self.client.get(url, {'shop_id': self.shop.id}, HTTP_ACCEPT='application/vnd.orders.columnar+json')
+        assert self.expand(load_json(response.content)) == [item for item in expected if item['shop'] == self.shop.id]
+
+    def test_detail(self):
+        """
+        Проверяет карточку товара в колоночном виде.
+        """
+        product = ProductInfo.objects.order_by('id').first()
+        url = reverse('backend_orders:products-detail', args=(product.id,))
+        response = self.client.get(url, {'format': 'columnar'})
+
+        assert load_json(response.content)['columns']['id'] == [product.id]
+        response = self.client.get(reverse('backend_orders:products-detail', args=(0,)), {'format': 'columnar'})
+        assert response.status_code == 404
+
+    @skipIf(msgpack is None, 'не установлен пакет msgpack')
+    def test_msgpack(self):
+        """
+        Проверяет ответ в msgpack.
+        """
+        url = reverse('backend_orders:products-list')
+        columnar = load_json(self.client.get(url, {'format': 'columnar'}).content)
+        response = self.client.get(url, {'format': 'msgpack'})
+
+        assert response['Content-Type'] == 'application/x-msgpack'
+        assert msgpack.unpackb(response.content) == columnar
+
+
+class CatalogChangesTests(APITestCase):
+    """
+    Класс для тестирования журнала изменений предложений и ленты /product/changes.
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        self.price = {
+            'shop': 'Связной',
+            'categories': [{'id': 224, 'name': 'Смартфоны'}],
+            'goods': [
+                {'id': external_id, 'category': 224, 'model': 'apple/iphone/xr', 'name': f'Смартфон {external_id}',
+                 'price': 65000, 'price_rrc': 69990, 'quantity': 5, 'parameters': {'Цвет': 'красный', 'Память': 256}}
+                for external_id in (1, 2, 3)
+            ],
+        }
+        self.url = reverse('backend_orders:products-changes')
+        import_price(self.partner.id, self.price)
+        self.client.force_authenticate(self.buyer)
+
+    def changes(self, since, **params):
+        response = self.client.get(self.url, {'since': since, **params})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_reimport_logs_only_difference(self):
+        """
+        Проверяет, что повторный импорт сохраняет id предложений и пишет в журнал только разницу.
+        """
+        ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+        cursor = self.changes(0)['cursor']
+
+        price = deepcopy(self.price)
+        price['goods'][0]['price'] = 60000
+        price['goods'][1]['parameters']['Цвет'] = 'черный'
+        del price['goods'][2]
+        price['goods'].append(dict(price['goods'][0], id=4))
+        result = import_price(self.partner.id, price)
+
+        assert result == {'inserted': 1, 'updated': 2, 'deleted': 1, 'products_created': 0,
+                          'merged': [], 'mismatched': []}
+        assert dict(ProductInfo.objects.filter(external_id__in=(1, 2)).values_list('external_id', 'id')) == \
+            {1: ids[1], 2: ids[2]}
+        assert import_price(self.partner.id, price) == {'inserted': 0, 'updated': 0, 'deleted': 0,
+                                                        'products_created': 0, 'merged': [], 'mismatched': []}
+
+        data = self.changes(cursor)
+        upserted = {item['id']: item for item in data['upserted']}
+        assert upserted[ids[1]]['price'] == 60000
+        assert {'parameter': 'Цвет', 'value': 'черный'} in upserted[ids[2]]['product_parameters']
+        assert len(upserted) == 3
+        assert data['removed'] == [ids[3]]
+        assert self.changes(data['cursor']) == {'cursor': data['cursor'], 'has_more': False, 'upserted': [],
+                                                'removed': []}
+
+    def test_reimport_batches_writes(self):
+        """
+        Проверяет, что импорт пишет предложения и характеристики пачками, а блокировка журнала берется
+        только после сопоставления категорий, продуктов и характеристик.
+        """
+        price = deepcopy(self.price)
+        for item in price['goods']:
+            item['price'] += 1
+            item['parameters'] = {'Цвет': 'черный', 'Вес (г)': 194}
+        price['goods'].extend(dict(price['goods'][0], id=external_id, name=f'Смартфон {external_id}')
+                              for external_id in (4, 5, 6))
+        locked = []
+
+        with CaptureQueriesContext(connection) as context, mock.patch(
+                'backend_orders.importer.lock_change_log',
+                side_effect=lambda: locked.append(len(context.captured_queries))):
+            result = import_price(self.partner.id, price)
+
+        assert result == {'inserted': 3, 'updated': 3, 'deleted': 0, 'products_created': 3,
+                          'merged': [], 'mismatched': []}
+        statements = [query['sql'] for query in context.captured_queries]
+        for prefix in ('INSERT INTO "backend_orders_productinfo"', 'UPDATE "backend_orders_productinfo"',
+                       'DELETE FROM "backend_orders_productparameter"',
+                       'INSERT INTO "backend_orders_productparameter"'):
+            assert sum(sql.startswith(prefix) for sql in statements) == 1, prefix
+        assert len(locked) == 1
+        assert not [sql for sql in statements[locked[0]:] if sql.startswith((
+            'INSERT INTO "backend_orders_product" ', 'INSERT INTO "backend_orders_category" ',
+            'INSERT INTO "backend_orders_parameter" '))]
+        assert ProductParameter.objects.filter(product_info__shop__user=self.partner).count() == 12
+
+    def test_cursor_and_pages(self):
+        """
+        Проверяет текущий курсор без since, постраничное чтение и проверку аргументов.
+        """
+        response = self.client.get(self.url)
+        assert response.json()['cursor'] == ProductInfoChange.objects.order_by('-seq').first().seq
+
+        first = self.changes(0, limit=2)
+        assert first['has_more'] is True
+        assert len(first['upserted']) == 2
+        second = self.changes(first['cursor'], limit=2)
+        assert second['has_more'] is False
+        assert len(second['upserted']) == 1
+
+        assert self.client.get(self.url, {'since': 'x'}).status_code == 400
+
+    def test_checkout_reserves_stock(self):
+        """
+        Проверяет списание остатков при оформлении заказа и запись изменения в журнал.
+        """
+        offer = ProductInfo.objects.get(external_id=1)
+        contact = Contact.objects.create(user=self.buyer, city='Самара', street='Ленина', phone='+79990000000')
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        item = OrderItem.objects.create(order=basket, product_info=offer, quantity=6)
+        cursor = self.changes(0)['cursor']
+        data = {'id': str(basket.id), 'contact': str(contact.id)}
+
+        response = self.client.post(reverse('backend_orders:order'), data)
+        assert response.json()['product_info'] == [offer.id]
+        assert Order.objects.get(id=basket.id).state == 'basket'
+
+        item.quantity = 2
+        item.save()
+        with mock.patch('backend_orders.views.send_email'):
+            assert self.client.post(reverse('backend_orders:order'), data).json() == {'Status': True}
+        assert ProductInfo.objects.get(id=offer.id).quantity == 3
+        assert [item['quantity'] for item in self.changes(cursor)['upserted']] == [3]
+        # оформленный заказ повторно не оформляется и остатки не списываются
+        assert self.client.post(reverse('backend_orders:order'), data).json()['Status'] is False
+        assert ProductInfo.objects.get(id=offer.id).quantity == 3
+
+    def test_shop_state(self):
+        """
+        Проверяет, что отключение магазина попадает в ленту как удаление его предложений.
+        """
+        cursor = self.changes(0)['cursor']
+        self.client.force_authenticate(self.partner)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'off'})
+        self.client.force_authenticate(self.buyer)
+
+        data = self.changes(cursor)
+        assert data['upserted'] == []
+        assert data['removed'] == sorted(ProductInfo.objects.values_list('id', flat=True))
+
+
+class ShopVisibilityTests(APITestCase):
+    """
+    Класс для тестирования видимости предложений в каталоге при включении и отключении магазина.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        self.shops = []
+        for i in range(2):
+            partner = User.objects.create(email=f'shop{i}@example.com', username=f'shop{i}', type='shop',
+                                          is_active=True)
+            import_price(partner.id, {
+                'shop': f'Магазин {i}',
+                'categories': [{'id': 1, 'name': 'Смартфоны'}],
+                'goods': [{'id': j, 'category': 1, 'model': 'm', 'name': f'Смартфон {i}{j}', 'price': 1000,
+                           'price_rrc': 1200, 'quantity': 1, 'parameters': {}} for j in range(2)],
+            })
+            self.shops.append(Shop.objects.get(user=partner))
+
+    def catalog(self):
+        self.client.force_authenticate(self.buyer)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('backend_orders:products-list'))
+        # каталог не соединяет предложения с магазинами
+        assert not any('"backend_orders_shop"' in query['sql'] for query in context.captured_queries)
+        return sorted(item['id'] for item in load_json(b''.join(response.streaming_content)))
+
+    def offers(self, shop):
+        return sorted(ProductInfo.objects.filter(shop=shop).values_list('id', flat=True))
+
+    def test_partner_state(self):
+        """
+        Проверяет, что отключение магазина сразу скрывает его предложения, а включение возвращает.
+        """
+        assert self.catalog() == self.offers(self.shops[0]) + self.offers(self.shops[1])
+        self.client.force_authenticate(self.shops[0].user)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'off'})
+        assert not ProductInfo.objects.filter(shop=self.shops[0], is_visible=True).exists()
+        assert self.catalog() == self.offers(self.shops[1])
+
+        # новые предложения отключенного магазина тоже скрыты
+        import_price(self.shops[0].user_id, {
+            'shop': 'Магазин 0', 'categories': [{'id': 1, 'name': 'Смартфоны'}],
+            'goods': [{'id': 5, 'category': 1, 'model': 'm', 'name': 'Смартфон 05', 'price': 1000, 'price_rrc': 1200,
+                       'quantity': 1, 'parameters': {}}]})
+        assert self.catalog() == self.offers(self.shops[1])
+        url = reverse('backend_orders:async-product-detail', args=(self.offers(self.shops[0])[0],))
+        assert self.client.get(url).status_code == 404
+
+        self.client.force_authenticate(self.shops[0].user)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'on'})
+        assert self.catalog() == sorted(self.offers(self.shops[0]) + self.offers(self.shops[1]))
+
+    def test_admin_state(self):
+        """
+        Проверяет, что смена статуса в админке тоже меняет видимость предложений.
+        """
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass3450', is_active=True)
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:backend_orders_shop_changelist'),
+                                    {'action': 'make_disabled', '_selected_action': [shop.id for shop in self.shops]})
+        assert response.status_code == 302
+        assert self.catalog() == []
+        assert Category.objects.get(name='Смартфоны').offer_count == 0
+
+        shop = self.shops[1]
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:backend_orders_shop_change', args=(shop.id,)),
+                                    {'name': 'Новое название', 'url': '', 'user': shop.user_id, 'state': 'on'})
+        assert response.status_code == 302
+        assert Shop.objects.filter(id=shop.id, name='Новое название', state=True).exists()
+        assert self.catalog() == self.offers(shop)
+
+
+class ProductMatchingTests(TestCase):
+    """
+    Класс для тестирования сопоставления товаров разных поставщиков с одним продуктом при импорте.
+    """
+
+    def setUp(self):
+        self.first = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.second = User.objects.create(email='other@example.com', username='other', type='shop', is_active=True)
+        with open(Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml', 'rb') as file:
+            self.price = load_yaml(file, Loader=Loader)
+
+    def test_tokens(self):
+        """
+        Проверяет нормализацию названия и модели.
+        """
+        assert match_tokens('Смартфон Apple iPhone XR 64GB (красный)', 'apple/iphone/xr') == \
+            {'смартфон', 'apple', 'iphone', 'xr', '64', 'gb', 'красныи'}
+        assert match_tokens('Флешка «Ёлка» 16Gb') == {'флешка', 'елка', '16', 'gb'}
+
+    def test_matcher(self):
+        """
+        Проверяет, что опечатки и лишние слова не мешают сопоставлению, а другие числа и цвета не сливаются.
+        """
+        matcher = ProductMatcher()
+        matcher.add(1, match_tokens('Смартфон Apple iPhone XR 256GB (красный)', 'apple/iphone/xr'))
+        matcher.add(2, match_tokens('Смартфон Apple iPhone XR 256GB (черный)', 'apple/iphone/xr'))
+        matcher.add(3, match_tokens('Смартфон Apple iPhone XR 64GB (красный)', 'apple/iphone/xr'))
+
+        assert matcher.match(match_tokens('Смартфон iPhone XR 256GB красный', 'Apple/iPhone/XR')) == (1, 1.0)
+        product_id, score = matcher.match(match_tokens('Смарфон Apple iPhone XR 256GB (красный) новинка',
+                                                       'apple/iphone/xr'))
+        assert product_id == 1 and 0.9 <= score < 1
+        assert matcher.match(match_tokens('Смартфон Apple iPhone XR 256GB (Чёрный)', 'apple/iphone/xr')) == (2, 1.0)
+        assert matcher.match(match_tokens('Смартфон Apple iPhone XR 128GB (красный)', 'apple/iphone/xr'))[0] is None
+        assert matcher.match(match_tokens('Смартфон Apple iPhone XR 256GB (белый)', 'apple/iphone/xr'))[0] is None
+
+    def test_matcher_model_tokens(self):
+        """
+        Проверяет, что близкие обозначения моделей и объемов памяти не сливаются даже при высокой похожести набора.
+        """
+        matcher = ProductMatcher()
+        matcher.add(1, match_tokens('Смартфон Apple iPhone XR 128GB (красный)', 'apple/iphone/xr'))
+
+        near_misses = [match_tokens('Смартфон Apple iPhone XS 128GB (красный)', 'apple/iphone/xs'),
+                       match_tokens('Смартфон Apple iPhone XR 256GB (красный)', 'apple/iphone/xr'),
+                       match_tokens('Смартфон Apple iPhone XR 128TB (красный)', 'apple/iphone/xr')]
+        for tokens in near_misses:
+            assert matcher.match(tokens) == (None, 0), tokens
+        assert matcher.score(match_tokens('Apple iPhone XS 64GB'), match_tokens('Apple iPhone XR 64GB')) == 0
+        assert matcher.match(match_tokens('Смартфон Apple iPhone XR 128GB (красный) новинка',
+                                          'apple/iphone/xr'))[0] == 1
+
+    def test_import_merges_products(self):
+        """
+        Проверяет, что прайс второго поставщика присоединяется к продуктам первого, и отчет о слияниях.
+        """
+        first = import_price(self.first.id, self.price)
+        products = Product.objects.count()
+        assert first['products_created'] == products and first['merged'] == []
+
+        price = deepcopy(self.price)
+        price['shop'] = 'Евросеть'
+        price['goods'][0]['name'] = price['goods'][0]['name'].replace('Смартфон ', '').upper()
+        price['goods'][1]['name'] = price['goods'][1]['name'].replace('Смартфон', 'Смарфон') + ' новинка'
+        price['goods'][2]['name'] = price['goods'][2]['name'].replace('256GB', '128GB')
+        price['goods'][2]['model'] = 'apple/iphone-xr'
+        second = import_price(self.second.id, price)
+
+        assert second['products_created'] == 1
+        assert Product.objects.count() == products + 1
+        assert [(merge['id'], merge['product_name']) for merge in second['merged']] == [
+            (item['id'], item['name']) for item in self.price['goods'][:2]]
+        for item in self.price['goods'][:2]:
+            assert ProductInfo.objects.filter(product__name=item['name']).count() == 2
+        assert ProductOffers.objects.get(product__name=self.price['goods'][0]['name']).shop_count == 2
+
+        assert import_price(self.second.id, price) == {'inserted': 0, 'updated': 0, 'deleted': 0,
+                                                       'products_created': 0, 'merged': second['merged'],
+                                                       'mismatched': []}
+
+
+class ParameterDictionaryTests(TestCase):
+    """
+    Класс для тестирования справочника характеристик с каноническими ключами.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        with open(Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml', 'rb') as file:
+            self.price = load_yaml(file, Loader=Loader)
+
+    def test_parameter_key(self):
+        """
+        Проверяет приведение вариантов написания к одному ключу.
+        """
+        for name in ('Диагональ (дюйм)', ' диагональ,  дюймы ', 'ДИАГОНАЛЬ  (")', 'Диагональ (in)'):
+            assert parameter_key(name) == 'диагональ (дюйм)', name
+        assert parameter_key('Встроенная память (Гб)') == parameter_key('встроенная память, GB')
+        assert parameter_key('Цвёт') == 'цвет'
+        assert parameter_key('Цвет, оттенок') == 'цвет, оттенок'
+        assert Parameter.objects.create(name='Вес (гр)').key == 'вес (г)'
+
+    def test_import_variants(self):
+        """
+        Проверяет, что варианты названий не создают новых характеристик и не считаются изменением.
+        """
+        import_price(self.user.id, self.price)
+        parameters = set(Parameter.objects.values_list('id', 'name'))
+        values = set(ProductParameter.objects.values_list('product_info_id', 'parameter_id', 'value'))
+
+        price = deepcopy(self.price)
+        for item in price['goods']:
+            item['parameters'] = {f"  {name.upper().replace(' (ГБ)', ', GB')} ": value
+                                  for name, value in item['parameters'].items()}
+        assert import_price(self.user.id, price) == {'inserted': 0, 'updated': 0, 'deleted': 0,
+                                                     'products_created': 0, 'merged': [], 'mismatched': []}
+        assert set(Parameter.objects.values_list('id', 'name')) == parameters
+        assert set(ProductParameter.objects.values_list('product_info_id', 'parameter_id', 'value')) == values
+
+    def test_dictionary_queries(self):
+        """
+        Проверяет, что справочник загружается и пополняется постоянным числом запросов.
+        """
+        Parameter.objects.create(name='Цвет')
+        names = ['цвет', 'ЦВЕТ'] + [f'Характеристика {i}, мм' for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            parameters = ParameterDictionary()
+            parameters.resolve(dict.fromkeys(names, ['10']))
+        assert len(queries) == 3
+        assert parameters['цвет'] == parameters['ЦВЕТ'] == Parameter.objects.get(name='Цвет').id
+        assert Parameter.objects.get(id=parameters['Характеристика 7, мм']).key == 'характеристика 7 (мм)'
+        assert Parameter.objects.count() == 51
+
+
+class ParameterFilterTests(APITestCase):
+    """
+    Класс для тестирования типизированных значений характеристик, фильтров и сортировки каталога по ним.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.partner = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        with open(Path(__file__).resolve().parents[2] / 'data' / 'shop1.yaml', 'rb') as file:
+            self.price = load_yaml(file, Loader=Loader)
+        import_price(self.partner.id, self.price)
+        self.diagonal, self.resolution, self.memory, self.color = (
+            Parameter.objects.get(key=parameter_key(name)) for name in (
+                'Диагональ (дюйм)', 'Разрешение (пикс)', 'Встроенная память (Гб)', 'Цвет'))
+        self.client.force_authenticate(self.buyer)
+
+    def names(self, goods):
+        return sorted(item['name'] for item in goods)
+
+    def get_names(self, params, ordered=False):
+        response = self.client.get(reverse('backend_orders:products-list'), params)
+        assert response.status_code == 200
+        names = [item['product']['name'] for item in load_json(b''.join(response.streaming_content))]
+        return names if ordered else sorted(names)
+
+    def test_value_types(self):
+        """
+        Проверяет разбор значений, определение типа характеристики при импорте и заполнение колонок.
+        """
+        assert parse_number('6,5') == 6.5 and parse_number('6.5 дюйма') is None
+        assert parse_dimension('1920 х 1080') == (1920, 1080) and parse_dimension('1920') is None
+        assert infer_type(['6.5', '6']) == NUMBER and infer_type(['2688x1242']) == DIMENSION
+        assert infer_type(['6.5', '2688x1242']) == TEXT and infer_type([]) == TEXT
+
+        assert (self.diagonal.value_type, self.resolution.value_type, self.memory.value_type,
+                self.color.value_type) == (NUMBER, DIMENSION, NUMBER, TEXT)
+        parameter = ProductParameter.objects.filter(parameter=self.resolution).first()
+        assert (parameter.value_width, parameter.value_height) == parse_dimension(parameter.value)
+        assert parameter.value_number is None
+        assert not ProductParameter.objects.filter(parameter=self.color, value_number__isnull=False).exists()
+
+    def test_type_mismatch(self):
+        """
+        Проверяет, что значение, не подходящее под тип, не меняет тип характеристики и не трогает значения
+        других предложений: у этого значения пусты только типизированные колонки, а строка попадает в отчет.
+        """
+        item = self.price['goods'][0]
+        item['parameters']['Диагональ (дюйм)'] = 'нет данных'
+        report = import_price(self.partner.id, self.price)
+
+        self.diagonal.refresh_from_db()
+        assert self.diagonal.value_type == NUMBER
+        assert report['mismatched'] == [{'id': item['id'], 'parameter': 'Диагональ (дюйм)', 'value': 'нет данных'}]
+        parameter = ProductParameter.objects.get(parameter=self.diagonal, product_info__external_id=item['id'])
+        assert (parameter.value, parameter.value_number) == ('нет данных', None)
+        assert ProductParameter.objects.filter(parameter=self.diagonal, value_number__isnull=False).count() == \
+            len(self.price['goods']) - 1
+        assert self.get_names({f'parameter_{self.diagonal.id}': '6..'}) == self.names(self.price['goods'][1:])
+
+    def test_filters(self):
+        """
+        Проверяет фильтры по диапазону, точному значению и размеру.
+        """
+        goods = self.price['goods']
+        assert self.get_names({f'parameter_{self.diagonal.id}': '6.2..'}) == self.names(
+            item for item in goods if item['parameters']['Диагональ (дюйм)'] >= 6.2)
+        assert self.get_names({f'parameter_{self.memory.id}': '..256', f'parameter_{self.diagonal.id}': '6,1'}) == \
+            self.names(item for item in goods if item['parameters']['Встроенная память (Гб)'] <= 256
+                       and item['parameters']['Диагональ (дюйм)'] == 6.1)
+        assert self.get_names({f'parameter_{self.resolution.id}': '2000x1000..'}) == self.names(
+            item for item in goods if item['parameters']['Разрешение (пикс)'] == '2688x1242')
+        assert self.get_names({f'parameter_{self.color.id}': 'красный'}) == self.names(
+            item for item in goods if item['parameters']['Цвет'] == 'красный')
+
+        url = reverse('backend_orders:products-list')
+        for params in ({f'parameter_{self.color.id}': 'а..я'}, {f'parameter_{self.diagonal.id}': 'много..'},
+                       {f'parameter_{self.diagonal.id}': '..'}, {f'parameter_{self.resolution.id}': '1920..'},
+                       {'parameter_0': '1..'}, {'sort': 'parameter_x'}, {'sort': 'parameter_0'}):
+            assert self.client.get(url, params).status_code == 400, params
+
+    def test_sort(self):
+        """
+        Проверяет сортировку по значению характеристики в синхронном и асинхронном списке.
+        """
+        goods = self.price['goods']
+        # при равных значениях предложения идут по id, то есть в порядке прайса
+        expected = [item['name'] for item in sorted(
+            goods, key=lambda item: -item['parameters']['Встроенная память (Гб)'])]
+        assert self.get_names({'sort': f'-parameter_{self.memory.id}'}, ordered=True) == expected
+        resolutions = [item['parameters']['Разрешение (пикс)'] for item in sorted(
+            goods, key=lambda item: parse_dimension(item['parameters']['Разрешение (пикс)']))]
+        response = self.client.get(reverse('backend_orders:async-products'), {
+            'sort': f'parameter_{self.resolution.id}', f'parameter_{self.memory.id}': '1..'})
+        assert [next(parameter['value'] for parameter in item['product_parameters']
+                     if parameter['parameter'] == self.resolution.name) for item in response.json()] == resolutions
+
+
+class CategoryTreeTests(APITestCase):
+    """
+    Класс для тестирования дерева категорий, категорий магазинов и счетчиков продуктов и предложений.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.first = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.second = User.objects.create(email='other@example.com', username='other', type='shop', is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        self.categories = [{'id': 1, 'name': 'Электроника'}, {'id': 224, 'name': 'Смартфоны', 'parent': 1},
+                           {'id': 5, 'name': 'Телевизоры', 'parent': 1}]
+        import_price(self.first.id, self.price('Связной', [(1, 224, 'Смартфон 1'), (2, 224, 'Смартфон 2'),
+                                                           (3, 5, 'Телевизор 1')]))
+        self.client.force_authenticate(self.buyer)
+
+    def price(self, shop, goods, categories=None):
+        return {
+            'shop': shop,
+            'categories': categories or self.categories,
+            'goods': [{'id': external_id, 'category': category, 'model': 'm', 'name': name, 'price': 1000,
+                       'price_rrc': 1200, 'quantity': 1, 'parameters': {}}
+                      for external_id, category, name in goods],
+        }
+
+    def counts(self):
+        return {name: (product_count, offer_count) for name, product_count, offer_count in
+                Category.objects.values_list('name', 'product_count', 'offer_count')}
+
+    def assert_counts_consistent(self):
+        counts = self.counts()
+        recount_categories()
+        assert self.counts() == counts
+
+    def test_paths(self):
+        """
+        Проверяет материализованные пути, выборку поддерева и перенос категории.
+        """
+        root, phones, tvs = (Category.objects.get(name=name) for name in ('Электроника', 'Смартфоны', 'Телевизоры'))
+        assert phones.parent_id == root.id and phones.path == f'{root.id:010d}{phones.id:010d}'
+        assert set(Category.objects.filter(Category.subtree_query(root.path)).values_list('name', flat=True)) == {
+            'Электроника', 'Смартфоны', 'Телевизоры'}
+        assert list(Category.objects.filter(Category.subtree_query(phones.path))) == [phones]
+
+        tvs.parent = phones
+        tvs.save()
+        child = Category.objects.create(name='OLED', parent=tvs)
+        assert child.path == f'{root.id:010d}{phones.id:010d}{tvs.id:010d}{child.id:010d}'
+        assert self.counts()['Смартфоны'] == (3, 3)
+        self.assert_counts_consistent()
+        phones.parent = child
+        with self.assertRaises(ValidationError):
+            phones.clean()
+
+    def test_shop_categories(self):
+        """
+        Проверяет, что id категорий прайса действуют только внутри магазина.
+        """
+        import_price(self.second.id, self.price('Евросеть', [(1, 224, 'Кабель 1'), (2, 7, 'Смартфон 3')], [
+            {'id': 224, 'name': 'Кабели'}, {'id': 7, 'name': 'Смартфоны', 'parent': 3},
+            {'id': 3, 'name': 'Электроника'}]))
+        phones = Category.objects.get(name='Смартфоны')
+        assert Product.objects.get(name='Кабель 1').category.name == 'Кабели'
+        assert Product.objects.get(name='Смартфон 3').category == phones
+        assert dict(ShopCategory.objects.filter(shop__user=self.second).values_list('external_id', 'category')) == {
+            224: Category.objects.get(name='Кабели').id, 7: phones.id, 3: phones.parent_id}
+
+        self.client.force_authenticate(self.second)
+        data = load_yaml(b''.join(self.client.get(reverse('backend_orders:partner-export')).streaming_content),
+                         Loader=Loader)
+        assert data['categories'] == [{'id': 3, 'name': 'Электроника'}, {'id': 7, 'name': 'Смартфоны', 'parent': 3},
+                                      {'id': 224, 'name': 'Кабели'}]
+        assert [item['category'] for item in data['goods']] == [224, 7]
+
+    def test_shop_category_links(self):
+        """
+        Проверяет, что импорт переписывает связи магазина с категориями разностью и список категорий магазина.
+        """
+        shop = Shop.objects.get(user=self.first)
+        links = set(CategoryShop.objects.filter(shop=shop).values_list('id', flat=True))
+        assert set(shop.categories.values_list('name', flat=True)) == {'Электроника', 'Смартфоны', 'Телевизоры'}
+
+        categories = self.categories[:2] + [{'id': 9, 'name': 'Кабели'}]
+        with CaptureQueriesContext(connection) as context:
+            import_price(self.first.id, self.price('Связной', [(1, 224, 'Смартфон 1'), (4, 9, 'Кабель 1')],
+                                                   categories))
+        link_queries = [query['sql'] for query in context.captured_queries if 'category_shops' in query['sql']]
+        assert len(link_queries) == 3
+        assert set(shop.categories.values_list('name', flat=True)) == {'Электроника', 'Смартфоны', 'Кабели'}
+        # связи с оставшимися категориями не пересоздаются
+        assert len(links & set(CategoryShop.objects.filter(shop=shop).values_list('id', flat=True))) == 2
+
+        response = self.client.get(reverse('backend_orders:category-list'), {'shop_id': shop.id})
+        assert [(item['name'], item['parent']) for item in response.json()] == [
+            ('Электроника', None), ('Смартфоны', Category.objects.get(name='Электроника').id),
+            ('Кабели', None)]
+        assert self.client.get(reverse('backend_orders:category-list'), {'shop_id': 'x'}).status_code == 400
+
+    def test_counts(self):
+        """
+        Проверяет, что счетчики меняются на разницу при импорте и переключении магазина.
+        """
+        assert self.counts() == {'Электроника': (3, 3), 'Смартфоны': (2, 2), 'Телевизоры': (1, 1)}
+        import_price(self.second.id, self.price('Евросеть', [(1, 224, 'Смартфон 1'), (2, 5, 'Телевизор 2')]))
+        assert self.counts() == {'Электроника': (4, 5), 'Смартфоны': (2, 3), 'Телевизоры': (2, 2)}
+        self.assert_counts_consistent()
+
+        import_price(self.first.id, self.price('Связной', [(1, 224, 'Смартфон 1'), (3, 5, 'Телевизор 1')]))
+        assert self.counts() == {'Электроника': (4, 4), 'Смартфоны': (2, 2), 'Телевизоры': (2, 2)}
+        self.assert_counts_consistent()
+
+        self.client.force_authenticate(self.second)
+        for state in ('off', 'off'):
+            self.client.post(reverse('backend_orders:partner-state'), {'state': state})
+            assert self.counts() == {'Электроника': (4, 2), 'Смартфоны': (2, 1), 'Телевизоры': (2, 1)}
+        self.assert_counts_consistent()
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'on'})
+        assert self.counts()['Электроника'] == (4, 4)
+
+    def test_tree_and_subtree_filter(self):
+        """
+        Проверяет дерево категорий и фильтр товаров по категории вместе с вложенными.
+        """
+        tree = self.client.get(reverse('backend_orders:category-list')).json()
+        assert [(node['name'], node['product_count'], node['offer_count']) for node in tree] == [
+            ('Электроника', 3, 3)]
+        assert [(node['name'], node['children']) for node in tree[0]['children']] == [
+            ('Смартфоны', []), ('Телевизоры', [])]
+
+        root = Category.objects.get(name='Электроника')
+        url = reverse('backend_orders:products-list')
+        for category_id, count in ((root.id, 3), (Category.objects.get(name='Телевизоры').id, 1), (0, 0)):
+            response = self.client.get(url, {'category_id': category_id})
+            assert len(load_json(b''.join(response.streaming_content))) == count
+            response = self.client.get(reverse('backend_orders:async-products'), {'category_id': category_id})
+            assert len(response.json()) == count
+
+
+class ProductOffersTests(APITestCase):
+    """
+    Класс для тестирования сводки предложений продукта и сравнения цен между магазинами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.first = User.objects.create(email='shop@example.com', username='shop', type='shop', is_active=True)
+        self.second = User.objects.create(email='other@example.com', username='other', type='shop', is_active=True)
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        self.first_price = self.price('Связной', [(1, 'Смартфон 1', 65000, 5), (2, 'Смартфон 2', 30000, 0)])
+        self.second_price = self.price('Евросеть', [(1, 'Смартфон 1', 60000, 2), (3, 'Смартфон 3', 10000, 1)])
+        import_price(self.first.id, self.first_price)
+        import_price(self.second.id, self.second_price)
+        self.client.force_authenticate(self.buyer)
+
+    def price(self, shop, goods):
+        return {
+            'shop': shop,
+            'categories': [{'id': 224, 'name': 'Смартфоны'}],
+            'goods': [{'id': external_id, 'category': 224, 'model': 'xr', 'name': name, 'price': price,
+                       'price_rrc': 70000, 'quantity': quantity, 'parameters': {'Цвет': 'красный'}}
+                      for external_id, name, price, quantity in goods],
+        }
+
+    def summary(self, name):
+        offers = ProductOffers.objects.get(product__name=name)
+        return offers.best_offer_id, offers.min_price, offers.shop_count, offers.quantity
+
+    def offer(self, user, name):
+        return ProductInfo.objects.get(shop__user=user, product__name=name).id
+
+    def test_import_updates_summary(self):
+        """
+        Проверяет, что сводка пересчитывается при импорте только для продуктов с изменениями.
+        """
+        assert self.summary('Смартфон 1') == (self.offer(self.second, 'Смартфон 1'), 60000, 2, 7)
+        assert self.summary('Смартфон 2') == (None, None, 0, 0)
+
+        self.second_price['goods'][0]['price'] = 70000
+        import_price(self.second.id, self.second_price)
+        assert self.summary('Смартфон 1') == (self.offer(self.first, 'Смартфон 1'), 65000, 2, 7)
+
+        updated = ProductOffers.objects.get(product__name='Смартфон 3').updated_at
+        del self.second_price['goods'][0]
+        import_price(self.second.id, self.second_price)
+        assert self.summary('Смартфон 1') == (self.offer(self.first, 'Смартфон 1'), 65000, 1, 5)
+        assert ProductOffers.objects.get(product__name='Смартфон 3').updated_at == updated
+
+    def test_stock_and_shop_state(self):
+        """
+        Проверяет пересчет сводки при списании остатков и отключении магазина.
+        """
+        contact = Contact.objects.create(user=self.buyer, city='Самара', street='Ленина', phone='+79990000000')
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        OrderItem.objects.create(order=basket, product_info_id=self.offer(self.second, 'Смартфон 1'), quantity=2)
+        with mock.patch('backend_orders.views.send_email'):
+            self.client.post(reverse('backend_orders:order'), {'id': str(basket.id), 'contact': str(contact.id)})
+        assert self.summary('Смартфон 1') == (self.offer(self.first, 'Смартфон 1'), 65000, 1, 5)
+
+        self.client.force_authenticate(self.first)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'off'})
+        assert self.summary('Смартфон 1') == (None, None, 0, 0)
+        self.client.post(reverse('backend_orders:partner-state'), {'state': 'on'})
+        assert self.summary('Смартфон 1') == (self.offer(self.first, 'Смартфон 1'), 65000, 1, 5)
+
+    def test_offers(self):
+        """
+        Проверяет сравнение цен на продукт без агрегирующих запросов.
+        """
+        url = reverse('backend_orders:products-offers', args=(self.offer(self.first, 'Смартфон 1'),))
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url).json()
+        assert not any('GROUP BY' in query['sql'] or 'MIN(' in query['sql'] for query in queries.captured_queries)
+        assert data['product'] == {'name': 'Смартфон 1', 'category': 'Смартфоны'}
+        assert (data['best_offer'], data['min_price'], data['shop_count'], data['quantity']) == \
+            (self.offer(self.second, 'Смартфон 1'), 60000, 2, 7)
+        assert [(offer['shop_name'], offer['price']) for offer in data['offers']] == [('Евросеть', 60000),
+                                                                                     ('Связной', 65000)]
+
+        url = reverse('backend_orders:products-offers', args=(self.offer(self.first, 'Смартфон 2'),))
+        assert self.client.get(url).json()['offers'] == []
+        assert self.client.get(reverse('backend_orders:products-offers', args=(0,))).status_code == 404
+
+    def test_catalog_sort(self):
+        """
+        Проверяет сортировки каталога во всех форматах.
+        """
+        url = reverse('backend_orders:products-list')
+
+        def names(sort, **params):
+            response = self.client.get(url, {'sort': sort, **params})
+            return [item['product']['name'] for item in load_json(b''.join(response.streaming_content))]
+
+        assert names('price') == ['Смартфон 3', 'Смартфон 2', 'Смартфон 1', 'Смартфон 1']
+        assert names('-price') == ['Смартфон 1', 'Смартфон 1', 'Смартфон 2', 'Смартфон 3']
+        assert names('min_price') == ['Смартфон 3', 'Смартфон 1', 'Смартфон 1', 'Смартфон 2']
+        assert names('shops') == ['Смартфон 1', 'Смартфон 1', 'Смартфон 3', 'Смартфон 2']
+        assert self.client.get(url, {'sort': 'name'}).status_code == 400
+
+        columns = self.client.get(url, {'sort': '-price', 'format': 'columnar'}).json()
+        assert columns['columns']['price'] == [65000, 60000, 30000, 10000]
+        assert columns['parameters']['offsets'] == [0, 1, 2, 3, 4]
+
+        ordering = CATALOG_ORDERINGS['min_price']
+        assert list(projections.iter_products(ProductInfo.objects.all(), chunk_size=1, ordering=ordering)) == \
+            projections.load_products(ProductInfo.objects.all(), ordering)
+
+        response = self.client.get(reverse('backend_orders:async-products'), {'sort': 'shops'})
+        assert [item['product']['name'] for item in response.json()][:2] == ['Смартфон 1', 'Смартфон 1']
+
+
+@override_settings(ORDER_EVENTS_POLL_INTERVAL=0.01, SSE_HEARTBEAT_INTERVAL=0.05)
+class OrderEventTests(CatalogFixtureMixin, TestCase):
+    """
+    Класс для тестирования событий смены статусов заказов: long-poll и SSE.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.buyer)
+        self.url = reverse('backend_orders:async-order-events')
+        self.basket = Order.objects.get(user=self.buyer, state='basket')
+        self.contact = Contact.objects.get(user=self.buyer)
+
+    def checkout(self):
+        self.client.force_login(self.buyer)
+        with mock.patch('backend_orders.views.send_email'):
+            response = self.client.post(reverse('backend_orders:order'),
+                                        {'id': str(self.basket.id), 'contact': str(self.contact.id)})
+        assert response.json() == {'Status': True}
+        self.client.logout()
+
+    def poll(self, token, **params):
+        response = self.client.get(self.url, params, HTTP_AUTHORIZATION=f'Token {token.key}')
+        assert response.status_code == 200
+        return response.json()
+
+    def test_long_poll(self):
+        """
+        Проверяет, что покупатель и поставщик получают событие оформления заказа, а без событий запрос ждет timeout.
+        """
+        partner_token = Token.objects.create(user=self.partner)
+        cursor = self.poll(self.token)['cursor']
+        partner_cursor = self.poll(partner_token)['cursor']
+        self.checkout()
+
+        data = self.poll(self.token, since=cursor, timeout=0)
+        assert [(event['order'], event['state']) for event in data['events']] == [(self.basket.id, 'new')]
+        assert data['cursor'] == data['events'][0]['seq']
+        assert self.poll(partner_token, since=partner_cursor, timeout=0)['events'][0]['order'] == self.basket.id
+
+        with mock.patch('backend_orders.events.asyncio.sleep', wraps=asyncio.sleep) as sleep:
+            assert self.poll(self.token, since=data['cursor'], timeout=1) == {'cursor': data['cursor'], 'events': []}
+        assert sleep.called
+
+        assert self.client.get(self.url).status_code == 403
+        response = self.client.get(self.url, {'since': 'x'}, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        assert response.status_code == 400
+
+    def test_admin_state_change(self):
+        """
+        Проверяет, что массовая смена статуса в админке записывает события.
+        """
+        order = Order.objects.get(user=self.buyer, state='new', contact__isnull=False)
+        admin_user = User.objects.create_superuser(email='admin@example.com', password='pass3450', is_active=True)
+        self.client.force_login(admin_user)
+        with mock.patch('backend_orders.admin.send_bulk_email.delay'):
+            self.client.post(reverse('admin:backend_orders_order_changelist'),
+                             {'action': 'make_confirmed', '_selected_action': [order.id]})
+
+        other_partner = User.objects.get(username='other')
+        assert sorted(OrderEvent.objects.filter(order=order).values_list('user_id', 'state')) == sorted(
+            (user.id, 'confirmed') for user in (self.buyer, self.partner, other_partner))
+
+    def test_sse(self):
+        """
+        Проверяет поток Server-Sent Events: пинг, событие с id для Last-Event-ID и отказ без токена.
+        """
+        async def stream(headers, events=1):
+            scope = {'type': 'http', 'path': SSE_PATH, 'query_string': b'', 'headers': headers}
+            communicator = ApplicationCommunicator(sse_router(None), scope)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(timeout=5)
+            bodies = []
+            if start['status'] == 200:
+                for _ in range(events):
+                    bodies.append((await communicator.receive_output(timeout=5))['body'])
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(timeout=5)
+            return start['status'], bodies
+
+        headers = [(b'authorization', f'Token {self.token.key}'.encode())]
+        assert async_to_sync(stream)([])[0] == 403
+
+        status, bodies = async_to_sync(stream)(headers)
+        assert status == 200
+        assert bodies == [b': ping\n\n']
+
+        self.checkout()
+        event = OrderEvent.objects.get(user=self.buyer)
+        status, bodies = async_to_sync(stream)(headers + [(b'last-event-id', str(event.seq - 1).encode())])
+        assert bodies[0].startswith(f'id: {event.seq}\nevent: order\ndata: '.encode())
+        assert load_json(bodies[0].split(b'data: ')[1]) == {'seq': event.seq, 'order': self.basket.id, 'state': 'new'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик локального HTTP-сервера, который записывает полученные вебхуки.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(WEBHOOK_RETRY_DELAY=60)
+class WebhookTests(CatalogFixtureMixin, APITestCase):
+    """
+    Класс для тестирования вебхуков поставщиков на локальном HTTP-сервере.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.received = []
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.orders = list(Order.objects.filter(user=self.buyer, contact__isnull=False).order_by('id'))
+
+    def create_webhook(self, user, path='/hook'):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse('backend_orders:partner-webhooks'),
+                                    {'url': f'http://127.0.0.1:{self.server.server_port}{path}'})
+        self.client.force_authenticate(None)
+        return Webhook.objects.get(id=response.json()['Webhook'])
+
+    def test_api(self):
+        """
+        Проверяет добавление, просмотр и удаление вебхуков и доступ только для магазинов.
+        """
+        url = reverse('backend_orders:partner-webhooks')
+        self.client.force_authenticate(self.buyer)
+        assert self.client.get(url).status_code == 403
+
+        self.client.force_authenticate(self.partner)
+        response = self.client.post(url, {'url': 'http://example.com/hook'})
+        assert len(response.json()['Secret']) == 64
+        assert self.client.post(url, {'url': 'not a url'}).json()['Status'] is False
+        assert [item['url'] for item in self.client.get(url).json()] == ['http://example.com/hook']
+
+        response = self.client.delete(url, {'items': str(response.json()['Webhook'])})
+        assert response.json()['Удалено объектов'] == 1
+
+    def test_batched_parallel_delivery(self):
+        """
+        Проверяет, что события уходят на каждый адрес одной подписанной пачкой и параллельно на разные адреса.
+        """
+        webhook = self.create_webhook(self.partner, '/first')
+        other = self.create_webhook(User.objects.get(username='other'), '/second')
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('backend_orders.events.dispatch_webhooks.delay') as delay:
+            with transaction.atomic():
+                record_order_events([order.id for order in self.orders], 'confirmed')
+        delay.assert_called_once()
+
+        result = dispatch()
+
+        assert result['delivered'] == 2 and result['events'] == 4
+        received = {path: (headers, body) for path, headers, body in self.server.received}
+        headers, body = received['/first']
+        assert headers['X-Webhook-Signature'] == sign(webhook.secret, body)
+        assert [(event['order'], event['state']) for event in load_json(body)['events']] == [
+            (order.id, 'confirmed') for order in self.orders]
+        webhook.refresh_from_db()
+        assert webhook.last_seq == OrderEvent.objects.filter(user=self.partner).last().seq
+        assert webhook.last_status == 200 and webhook.last_latency_ms is not None
+        assert '/second' in received and other.secret != webhook.secret
+
+        assert dispatch()['delivered'] == 0
+        assert len(self.server.received) == 2
+
+    def test_retry_with_backoff(self):
+        """
+        Проверяет, что ошибка откладывает повтор с растущей паузой, а успешная попытка сбрасывает счетчик.
+        """
+        webhook = self.create_webhook(self.partner)
+        record_order_events([self.orders[0].id], 'sent')
+        self.server.status = 500
+
+        result = dispatch()
+        webhook.refresh_from_db()
+        assert result['failed'] == 1 and result['retry_at'] == webhook.next_attempt_at
+        assert webhook.failures == 1 and webhook.last_seq == 0 and webhook.last_status == 500
+        assert 55 <= (webhook.next_attempt_at - timezone.now()).total_seconds() <= 60
+        assert dispatch()['failed'] == 0
+
+        Webhook.objects.filter(id=webhook.id).update(next_attempt_at=timezone.now())
+        dispatch()
+        webhook.refresh_from_db()
+        assert webhook.failures == 2
+        assert 115 <= (webhook.next_attempt_at - timezone.now()).total_seconds() <= 120
+
+        self.server.status = 204
+        Webhook.objects.filter(id=webhook.id).update(next_attempt_at=timezone.now())
+        assert dispatch()['delivered'] == 1
+        webhook.refresh_from_db()
+        assert webhook.failures == 0 and webhook.next_attempt_at is None and webhook.last_seq > 0
+        assert len(self.server.received) == 3
+
+    @override_settings(WEBHOOK_MAX_FAILURES=1)
+    def test_disabled_after_failures(self):
+        """
+        Проверяет отключение вебхука после серии неудач и отказ на занятом адресе.
+        """
+        webhook = self.create_webhook(self.partner)
+        record_order_events([self.orders[0].id], 'sent')
+        Webhook.objects.filter(id=webhook.id).update(locked_until=timezone.now() + timedelta(seconds=10))
+        assert dispatch()['busy'] == 1
+
+        Webhook.objects.filter(id=webhook.id).update(locked_until=None, url='http://127.0.0.1:1/closed')
+        assert dispatch()['failed'] == 1
+        webhook.refresh_from_db()
+        assert webhook.is_active is False
+        assert webhook.last_status is None and webhook.last_error
+
+
+class ExportJobTests(APITestCase):
+    """
+    Класс для тестирования фоновых выгрузок и докачки файлов.
+    Представления ExportJobView и ExportJobDownload.
+    """
+
+    url_export = reverse('backend_orders:export')
+
+    def setUp(self):
+        self.export_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(EXPORT_ROOT=self.export_root.name)
+        self.settings_override.enable()
+
+        self.buyer = User.objects.create(email='buyer@example.com', username='buyer', is_active=True)
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        order = Order.objects.create(user=self.buyer, state='new')
+        for i in range(50):
+            product = Product.objects.create(name=f'Смартфон {i}', category=category)
+            product_info = ProductInfo.objects.create(product=product, shop=shop, external_id=i, quantity=5,
+                                                      price=1000 + i, price_rrc=1200)
+            OrderItem.objects.create(order=order, product_info=product_info, quantity=1)
+        Order.objects.create(user=self.buyer, state='basket')
+        self.client.force_authenticate(self.buyer)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.export_root.cleanup()
+
+    def create_job(self, **data):
+        with mock.patch('backend_orders.views.run_export_job.delay') as delay:
+            response = self.client.post(self.url_export, data)
+        assert response.status_code == 200
+        delay.assert_called_once()
+        job_id = load_json(response.content)['Job']
+        run_export_job(job_id)
+        return ExportJob.objects.get(id=job_id)
+
+    def test_orders_export(self):
+        """
+        Проверяет, что выгрузка истории заказов пишет сжатый JSON Lines и сохраняет прогресс.
+        """
+        job = self.create_job(kind='orders')
+
+        assert job.status == 'done'
+        assert job.rows == job.total_rows == 50
+        url = reverse('backend_orders:export-download', args=(job.id,))
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response['Accept-Ranges'] == 'bytes'
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        assert len(lines) == 50
+        assert load_json(lines[0])['state'] == 'new'
+
+    def test_download_range(self):
+        """
+        Проверяет докачку файла по заголовку Range, ответ 416 на невыполнимый диапазон и пропуск неверного.
+        """
+        job = self.create_job(kind='orders', file_format='csv')
+        url = reverse('backend_orders:export-download', args=(job.id,))
+        content = b''.join(self.client.get(url).streaming_content)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-')
+        assert response.status_code == 206
+        assert response['Content-Range'] == f'bytes 10-{len(content) - 1}/{len(content)}'
+        assert b''.join(response.streaming_content) == content[10:]
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        assert b''.join(response.streaming_content) == content[-5:]
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        assert response.status_code == 416
+
+        # диапазон с концом меньше начала и неверный синтаксис игнорируются: отдается весь файл
+        for header in ('bytes=500-100', 'bytes=5-4', 'items=0-10', 'bytes=-'):
+            response = self.client.get(url, HTTP_RANGE=header)
+            assert response.status_code == 200, header
+            assert b''.join(response.streaming_content) == content
+
+    def test_download_missing_file(self):
+        """
+        Проверяет ответ 410 на выгрузку, файл которой удален или не был записан.
+        """
+        job = self.create_job(kind='orders')
+        url = reverse('backend_orders:export-download', args=(job.id,))
+        export_file_path(job).unlink()
+
+        for headers in ({}, {'HTTP_RANGE': 'bytes=10-'}):
+            response = self.client.get(url, **headers)
+            assert response.status_code == 410
+            assert load_json(response.content)['Status'] is False
+
+        ExportJob.objects.filter(id=job.id).update(file='')
+        assert self.client.get(url).status_code == 410
+
+    def test_catalog_export_for_buyer_forbidden(self):
+        """
+        Проверяет, что выгрузку прайса может запустить только магазин.
+        """
+        response = self.client.post(self.url_export, {'kind': 'catalog'})
+
+        assert response.status_code == 403
+
+
+class QueryPlanTests(TestCase):
+    """
+    Класс для проверки планов запросов основных представлений: ни один выполненный ими запрос не должен
+    читать большие таблицы полным проходом (Seq Scan или Index Scan без Index Cond в PostgreSQL, SCAN в SQLite).
+    """
+
+    fixture_size = 2000
+    large_tables = ('backend_orders_order', 'backend_orders_orderitem', 'backend_orders_productinfo',
+                    'backend_orders_product', 'backend_orders_confirmemailtoken', 'backend_orders_productparameter',
+                    'backend_orders_category_shops')
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f'user{i}@example.com', username=f'user{i}', type='shop' if i % 10 == 0 else 'buyer',
+                 is_active=True)
+            for i in range(cls.fixture_size // 10))
+        shops = Shop.objects.bulk_create(Shop(name=f'Магазин {i}', user=user, state=i % 3 != 0)
+                                         for i, user in enumerate(users[::10]))
+        categories = [Category.objects.create(name=f'Категория {i}') for i in range(20)]
+        CategoryShop.objects.bulk_create(CategoryShop(category=category, shop=shop)
+                                         for shop in shops for category in categories)
+        products = Product.objects.bulk_create(Product(name=f'Товар {i}', category=categories[i % 20])
+                                               for i in range(cls.fixture_size))
+        product_infos = ProductInfo.objects.bulk_create(
+            ProductInfo(product=product, shop=shops[i % len(shops)], external_id=i, quantity=10, price=100 + i,
+                        price_rrc=150 + i, is_visible=shops[i % len(shops)].state)
+            for i, product in enumerate(products))
+        orders = Order.objects.bulk_create(Order(user=users[i % len(users)], state='basket' if i % 5 == 0 else 'new')
+                                           for i in range(cls.fixture_size))
+        OrderItem.objects.bulk_create(OrderItem(order=order, product_info=product_infos[i], quantity=1)
+                                      for i, order in enumerate(orders))
+        ConfirmEmailToken.objects.bulk_create(ConfirmEmailToken(user=user, key=f'key{i}')
+                                              for i, user in enumerate(users))
+        parameters = Parameter.objects.bulk_create(
+            Parameter(name=f'Характеристика {i}', key=f'характеристика {i}', value_type=NUMBER) for i in range(5))
+        ProductParameter.objects.bulk_create(
+            ProductParameter(product_info=product_info, parameter=parameter, value=str(i), value_number=i)
+            for i, product_info in enumerate(product_infos) for parameter in parameters)
+
+        cls.buyer = users[1]
+        cls.partner = users[0]
+        cls.shop = shops[1]
+        cls.category = categories[1]
+        cls.parameter = parameters[1]
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assert_no_full_scans(self, method, path, data=None, user=None):
+        """
+        Выполняет запрос к представлению и проверяет планы всех его SQL-запросов: ни один не должен
+        читать большие таблицы полным проходом - ни по самой таблице, ни по индексу без условия поиска.
+        Проход по частичному индексу допустим: его условие и есть условие поиска.
+        """
+        if user is not None:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data)
+            b''.join(response) if response.streaming else response.content
+        assert response.status_code == 200, response.content
+
+        partial_indexes = {index.name for model in apps.get_app_config('backend_orders').get_models()
+                           for index in model._meta.indexes if index.condition is not None}
+        statements = [query['sql'] for query in context.captured_queries
+                      if query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE'))]
+        assert statements
+        for sql in statements:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # при отключенном seq scan он остается в плане, только если ни один индекс не подходит
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute(f'EXPLAIN {sql}')
+                    full_scans = self.postgresql_full_scans([row[0] for row in cursor.fetchall()], partial_indexes)
+                else:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    full_scans = self.sqlite_full_scans(sql, [row[-1] for row in cursor.fetchall()],
+                                                        partial_indexes)
+            assert not full_scans, (sql, full_scans)
+
+    def sqlite_full_scans(self, sql, plan, partial_indexes):
+        """
+        Возвращает строки плана SQLite с проходом SCAN по большой таблице, кроме прохода по частичному индексу.
+        В SEARCH всегда есть условие поиска по индексу, а SCAN ... USING INDEX читает индекс целиком.
+        """
+        aliases = dict((alias, table) for table, alias in re.findall(r'"(\w+)" (\w+)', sql))
+        full_scans = []
+        for line in plan:
+            match = re.match(r'SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?', line)
+            if match and aliases.get(match[1], match[1]) in self.large_tables and match[2] not in partial_indexes:
+                full_scans.append(line)
+        return full_scans
+
+    def postgresql_full_scans(self, plan, partial_indexes):
+        """
+        Возвращает узлы плана PostgreSQL с проходом по большой таблице: Seq Scan или Index Scan
+        без Index Cond, кроме прохода по частичному индексу.
+        """
+        full_scans = []
+        for number, line in enumerate(plan):
+            match = re.search(r'(Seq Scan|Index Scan|Index Only Scan)(?: Backward)? (?:using (\w+) )?on (\w+)', line)
+            if not match or match[3] not in self.large_tables or match[2] in partial_indexes:
+                continue
+            details = itertools.takewhile(lambda detail: '->' not in detail, plan[number + 1:])
+            if match[1] == 'Seq Scan' or not any('Index Cond' in detail for detail in details):
+                full_scans.append(line)
+        return full_scans
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_basket(self):
+        """
+        Запросы представления BasketView.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:basket'), user=self.buyer)
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_orders(self):
+        """
+        Запросы представления OrderView.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:order'), user=self.buyer)
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_partner_orders(self):
+        """
+        Запросы представления PartnerOrders.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:partner-orders'), user=self.partner)
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_catalog(self):
+        """
+        Запросы каталога без фильтров: только предложения магазинов, принимающих заказы.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:products-list'))
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_catalog_by_shop(self):
+        """
+        Запросы каталога с фильтром по магазину.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:products-list'), {'shop_id': self.shop.id})
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_catalog_by_category(self):
+        """
+        Запросы каталога с фильтром по категории вместе с вложенными категориями.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:products-list'), {'category_id': self.category.id})
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_shop_categories(self):
+        """
+        Запросы категорий из прайса магазина.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:category-list'), {'shop_id': self.shop.id})
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_catalog_by_parameter(self):
+        """
+        Запросы каталога с фильтром по диапазону значений характеристики.
+        """
+        self.assert_no_full_scans('get', reverse('backend_orders:products-list'),
+                                  {f'parameter_{self.parameter.id}': '100..120'})
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_confirm_token(self):
+        """
+        Запросы представления ConfirmAccount.
+        """
+        self.assert_no_full_scans('post', reverse('backend_orders:user-register-confirm'),
+                                  {'email': self.buyer.email, 'token': 'key1'})
+
+
+class BenchmarkTests(TestCase):
+    """
+    Класс для проверки того, что количество SQL-запросов на каждом URL не превышает эталон bench_baseline.json
+    для текущей базы данных. Задержка и память сравниваются командой manage.py benchmark с локальным эталоном.
+    """
+
+    def setUp(self):
+        self.export_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(EXPORT_ROOT=self.export_root.name)
+        self.settings_override.enable()
+        self.baseline = load_baseline()
+        self.context = seed_dataset(**self.baseline['scale'])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.export_root.cleanup()
+
+    def test_all_urls_covered(self):
+        """
+        Проверяет, что у каждого URL приложения есть сценарий замера.
+        """
+        covered = {case['url_name'] for case in benchmark_cases(self.context)}
+
+        assert app_url_names() - covered == set()
+
+    def test_query_counts_within_baseline(self):
+        """
+        Проверяет, что ни один URL не делает больше SQL-запросов, чем в эталоне.
+        """
+        if baseline_endpoints(self.baseline) is None:
+            self.skipTest(f'Нет эталона для базы {connection.vendor}: manage.py benchmark --update-baseline')
+        results = run_benchmarks(self.context, repeat=0, measure_memory=False)
+
+        assert set(results) == {case_key(case) for case in benchmark_cases(self.context)}
+        regressions = compare_with_baseline(results, self.baseline, check_timing=False)
+        assert not regressions, regressions
+
+    def test_baseline_per_vendor(self):
+        """
+        Проверяет, что эталон хранится отдельно для каждой базы данных и без задержки и памяти.
+        """
+        result = {'GET basket': {'status': 200, 'queries': 3, 'p50_ms': 1.0, 'p95_ms': 2.0, 'peak_kb': 10.0}}
+        scale = self.baseline['scale']
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'baseline.json'
+            save_baseline(result, scale, path, vendor='postgresql')
+            save_baseline({'GET basket': dict(result['GET basket'], queries=2)}, scale, path, vendor='sqlite')
+            baseline = load_baseline(path)
+
+        assert baseline['endpoints'] == {'postgresql': {'GET basket': {'status': 200, 'queries': 3}},
+                                         'sqlite': {'GET basket': {'status': 200, 'queries': 2}}}
+        assert compare_with_baseline(result, baseline, vendor='postgresql') == []
+        assert compare_with_baseline(result, baseline, vendor='sqlite') == ['GET basket: 3 SQL-запросов, в эталоне 2']
+        assert compare_with_baseline(result, baseline, vendor='mysql')[0].startswith('нет эталона для базы mysql')
+
+
+class GeneratorTests(TestCase):
+    """
+    Класс для тестирования генератора синтетических данных.
+    """
+
+    def test_price_list_is_deterministic(self):
+        """
+        Проверяет, что при одном seed прайсы совпадают, а структура повторяет data/shop1.yaml.
+        """
+        first = ''.join(CatalogGenerator(seed=1, shops=2, skus=10).iter_price_list_yaml(0))
+        second = ''.join(CatalogGenerator(seed=1, shops=2, skus=10).iter_price_list_yaml(0))
+        other = ''.join(CatalogGenerator(seed=2, shops=2, skus=10).iter_price_list_yaml(0))
+
+        assert first == second
+        assert first != other
+        data = load_yaml(first, Loader=Loader)
+        assert set(data) == {'shop', 'categories', 'goods'}
+        assert len(data['goods']) == 10
+        assert set(data['goods'][0]) == {'id', 'category', 'model', 'name', 'price', 'price_rrc', 'quantity',
+                                         'parameters'}
+
+    def test_load_dataset(self):
+        """
+        Проверяет загрузку магазинов, предложений, характеристик, корзин и заказов в базу.
+        """
+        generator = CatalogGenerator(seed=1, shops=3, skus=10, parameters=5)
+
+        offer_ids = load_catalog(generator, batch_size=7)
+        orders = load_orders(generator, offer_ids, buyers=4, orders=2, batch_size=3)
+
+        assert len(offer_ids) == ProductInfo.objects.count() == 30
+        assert ProductParameter.objects.count() == 30 * 5
+        assert Shop.objects.count() == 3
+        assert orders == Order.objects.count() == 4 * 3
+        assert Order.objects.filter(state='basket').count() == 4
+        assert OrderItem.objects.exists()
@@ -1,24 +1,33 @@
-from django.urls import path
+from django.urls import path, include
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
 from rest_framework.routers import DefaultRouter
 
+from .async_views import AsyncProductList, AsyncProductDetail, AsyncBasketView, AsyncOrderView, AsyncPartnerOrders, \
+    AsyncOrderEvents
+
 from .views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryViewSet, ShopViewSet, ProductInfoViewSet, \
-    BasketView, AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount
+    BasketView, AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, \
+    PartnerExport, ExportJobView, ExportJobDownload, ProfilingStats, PartnerWebhooks, ParameterViewSet
 
 router = DefaultRouter()
 router.register(r'category', CategoryViewSet)
 router.register(r'product', ProductInfoViewSet, basename='products')
 router.register(r'shops', ShopViewSet)
+router.register(r'parameter', ParameterViewSet)
 
 app_name = 'backend_my_diplom'
 urlpatterns = [
     # Путь для обновления данных партнера.
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    # Путь для выгрузки прайса партнера.
+    path('partner/export', PartnerExport.as_view(), name='partner-export'),
     # Путь для получения статуса партнера.
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     # Путь для получения заказов партнера.
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
+    # Путь для управления вебхуками партнера.
+    path('partner/webhooks', PartnerWebhooks.as_view(), name='partner-webhooks'),
     # Путь для регистрации нового пользователя.
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     # Путь для подтверждения аккаунта пользователя.
@@ -39,8 +48,23 @@ urlpatterns = [
     # path('shops', ShopView.as_view(), name='shops'),
     # Путь для получения списка товаров.
     # path('products', ProductInfoView.as_view(), name='shops'),
+    # Путь для запуска фоновых выгрузок и просмотра их прогресса.
+    path('export', ExportJobView.as_view(), name='export'),
+    # Путь для скачивания готовой выгрузки с поддержкой докачки.
+    path('export/<int:job_id>/download', ExportJobDownload.as_view(), name='export-download'),
+    # Путь для просмотра статистики профилирования запросов.
+    path('profiling/stats', ProfilingStats.as_view(), name='profiling-stats'),
     # Путь для работы с корзиной покупателя.
     path('basket', BasketView.as_view(), name='basket'),
     # Путь для создания нового заказа.
     path('order', OrderView.as_view(), name='order'),
+    # Асинхронные варианты чтения каталога, корзины и заказов для развертывания через ASGI.
+    path('async/product', AsyncProductList.as_view(), name='async-products'),
+    path('async/product/<int:pk>', AsyncProductDetail.as_view(), name='async-product-detail'),
+    path('async/basket', AsyncBasketView.as_view(), name='async-basket'),
+    path('async/order', AsyncOrderView.as_view(), name='async-order'),
+    path('async/order/events', AsyncOrderEvents.as_view(), name='async-order-events'),
+    path('async/partner/orders', AsyncPartnerOrders.as_view(), name='async-partner-orders'),
+    # Пути для просмотра категорий, магазинов и товаров.
+    path('', include(router.urls)),
 ]
@@ -1,30 +1,49 @@
+import os
+import secrets
+import time
 from distutils.util import strtobool
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse, FileResponse, HttpResponse, Http404
 
 #from drf_spectacular.utils import extend_schema
 
 from requests import get
 
 from rest_framework.authtoken.models import Token
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from ujson import loads as load_json
 from yaml import load as load_yaml, Loader
 
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+from .caching import bump_catalog_version
+from .categories import load_category_tree, load_shop_categories
+from .changes import CHANGES_PAGE_SIZE, latest_cursor, load_changes, set_shop_state
+from .events import change_order_state
+from .exports import EXPORT_FORMATS, EXPORT_CONTENT_TYPES, EXPORT_ASGI_LIMIT, COMPRESSION_CONTENT_TYPES, \
+    available_compressions, export_file_path, parse_range, iter_file_range, write_catalog
+from .filters import CatalogQuery
+from .importer import import_price
+from .models import Shop, Category, Parameter, ProductInfo, Order, OrderItem, Contact, ConfirmEmailToken, ExportJob, \
+    OrderEvent, Webhook
+from .metrics import record_import
+from .offers import load_offers
+from .profiling import store as profile_store
+from .projections import load_products, load_orders, iter_products, load_product_columns
+from .renderers import JsonResponse, JsonArrayResponse, parse_items, parse_ids, COLUMNAR_FORMATS, \
+    columnar_renderer_classes
 from .serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer
+    OrderItemSerializer, ContactSerializer, ExportJobSerializer, WebhookSerializer, ParameterSerializer
 # from signals import new_user_registered, new_order
-from .tasks import send_email
+from .tasks import send_email, run_export_job
 
 
 class RegisterAccount(APIView):
@@ -230,6 +249,29 @@ class CategoryViewSet(ModelViewSet):
     ordering = ('name',)
     throttle_scope = 'user'
 
+    def list(self, request, *args, **kwargs):
+        """
+        Получает дерево категорий: у каждой категории вложенные категории (children), количество
+        продуктов и предложений в ней и во всех вложенных. С параметром shop_id - плоский список
+        категорий из прайса магазина.
+        """
+        shop_id = request.query_params.get('shop_id')
+        if shop_id is not None:
+            if not shop_id.isdigit():
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+            return Response(load_shop_categories(int(shop_id)))
+        return Response(load_category_tree())
+
+
+class ParameterViewSet(ReadOnlyModelViewSet):
+    """
+    Класс для просмотра характеристик товаров: id и тип значений нужны для фильтров
+    и сортировки списка товаров (?parameter_<id>=, ?sort=parameter_<id>).
+    """
+    queryset = Parameter.objects.order_by('name')
+    serializer_class = ParameterSerializer
+    throttle_scope = 'user'
+
 
 class ShopViewSet(ModelViewSet):
     """
@@ -243,14 +285,41 @@ class ShopViewSet(ModelViewSet):
 
 class ProductInfoViewSet(ReadOnlyModelViewSet):
     """
-    Класс для поиска товаров
+    Класс для поиска товаров.
+    Кроме JSON список отдается в колоночном виде для машинных клиентов: ?format=columnar или msgpack.
+    Сортировка ?sort=: price, -price, min_price (сначала продукты с самым дешевым предложением
+    среди всех магазинов), shops (сначала продукты, которые есть в наличии у большего числа магазинов),
+    parameter_<id> и -parameter_<id> - по значению характеристики. Фильтры по характеристикам:
+    ?parameter_<id>=<значение> или диапазон <от>..<до> для чисел и размеров (filters.py).
     """
     queryset = ProductInfo.objects.all()
     serializer_class = ProductInfoSerializer
     http_method_names = ['get', ]
     throttle_scope = 'user'
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *columnar_renderer_classes())
 
-    def get(self, request, *args, **kwargs):
+    def get_queryset(self):
+        """
+        Возвращает товары магазинов, принимающих заказы, с фильтрами shop_id и category_id
+        (категория вместе со всеми вложенными).
+        """
+        query = Q(is_visible=True)
+        shop_id = self.request.query_params.get('shop_id')
+        category_id = self.request.query_params.get('category_id')
+
+        if shop_id:
+            query = query & Q(shop_id=shop_id)
+
+        if category_id:
+            # товары категории и всех вложенных в нее
+            path = Category.objects.filter(id=category_id).values_list('path', flat=True).first()
+            if not path:
+                return ProductInfo.objects.none()
+            query = query & Category.subtree_query(path, 'product__category__path')
+
+        return ProductInfo.objects.filter(query)
+
+    def list(self, request, *args, **kwargs):
         """
         Получает список товаров в соответствии с параметрами.
 
@@ -262,25 +331,77 @@ class ProductInfoViewSet(ReadOnlyModelViewSet):
         Returns:
             Response: Ответ в формате JSON со списком товаров или ошибкой.
         """
-        query = Q(shop__state=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
-
-        if shop_id:
-            query = query & Q(shop_id=shop_id)
+        for name in ('shop_id', 'category_id'):
+            if not request.query_params.get(name, '0').isdigit():
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+        try:
+            catalog = CatalogQuery(request.query_params)
+            catalog.load_types()
+            condition, ordering = catalog.condition(), catalog.ordering()
+        except ValueError:
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+        queryset = self.get_queryset().filter(condition)
+
+        if request.accepted_renderer.format in COLUMNAR_FORMATS:
+            return Response(load_product_columns(queryset, ordering))
+        if request.accepted_renderer.format == 'json':
+            # список товаров может быть очень большим, поэтому JSON собирается во временном файле, а не в памяти
+            return JsonArrayResponse(iter_products(queryset, ordering=ordering))
+        return Response(load_products(queryset, ordering))
+
+    @action(detail=False)
+    def changes(self, request, *args, **kwargs):
+        """
+        Получает изменения каталога после курсора since.
 
-        if category_id:
-            query = query & Q(product__category_id=category_id)
+        Клиент запоминает cursor из ответа и передает его в следующем запросе; пока has_more,
+        можно сразу запрашивать следующую страницу. Без since возвращается только текущий курсор:
+        его нужно получить до полной загрузки /product, чтобы не пропустить изменения.
 
-        # фильтруем и отбрасываем дуликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
+        Returns:
+            Response: cursor, has_more, upserted - текущее состояние добавленных и измененных
+            предложений, removed - id удаленных или скрытых предложений.
+        """
+        since = request.query_params.get('since')
+        limit = request.query_params.get('limit', str(CHANGES_PAGE_SIZE))
+        if since is not None and not since.isdigit() or not limit.isdigit() or not int(limit):
+            return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'}, status=400)
+        if since is None:
+            return Response({'cursor': latest_cursor(), 'has_more': False, 'upserted': [], 'removed': []})
+        return Response(load_changes(int(since), min(int(limit), CHANGES_PAGE_SIZE)))
+
+    @action(detail=True)
+    def offers(self, request, *args, **kwargs):
+        """
+        Сравнивает цены на тот же продукт в разных магазинах.
 
-        serializer = ProductInfoSerializer(queryset, many=True)
+        Returns:
+            Response: сводка (лучшее предложение, минимальная цена, количество магазинов, суммарный
+            остаток) и предложения в наличии от самого дешевого.
+        """
+        pk = kwargs[self.lookup_field]
+        offers = load_offers(pk) if pk.isdigit() else None
+        if offers is None:
+            raise Http404
+        return Response(offers)
 
-        return Response(serializer.data)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Получает карточку товара.
+        """
+        pk = kwargs[self.lookup_field]
+        if not pk.isdigit():
+            raise Http404
+        queryset = self.get_queryset().filter(id=pk)
+        if request.accepted_renderer.format in COLUMNAR_FORMATS:
+            columns = load_product_columns(queryset)
+            if not columns['count']:
+                raise Http404
+            return Response(columns)
+        products = load_products(queryset)
+        if not products:
+            raise Http404
+        return Response(products[0])
 
 
 class BasketView(APIView):
@@ -304,14 +425,9 @@ class BasketView(APIView):
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
 
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        return Response(load_orders(basket))
 
     # редактировать корзину
     def post(self, request, *args, **kwargs):
@@ -332,9 +448,9 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
+                items_dict = parse_items(items_sting)
             except ValueError:
-                JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
                 objects_created = 0
@@ -374,7 +490,7 @@ class BasketView(APIView):
 
         items_sting = request.data.get('items')
         if items_sting:
-            items_list = items_sting.split(',')
+            items_list = parse_ids(items_sting)
             basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
             query = Q()
             objects_deleted = False
@@ -407,9 +523,9 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             try:
-                items_dict = load_json(items_sting)
+                items_dict = parse_items(items_sting)
             except ValueError:
-                JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
                 basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
                 objects_updated = 0
@@ -455,35 +571,214 @@ class PartnerUpdate(APIView):
             else:
                 stream = get(url).content
 
+                started = time.perf_counter()
                 data = load_yaml(stream, Loader=Loader)
 
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
-
-                return JsonResponse({'Status': True})
+                report = import_price(request.user.id, data)
+                record_import('view', len(data['goods']), time.perf_counter() - started)
+                return JsonResponse({'Status': True, 'Report': report})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class PartnerExport(APIView):
+    """
+    Класс для выгрузки прайса поставщика
+    """
+    throttle_scope = 'user_partner'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Выгрузить товары магазина в формате файла импорта (type=yaml) или JSON Lines (type=jsonl)
+
+        Params:
+        request: HttpRequest
+            Объект HttpRequest
+
+        Под WSGI прайс отдается потоком прямо из курсоров базы, память не зависит от размера прайса.
+        Под ASGI Django 4.1 перебирает тело ответа в цикле событий, где запросы к базе запрещены, поэтому
+        прайс сначала записывается во временный файл (write_catalog), а магазины больше EXPORT_ASGI_LIMIT
+        товаров получают отказ с предложением фоновой выгрузки (POST export с kind=catalog).
+
+        Returns:
+        StreamingHttpResponse | FileResponse
+            Файл с прайсом магазина
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        export_format = request.query_params.get('type', 'yaml')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Errors': 'Неизвестный формат выгрузки'})
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if not shop:
+            return JsonResponse({'Status': False, 'Errors': 'Магазин не найден'})
+
+        file_name = f'shop_{shop.id}.{export_format}'
+        if not isinstance(request._request, ASGIRequest):
+            response = StreamingHttpResponse(EXPORT_FORMATS[export_format](shop),
+                                             content_type=EXPORT_CONTENT_TYPES[export_format])
+            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+            return response
+
+        if ProductInfo.objects.filter(shop_id=shop.id).count() > EXPORT_ASGI_LIMIT:
+            return JsonResponse({'Status': False, 'Errors': 'Прайс слишком большой для выгрузки запросом: '
+                                                            'запустите фоновую выгрузку (export, kind=catalog)'},
+                                status=409)
+
+        # прайс записывается во временный файл в потоке представления, а не генерируется при отдаче ответа
+        return FileResponse(write_catalog(shop, export_format), content_type=EXPORT_CONTENT_TYPES[export_format],
+                            as_attachment=True, filename=file_name)
+
+
+class ExportJobView(APIView):
+    """
+    Класс для запуска фоновых выгрузок прайса и истории заказов
+    """
+    throttle_scope = 'user'
+
+    # получить список выгрузок
+    def get(self, request, *args, **kwargs):
+        """
+        Получить список выгрузок пользователя с их прогрессом
+
+        Returns:
+            Response: Список выгрузок
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        jobs = ExportJob.objects.filter(user_id=request.user.id)
+        serializer = ExportJobSerializer(jobs, many=True)
+        return Response(serializer.data)
+
+    # запустить выгрузку
+    def post(self, request, *args, **kwargs):
+        """
+        Поставить выгрузку в очередь Celery
+
+        Args:
+            request: Запрос с параметрами kind, file_format и compression
+
+        Returns:
+            JsonResponse: Статус операции и идентификатор выгрузки
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if 'kind' not in request.data:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        serializer = ExportJobSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse({'Status': False, 'Errors': serializer.errors})
+
+        if serializer.validated_data.get('compression', 'gzip') not in available_compressions():
+            return JsonResponse({'Status': False, 'Errors': 'Сжатие недоступно на сервере'})
+
+        if serializer.validated_data['kind'] == 'catalog' and not Shop.objects.filter(
+                user_id=request.user.id).exists():
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        job = serializer.save(user=request.user)
+        run_export_job.delay(job.id)
+        return JsonResponse({'Status': True, 'Job': job.id})
+
+
+class ExportJobDownload(APIView):
+    """
+    Класс для скачивания готовых выгрузок с поддержкой докачки (заголовок Range)
+    """
+    throttle_scope = 'user'
+
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Скачать файл выгрузки целиком или диапазоном байт
+
+        Args:
+            request: Запрос, при докачке - с заголовком Range
+            job_id: Идентификатор выгрузки
+
+        Returns:
+            FileResponse | StreamingHttpResponse: Файл или его часть
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        job = ExportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if not job:
+            return JsonResponse({'Status': False, 'Errors': 'Выгрузка не найдена'}, status=404)
+        if job.status != 'done':
+            return JsonResponse({'Status': False, 'Errors': 'Выгрузка еще не готова'}, status=409)
+
+        # файл открывается сразу: удаленная или так и не записанная выгрузка - ответ 410, а не ошибка сервера
+        try:
+            if not job.file:
+                raise FileNotFoundError(job.id)
+            file = open(export_file_path(job), 'rb')
+        except FileNotFoundError:
+            return JsonResponse({'Status': False, 'Errors': 'Файл выгрузки удален, запустите выгрузку заново'},
+                                status=410)
+        size = os.fstat(file.fileno()).st_size
+        etag = f'"{job.id}-{size}-{int(job.finished_at.timestamp())}"'
+        content_type = COMPRESSION_CONTENT_TYPES[job.compression]
+
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        byte_range = None
+        if range_header and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                file.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        if byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file_range(file, start, end), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(file, content_type=content_type, as_attachment=True,
+                                    filename=job.file)
+
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+
+
+class ProfilingStats(APIView):
+    """
+    Класс для просмотра статистики профилирования запросов (только для персонала)
+    """
+    throttle_scope = 'user'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Получить накопленную статистику профилирования по представлениям
+
+        Args:
+            request: Запрос; параметр type=prometheus переключает ответ в текстовый формат Prometheus
+
+        Returns:
+            JsonResponse | HttpResponse: Статистика по представлениям и методам
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if not request.user.is_staff:
+            return JsonResponse({'Status': False, 'Error': 'Только для персонала'}, status=403)
+
+        if request.query_params.get('type') == 'prometheus':
+            return HttpResponse(profile_store.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        return JsonResponse({'Status': True, 'Views': profile_store.snapshot()})
+
+
 class PartnerState(APIView):
     """
     Класс для работы со статусом поставщика
@@ -526,7 +821,12 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                state = strtobool(state)
+                with transaction.atomic():
+                    # предложения магазина появляются в каталоге и ленте изменений или исчезают из них
+                    changed = set_shop_state(Shop.objects.filter(user_id=request.user.id).values('id'), state)
+                if changed:
+                    bump_catalog_version()
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -556,13 +856,85 @@ class PartnerOrders(APIView):
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
         order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').distinct()
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # в сумму заказа входят только товары этого поставщика
+        return Response(load_orders(order, Q(product_info__shop__user_id=request.user.id)))
+
+
+class PartnerWebhooks(APIView):
+    """
+    Класс для управления вебхуками поставщика: на них отправляются события заказов с его товарами
+    """
+    throttle_scope = 'user'
+
+    # получить вебхуки
+    def get(self, request, *args, **kwargs):
+        """
+        Получить вебхуки поставщика с результатом последней доставки
+
+        Returns:
+            Response: Список вебхуков
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        webhooks = Webhook.objects.filter(user_id=request.user.id)
+        return Response(WebhookSerializer(webhooks, many=True).data)
+
+    # добавить вебхук
+    def post(self, request, *args, **kwargs):
+        """
+        Добавить вебхук. Доставка начинается с событий, произошедших после добавления.
+
+        Args:
+            request: Запрос с параметром url
+
+        Returns:
+            JsonResponse: Статус операции, идентификатор вебхука и ключ подписи X-Webhook-Signature
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        if 'url' not in request.data:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        serializer = WebhookSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse({'Status': False, 'Errors': serializer.errors})
+
+        last_seq = OrderEvent.objects.filter(user_id=request.user.id).order_by('-seq').values_list(
+            'seq', flat=True).first() or 0
+        webhook = serializer.save(user=request.user, secret=secrets.token_hex(32), last_seq=last_seq)
+        return JsonResponse({'Status': True, 'Webhook': webhook.id, 'Secret': webhook.secret})
+
+    # удалить вебхуки
+    def delete(self, request, *args, **kwargs):
+        """
+        Удалить вебхуки поставщика
+
+        Args:
+            request: Запрос с идентификаторами вебхуков
+
+        Returns:
+            JsonResponse: Сообщение о статусе операции
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        items_sting = request.data.get('items')
+        if items_sting:
+            items_list = [item for item in parse_ids(items_sting) if item.isdigit()]
+            if items_list:
+                deleted_count = Webhook.objects.filter(user_id=request.user.id, id__in=items_list).delete()[0]
+                return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
 class ContactView(APIView):
@@ -629,7 +1001,7 @@ class ContactView(APIView):
 
         items_sting = request.data.get('items')
         if items_sting:
-            items_list = items_sting.split(',')
+            items_list = parse_ids(items_sting)
             query = Q()
             objects_deleted = False
             for contact_id in items_list:
@@ -688,14 +1060,9 @@ class OrderView(APIView):
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        order = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(load_orders(order))
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
@@ -711,16 +1078,20 @@ class OrderView(APIView):
 
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
+                order_id = int(request.data['id'])
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'],
-                        state='new')
+                    with transaction.atomic():
+                        # при оформлении из корзины товары списываются со склада (change_order_state)
+                        changed, rejected = change_order_state(
+                            Order.objects.filter(user_id=request.user.id, id=order_id).values('id'), 'new',
+                            contact_id=request.data['contact'])
                 except IntegrityError as error:
                     print(error)
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
                 else:
-                    if is_updated:
+                    if order_id in rejected:
+                        return JsonResponse({'Status': False, **rejected[order_id]})
+                    if changed:
                         send_email.delay('status update', 'Order created',
                                          request.user.email)
                         return JsonResponse({'Status': True})
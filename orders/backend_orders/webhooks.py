@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .metrics import WEBHOOK_DELIVERIES, WEBHOOK_LATENCY
+from .models import OrderEvent, Webhook
+from .renderers import dumps
+
+# Доставка событий заказов поставщикам. Событие уже записано в OrderEvent для каждого поставщика,
+# у вебхука хранится курсор last_seq, поэтому за один проход на адрес уходит пачка всех новых
+# событий одним запросом. Запросы к разным адресам идут параллельно из пула потоков, у каждого
+# потока своя requests.Session с keep-alive, и пул живет между запусками задачи в процессе Celery.
+# С базой работает только вызывающий поток: потоки пула делают лишь HTTP-запросы.
+
+# сколько событий уходит в одном запросе
+WEBHOOK_BATCH_SIZE = 100
+
+# сколько проходов делает один запуск, пока у адресов остаются новые события
+MAX_ROUNDS = 10
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Возвращает сессию requests текущего потока пула.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'WEBHOOK_CONCURRENCY', 8),
+                                           thread_name_prefix='webhook')
+        return _executor
+
+
+def sign(secret, body):
+    """
+    Возвращает подпись тела запроса для заголовка X-Webhook-Signature.
+    """
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def post(url, body, signature):
+    """
+    Отправляет пачку событий. Выполняется в потоке пула.
+
+    :return: кортеж (HTTP-статус или None, длительность в секундах, текст ошибки)
+    """
+    started = time.perf_counter()
+    try:
+        response = get_session().post(url, data=body, timeout=getattr(settings, 'WEBHOOK_TIMEOUT', 5.0),
+                                      headers={'Content-Type': 'application/json', 'X-Webhook-Signature': signature})
+    except requests.RequestException as error:
+        return None, time.perf_counter() - started, str(error) or error.__class__.__name__
+    elapsed = time.perf_counter() - started
+    if not 200 <= response.status_code < 300:
+        return response.status_code, elapsed, f'HTTP {response.status_code}: {response.text[:200]}'
+    return response.status_code, elapsed, ''
+
+
+def backoff(failures):
+    """
+    Возвращает паузу перед следующей попыткой: экспоненциально растет с числом неудач подряд.
+    """
+    delay = getattr(settings, 'WEBHOOK_RETRY_DELAY', 5.0) * 2 ** (failures - 1)
+    return timedelta(seconds=min(delay, getattr(settings, 'WEBHOOK_MAX_RETRY_DELAY', 3600.0)))
+
+
+def claim(webhook, now):
+    """
+    Занимает адрес на время отправки, чтобы параллельные запуски не отправили одни события дважды.
+    """
+    lease = now + timedelta(seconds=getattr(settings, 'WEBHOOK_TIMEOUT', 5.0) * 2)
+    return Webhook.objects.filter(id=webhook.id).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now)).update(locked_until=lease)
+
+
+def dispatch():
+    """
+    Отправляет новые события всем активным вебхукам, у которых не назначена отложенная попытка.
+
+    :return: словарь с количеством доставленных пачек и событий, неудачных попыток, занятых
+        другим запуском адресов и временем ближайшей повторной попытки
+    """
+    result = {'delivered': 0, 'events': 0, 'failed': 0, 'busy': 0, 'retry_at': None}
+    for _ in range(MAX_ROUNDS):
+        now = timezone.now()
+        webhooks = Webhook.objects.filter(is_active=True).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+
+        batches = []
+        for webhook in webhooks:
+            events = [{'seq': seq, 'order': order_id, 'state': state} for seq, order_id, state in
+                      OrderEvent.objects.filter(user_id=webhook.user_id, seq__gt=webhook.last_seq).order_by(
+                          'seq').values_list('seq', 'order_id', 'state')[:WEBHOOK_BATCH_SIZE]]
+            if not events:
+                continue
+            if not claim(webhook, now):
+                result['busy'] += 1
+                continue
+            body = dumps({'events': events}).encode()
+            batches.append((webhook, events, get_executor().submit(post, webhook.url, body,
+                                                                   sign(webhook.secret, body))))
+        if not batches:
+            break
+
+        more = False
+        for webhook, events, future in batches:
+            status, elapsed, error = future.result()
+            WEBHOOK_LATENCY.observe(elapsed, webhook=str(webhook.id))
+            update = {'locked_until': None, 'last_status': status, 'last_latency_ms': round(elapsed * 1000, 1),
+                      'last_error': error}
+            if not error:
+                WEBHOOK_DELIVERIES.inc(result='delivered')
+                update.update(last_seq=events[-1]['seq'], failures=0, next_attempt_at=None)
+                result['delivered'] += 1
+                result['events'] += len(events)
+                more = more or len(events) == WEBHOOK_BATCH_SIZE
+            else:
+                WEBHOOK_DELIVERIES.inc(result='failed')
+                failures = webhook.failures + 1
+                retry_at = timezone.now() + backoff(failures)
+                update.update(failures=failures, next_attempt_at=retry_at)
+                if failures >= getattr(settings, 'WEBHOOK_MAX_FAILURES', 10):
+                    update['is_active'] = False
+                elif result['retry_at'] is None or retry_at < result['retry_at']:
+                    result['retry_at'] = retry_at
+                result['failed'] += 1
+            Webhook.objects.filter(id=webhook.id).update(**update)
+        if not more:
+            break
+    return result
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# импорт после инициализации Django: модуль использует модели
+from backend_orders.sse import sse_router  # noqa: E402
+
+# поток событий заказов (SSE) обслуживается в обход Django, остальные запросы - Django
+application = sse_router(django_application)
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend_orders.metrics.MetricsMiddleware',
+    'backend_orders.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend_orders.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'orders.urls'
@@ -77,14 +80,25 @@ WSGI_APPLICATION = 'orders.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Соединения с базой по умолчанию постоянные: живут DB_CONN_MAX_AGE секунд и проверяются перед
+# повторным использованием. При DB_POOL=1 (рекомендуется для ASGI) соединения берутся из пула процесса
+# размером DB_POOL_SIZE и возвращаются в него в конце каждого запроса.
+DB_POOL = os.getenv('DB_POOL', '0') == '1'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'backend_orders.postgresql_pool' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': 'orders_api',
         'USER': os.getenv('USER_DB'),
         'PASSWORD': os.getenv('PASSWORD_DB'),
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
     }
 }
 
@@ -128,6 +142,56 @@ AUTH_USER_MODEL = 'backend_orders.User'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
+REST_FRAMEWORK = {
+    # JSON формируется и разбирается через ujson; формат ответа совпадает со стандартным JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend_orders.renderers.UJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'backend_orders.renderers.UJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Каталог для файлов выгрузки прайсов
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', BASE_DIR / 'exports')
+
+# Профилирование запросов: включается переменной окружения, доля профилируемых запросов - от 0 до 1
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.1'))
+# Каталог для дампов cProfile, запрошенных заголовком X-Profile: 1
+PROFILING_DUMP_DIR = os.getenv('PROFILING_DUMP_DIR', BASE_DIR / 'profiles')
+
+# Метрики Prometheus: каталог для объединения значений процессов gunicorn и Celery (без него -
+# только текущий процесс), период сохранения в секундах и токен для /metrics (без него метрики
+# доступны только персоналу)
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1.0'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Время жизни закэшированных страниц каталога в секундах (кэш сбрасывается и при изменении прайса)
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '60'))
+
+# События заказов: период проверки новых событий для long-poll и SSE и период пинга SSE, в секундах
+ORDER_EVENTS_POLL_INTERVAL = float(os.getenv('ORDER_EVENTS_POLL_INTERVAL', '1.0'))
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '15.0'))
+
+# Вебхуки поставщиков: таймаут запроса, число параллельных отправок, первая пауза перед повтором
+# (дальше удваивается до WEBHOOK_MAX_RETRY_DELAY) и число неудач подряд, после которого вебхук отключается
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '5.0'))
+WEBHOOK_CONCURRENCY = int(os.getenv('WEBHOOK_CONCURRENCY', '8'))
+WEBHOOK_RETRY_DELAY = float(os.getenv('WEBHOOK_RETRY_DELAY', '5.0'))
+WEBHOOK_MAX_RETRY_DELAY = float(os.getenv('WEBHOOK_MAX_RETRY_DELAY', '3600.0'))
+WEBHOOK_MAX_FAILURES = int(os.getenv('WEBHOOK_MAX_FAILURES', '10'))
+
+# Сжатие ответов: br (при установленном пакете brotli) или gzip по заголовку Accept-Encoding,
+# минимальный размер сжимаемого ответа в байтах и уровни сжатия
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
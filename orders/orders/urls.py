@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from backend_orders.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/v1/', include('backend_orders.urls', namespace='backend_orders'))
+    path('api/v1/', include('backend_orders.urls', namespace='backend_orders')),
+    path('metrics', metrics_view, name='metrics'),
 ]